@@ -0,0 +1,278 @@
+"""Cold-tier archival of old transactions.
+
+Usage:
+    python archive.py run [--months 24] [--user USER_ID]
+    python archive.py status --user USER_ID
+
+Transactions older than the cutoff (the first of the month, --months or
+ARCHIVE_AFTER_MONTHS back) move out of the transactions table into
+zstd-compressed Parquet files under ARCHIVE_DIR, one file per user and
+month (user_<id>/<YYYY-MM>.parquet), and a summary row per user and month
+is kept in transaction_archive_months. Each month is archived in its own
+transaction: the file is written first and the rows deleted after, so a
+failed run leaves at most rows that exist in both places. Reads of the
+archive (iter_archived_batches, and so lists, totals and exports) skip
+rows still in the table, and the next run merges them. Archived rows are
+read-only.
+"""
+import os
+import sys
+import json
+import argparse
+import logging
+from decimal import Decimal
+from datetime import datetime, timedelta
+from psycopg2.extras import Json
+from database import connection, cursor, shard_cursor, for_each_shard, invalidate_transactions
+from exporter import parquet_schema, select_list, to_record_batch
+from metrics import instrument_query
+from money import DECIMAL_PRECISION, cents_from_arrow, format_money
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+DEFAULT_ARCHIVE_AFTER_MONTHS = int(os.environ.get('ARCHIVE_AFTER_MONTHS', 24))
+BATCH_ROWS = 10000
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def archive_cutoff(months=DEFAULT_ARCHIVE_AFTER_MONTHS, today=None):
+    """First day of the month `months` before today; older transactions are archived"""
+    today = today or datetime.now()
+    return _add_months(datetime(today.year, today.month, 1), -months)
+
+def _month_path(user_id, month):
+    return os.path.join(ARCHIVE_DIR, f"user_{user_id}", f"{month:%Y-%m}.parquet")
+
+def _summary(table):
+    """Count and int cents totals for transaction_archive_months"""
+    import pyarrow.compute as pc
+
+    cents = cents_from_arrow(table['amount'])
+    totals = table.append_column('amount_cents', cents).group_by('category').aggregate([('amount_cents', 'sum')])
+    return {
+        'count': table.num_rows,
+        'total': pc.sum(cents).as_py() or 0,
+        'max': pc.max(cents).as_py(),
+        'categories': dict(zip(
+            [category or '' for category in totals['category'].to_pylist()],
+            totals['amount_cents_sum'].to_pylist()
+        )),
+    }
+
+def _archive_month(user_id, month):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    path = _month_path(user_id, month)
+    with connection(user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT {select_list('amount_cents')} FROM transactions
+                WHERE user_id = %s AND date >= %s AND date < %s
+                ORDER BY date DESC, id DESC
+                FOR UPDATE
+            """, (user_id, month, _add_months(month, 1)))
+            rows = cur.fetchall()
+            if not rows:
+                return 0
+
+            table = pa.Table.from_batches([to_record_batch(rows)])
+            if os.path.exists(path):
+                # Merge with rows archived earlier for the month; the database copy wins
+                existing = pq.read_table(path, schema=table.schema)
+                existing = existing.filter(pc.invert(pc.is_in(existing['id'], value_set=table['id'])))
+                table = pa.concat_tables([table, existing]).sort_by([('date', 'descending'), ('id', 'descending')])
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            pq.write_table(table, tmp_path, compression='zstd')
+            os.replace(tmp_path, path)
+
+            summary = _summary(table)
+            cur.execute("""
+                INSERT INTO transaction_archive_months
+                    (user_id, month, transaction_count, total_cents, max_cents, category_totals, file_path, archived_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id, month) DO UPDATE SET
+                    transaction_count = EXCLUDED.transaction_count,
+                    total_cents = EXCLUDED.total_cents,
+                    max_cents = EXCLUDED.max_cents,
+                    category_totals = EXCLUDED.category_totals,
+                    file_path = EXCLUDED.file_path,
+                    archived_at = CURRENT_TIMESTAMP
+            """, (user_id, month, summary['count'], summary['total'], summary['max'],
+                  Json(summary['categories']), path))
+            cur.execute(
+                "DELETE FROM transactions WHERE user_id = %s AND id = ANY(%s)",
+                (user_id, [row[0] for row in rows])
+            )
+    return len(rows)
+
+@instrument_query("archive_user")
+def archive_user(user_id, cutoff):
+    """Move the user's transactions dated before cutoff (a month start) to the archive"""
+    with cursor(user_id) as cur:
+        cur.execute("""
+            SELECT DISTINCT date_trunc('month', date) FROM transactions
+            WHERE user_id = %s AND date < %s
+            ORDER BY 1
+        """, (user_id, cutoff))
+        months = [row[0] for row in cur.fetchall()]
+
+    archived = sum(_archive_month(user_id, month) for month in months)
+    if archived:
+        invalidate_transactions(user_id)
+        logger.info(f"Archived {archived} transactions in {len(months)} month(s) for user {user_id}")
+    return archived
+
+def _users_before(shard, cutoff):
+    with shard_cursor(shard) as cur:
+        cur.execute("""
+            SELECT DISTINCT user_id FROM transactions
+            WHERE date < %s AND user_id NOT IN (SELECT user_id FROM moved_users)
+        """, (cutoff,))
+        return [row[0] for row in cur.fetchall()]
+
+def archive_all(cutoff, user_ids=None):
+    if user_ids is None:
+        found = for_each_shard(lambda shard: _users_before(shard, cutoff))
+        user_ids = sorted({user_id for users in found.values() for user_id in users})
+    return {user_id: archive_user(user_id, cutoff) for user_id in user_ids}
+
+@instrument_query("archive_horizon")
+def archive_horizon(user_id):
+    """End of the newest archived month for the user, or None if nothing is archived"""
+    with cursor(user_id, readonly=True) as cur:
+        cur.execute("SELECT max(month) FROM transaction_archive_months WHERE user_id = %s", (user_id,))
+        newest = cur.fetchone()[0]
+    return _add_months(newest, 1) if newest else None
+
+def reaches_archive(user_id, date_range):
+    horizon = archive_horizon(user_id)
+    return horizon is not None and datetime.combine(date_range[0], datetime.min.time()) < horizon
+
+def _decimal_scalar(cents):
+    import pyarrow as pa
+
+    return pa.scalar(Decimal(cents).scaleb(-2), pa.decimal128(DECIMAL_PRECISION, 2))
+
+def _filter_expression(date_range, categories, min_cents, max_cents, after=None, live_ids=()):
+    """The archive equivalent of components.transactions._filter_clause; live_ids are left out"""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    start = datetime.combine(date_range[0], datetime.min.time())
+    end = datetime.combine(date_range[-1], datetime.min.time())
+    date = ds.field('date')
+    # Decimal bounds compare exactly against the decimal amount column
+    amount = ds.field('amount')
+    expression = (
+        (date >= pa.scalar(start, pa.timestamp('us')))
+        & (date < pa.scalar(end + timedelta(days=1), pa.timestamp('us')))
+        & (amount >= _decimal_scalar(min_cents)) & (amount <= _decimal_scalar(max_cents))
+    )
+    if categories:
+        expression &= ds.field('category').isin(list(categories))
+    if after is not None:
+        after_date = pa.scalar(after[0], pa.timestamp('us'))
+        expression &= (date < after_date) | ((date == after_date) & (ds.field('id') < after[1]))
+    if live_ids:
+        expression &= ~ds.field('id').isin(list(live_ids))
+    return expression
+
+def iter_archived_batches(user_id, date_range, categories, min_cents, max_cents, after=None, batch_rows=BATCH_ROWS):
+    """Archived rows matching the list filters as record batches, newest first.
+
+    Rows that are also still in the transactions table (left by a failed
+    run) are skipped, so the batches can be added to live rows as they are.
+    """
+    import pyarrow.dataset as ds
+
+    start = datetime.combine(date_range[0], datetime.min.time())
+    end = datetime.combine(date_range[-1], datetime.min.time()) + timedelta(days=1)
+    with cursor(user_id, readonly=True) as cur:
+        cur.execute("""
+            SELECT file_path FROM transaction_archive_months
+            WHERE user_id = %s AND month < %s AND month >= date_trunc('month', %s::timestamp)
+            ORDER BY month DESC
+        """, (user_id, end, start))
+        paths = [row[0] for row in cur.fetchall()]
+        if not paths:
+            return
+        # Few rows: leftovers and transactions added later with a date in an archived month
+        cur.execute("""
+            SELECT id FROM transactions
+            WHERE user_id = %s AND date >= %s AND date < %s
+              AND date_trunc('month', date) IN (SELECT month FROM transaction_archive_months WHERE user_id = %s)
+        """, (user_id, start, end, user_id))
+        live_ids = [row[0] for row in cur.fetchall()]
+
+    expression = _filter_expression(date_range, categories, min_cents, max_cents, after, live_ids)
+    schema = parquet_schema()
+    # Files are written newest first and read one month at a time, so batches stay ordered
+    for path in paths:
+        dataset = ds.dataset(path, format='parquet', schema=schema)
+        for batch in dataset.to_batches(filter=expression, batch_size=batch_rows):
+            if batch.num_rows:
+                yield batch
+
+@instrument_query("read_archive")
+def read_archive(user_id, date_range, categories, min_cents, max_cents, after=None, limit=None):
+    """Archived rows matching the filters as dicts with amount_cents, newest first, at most limit of them"""
+    rows = []
+    for batch in iter_archived_batches(user_id, date_range, categories, min_cents, max_cents, after):
+        index = batch.schema.get_field_index('amount')
+        batch = batch.set_column(index, 'amount_cents', cents_from_arrow(batch.column(index)))
+        rows.extend(batch.to_pylist())
+        if limit is not None and len(rows) >= limit:
+            return rows[:limit]
+    return rows
+
+def archived_totals(user_id, date_range, categories, min_cents, max_cents):
+    """(count, total int cents) over archived rows matching the filters"""
+    import pyarrow.compute as pc
+
+    count, total = 0, 0
+    for batch in iter_archived_batches(user_id, date_range, categories, min_cents, max_cents):
+        count += batch.num_rows
+        total += pc.sum(cents_from_arrow(batch.column('amount'))).as_py() or 0
+    return count, total
+
+def merge_pages(live, archived, limit=None):
+    """Merge two newest-first row lists by (date, id); a live row replaces an archived copy"""
+    live_ids = {row['id'] for row in live}
+    merged = live + [row for row in archived if row['id'] not in live_ids]
+    merged.sort(key=lambda row: (row['date'], row['id']), reverse=True)
+    return merged[:limit] if limit is not None else merged
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old transactions to Parquet")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help="archive transactions older than the cutoff")
+    run.add_argument('--months', type=int, default=DEFAULT_ARCHIVE_AFTER_MONTHS)
+    run.add_argument('--user', type=int, action='append', help="only archive this user (repeatable)")
+    status = subparsers.add_parser('status', help="show a user's archived months")
+    status.add_argument('--user', type=int, required=True)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'run':
+        cutoff = archive_cutoff(args.months)
+        result = archive_all(cutoff, args.user)
+        print(f"Archived {sum(result.values())} transactions for {len(result)} user(s) before {cutoff:%Y-%m-%d}")
+    else:
+        with cursor(args.user) as cur:
+            cur.execute("""
+                SELECT month, transaction_count, total_cents, category_totals
+                FROM transaction_archive_months WHERE user_id = %s ORDER BY month
+            """, (args.user,))
+            for month, count, total, categories in cur.fetchall():
+                print(f"{month:%Y-%m}  {count:8d}  {format_money(total):>16}  {json.dumps(categories)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
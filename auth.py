@@ -1,83 +1,51 @@
-import os
 import streamlit as st
-from database import get_db_connection
-import requests
+from database import invalidate_transactions, seed_default_categories
+from unit_of_work import unit_of_work
 import json
 from datetime import datetime, timedelta
-import urllib3
 import logging
+from metrics import instrument_query
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logger = logging.getLogger(__name__)
 
-def initialize_mock_data(user_id):
-    """Initialize sample data for the mock user"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
+@instrument_query("initialize_mock_data")
+def initialize_mock_data(user_id, uow=None):
+    """Initialize sample data for the mock user; with uow the rows are queued on it"""
     try:
-        # Initialize default categories
-        default_categories = [
-            ('Food', '🍽️', '#FF6B6B'),
-            ('Transport', '🚗', '#4ECDC4'),
-            ('Entertainment', '🎮', '#45B7D1'),
-            ('Shopping', '🛍️', '#96CEB4'),
-            ('Bills', '📄', '#FFEEAD'),
-            ('Other', '📌', '#D4D4D4')
-        ]
-        
-        for cat in default_categories:
-            cur.execute("""
-                INSERT INTO transaction_categories (user_id, name, icon, color)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (user_id, name) DO NOTHING
-            """, (user_id, cat[0], cat[1], cat[2]))
-        
-        # Add sample transactions
-        sample_transactions = [
-            (75.50, 'Food', 'Grocery shopping', datetime.now() - timedelta(days=5)),
-            (45.00, 'Transport', 'Uber ride', datetime.now() - timedelta(days=3)),
-            (120.00, 'Entertainment', 'Movie night', datetime.now() - timedelta(days=2)),
-            (250.00, 'Shopping', 'New clothes', datetime.now() - timedelta(days=1)),
-            (100.00, 'Bills', 'Electricity bill', datetime.now())
-        ]
-        
-        for trans in sample_transactions:
-            cur.execute("""
-                INSERT INTO transactions (user_id, amount, category, description, date)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (user_id, trans[0], trans[1], trans[2], trans[3]))
-        
-        # Add sample budget
-        sample_budgets = [
-            ('Food', 500.00, 'Monthly'),
-            ('Transport', 200.00, 'Monthly'),
-            ('Entertainment', 300.00, 'Monthly'),
-            ('Shopping', 400.00, 'Monthly'),
-            ('Bills', 600.00, 'Monthly')
-        ]
-        
-        for budget in sample_budgets:
-            # First check if budget exists
-            cur.execute('''
-                SELECT id FROM budgets 
-                WHERE user_id = %s AND category = %s AND period = %s
-            ''', (user_id, budget[0], budget[2]))
-            
-            if not cur.fetchone():
-                cur.execute('''
-                    INSERT INTO budgets (user_id, category, amount, period)
-                    VALUES (%s, %s, %s, %s)
-                ''', (user_id, budget[0], budget[1], budget[2]))
-        
-        conn.commit()
+        with unit_of_work(user_id, uow, "initialize_mock_data") as uow:
+            # Initialize default categories
+            seed_default_categories(user_id, uow)
+
+            # Add sample transactions
+            sample_transactions = [
+                (7550, 'Food', 'Grocery shopping', datetime.now() - timedelta(days=5)),
+                (4500, 'Transport', 'Uber ride', datetime.now() - timedelta(days=3)),
+                (12000, 'Entertainment', 'Movie night', datetime.now() - timedelta(days=2)),
+                (25000, 'Shopping', 'New clothes', datetime.now() - timedelta(days=1)),
+                (10000, 'Bills', 'Electricity bill', datetime.now())
+            ]
+            uow.insert(
+                'transactions', ('user_id', 'amount_cents', 'category', 'description', 'date'),
+                [(user_id,) + trans for trans in sample_transactions]
+            )
+
+            # Add sample budgets, keeping any the user already set
+            sample_budgets = [
+                ('Food', 50000, 'Monthly'),
+                ('Transport', 20000, 'Monthly'),
+                ('Entertainment', 30000, 'Monthly'),
+                ('Shopping', 40000, 'Monthly'),
+                ('Bills', 60000, 'Monthly')
+            ]
+            uow.insert(
+                'budgets', ('user_id', 'category', 'amount_cents', 'period'),
+                [(user_id,) + budget for budget in sample_budgets],
+                conflict=('user_id', 'category', 'period')
+            )
+            uow.after_commit(invalidate_transactions, user_id)
     except Exception as e:
-        conn.rollback()
         logger.error(f"Failed to initialize mock data: {str(e)}")
         st.error("Failed to initialize mock data")
-    finally:
-        cur.close()
-        conn.close()
 
 def log_oauth_error(error_type, error_message):
     """Log OAuth errors for debugging"""
@@ -0,0 +1,231 @@
+import time
+import queue
+import random
+import threading
+import logging
+from abc import ABC, abstractmethod
+from datetime import datetime
+from psycopg2.extras import execute_values
+from database import connection, invalidate_transactions
+from categorization import get_engine
+from metrics import instrument_query
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 500
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+# First key of the two-key advisory lock taken while a user's payments are merged
+SYNC_LOCK_KEY = 7203412
+
+class BankPayment:
+    def __init__(self, reference, amount_minor, description, created_at):
+        self.reference = reference
+        self.amount_minor = amount_minor
+        self.description = description
+        self.created_at = created_at
+
+class BankClient(ABC):
+    """Interface the sync engine needs from a bank API"""
+
+    @abstractmethod
+    def list_payments(self, created_after=None, cursor=None, limit=PAGE_SIZE):
+        """Return ([BankPayment], next cursor or None) for one page, oldest filter first"""
+
+class GoCardlessBankClient(BankClient):
+    def __init__(self, access_token, environment='live', base_url=None):
+        import gocardless_pro
+
+        options = {'access_token': access_token, 'environment': environment}
+        if base_url:
+            options['base_url'] = base_url
+        self._client = gocardless_pro.Client(**options)
+
+    def list_payments(self, created_after=None, cursor=None, limit=PAGE_SIZE):
+        params = {'limit': limit}
+        if cursor:
+            params['after'] = cursor
+        if created_after:
+            params['created_at[gt]'] = created_after.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        response = self._client.payments.list(params=params)
+        payments = [
+            BankPayment(
+                reference=payment.id,
+                amount_minor=int(payment.amount),
+                description=payment.description or "Bank Transaction",
+                created_at=datetime.strptime(payment.created_at[:19], '%Y-%m-%dT%H:%M:%S')
+            )
+            for payment in response.records
+        ]
+        return payments, response.after
+
+class FakeBankClient(BankClient):
+    """In-memory bank API for local runs and tests; fail_times makes the next calls raise"""
+
+    def __init__(self, payments=None, fail_times=0):
+        self.payments = sorted(payments or [], key=lambda p: (p.created_at, p.reference))
+        self.fail_times = fail_times
+        self.calls = 0
+
+    def list_payments(self, created_after=None, cursor=None, limit=PAGE_SIZE):
+        self.calls += 1
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise ConnectionError("Fake bank API unavailable")
+        matching = [p for p in self.payments if created_after is None or p.created_at > created_after]
+        start = int(cursor) if cursor else 0
+        page = matching[start:start + limit]
+        next_cursor = str(start + limit) if start + limit < len(matching) else None
+        return page, next_cursor
+
+def _load_high_water_mark(cur, user_id):
+    cur.execute("SELECT high_water_mark FROM bank_sync_state WHERE user_id = %s", (user_id,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def set_sync_status(user_id, status, error=None, high_water_mark=None):
+    with connection(user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO bank_sync_state (user_id, status, last_error, high_water_mark, last_synced_at, updated_at)
+                VALUES (%s, %s, %s, %s, CASE WHEN %s = 'ok' THEN CURRENT_TIMESTAMP END, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    status = EXCLUDED.status,
+                    last_error = EXCLUDED.last_error,
+                    high_water_mark = COALESCE(EXCLUDED.high_water_mark, bank_sync_state.high_water_mark),
+                    last_synced_at = COALESCE(EXCLUDED.last_synced_at, bank_sync_state.last_synced_at),
+                    updated_at = CURRENT_TIMESTAMP
+            """, (user_id, status, error, high_water_mark, status))
+
+def get_sync_status(user_id):
+    with connection(user_id, readonly=True) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT status, last_error, last_synced_at, high_water_mark
+                FROM bank_sync_state WHERE user_id = %s
+            """, (user_id,))
+            row = cur.fetchone()
+    if not row:
+        return None
+    return dict(zip(['status', 'last_error', 'last_synced_at', 'high_water_mark'], row))
+
+def upsert_payments(cur, user_id, payments, engine):
+    """Insert payments whose bank_reference the user does not have yet; returns rows inserted"""
+    unique = {p.reference: p for p in payments}
+    payments = list(unique.values())
+    categories = engine.categorize_many(
+        [p.description for p in payments],
+        [p.amount_minor for p in payments]
+    )
+    # The bank reports minor units, which is what amount_cents stores
+    rows = [
+        (user_id, p.amount_minor, category, p.description, p.created_at, p.reference)
+        for p, category in zip(payments, categories)
+    ]
+    # Serialises concurrent syncs of one user so the existence check cannot race
+    cur.execute("SELECT pg_advisory_xact_lock(%s, %s)", (SYNC_LOCK_KEY, user_id))
+    execute_values(cur, """
+        INSERT INTO transactions (user_id, amount_cents, category, description, date, bank_reference)
+        SELECT v.user_id, v.amount_cents, v.category, v.description, v.date, v.bank_reference
+        FROM (VALUES %s) AS v(user_id, amount_cents, category, description, date, bank_reference)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM transactions t
+            WHERE t.user_id = v.user_id AND t.bank_reference = v.bank_reference
+        )
+    """, rows, template="(%s::integer, %s::bigint, %s, %s, %s::timestamp, %s)", page_size=len(rows) or 1)
+    return cur.rowcount
+
+class SyncEngine:
+    """Walks every page of payments newer than the user's high-water mark and batch-upserts them"""
+
+    def __init__(self, client, page_size=PAGE_SIZE):
+        self.client = client
+        self.page_size = page_size
+
+    @instrument_query("bank_sync_user")
+    def sync_user(self, user_id):
+        engine = get_engine(user_id)
+        with connection(user_id) as conn:
+            with conn.cursor() as cur:
+                high_water_mark = _load_high_water_mark(cur, user_id)
+
+        newest = high_water_mark
+        cursor = None
+        inserted = 0
+        while True:
+            payments, cursor = self.client.list_payments(
+                created_after=high_water_mark, cursor=cursor, limit=self.page_size
+            )
+            if payments:
+                # Each page commits on its own; a retry skips what is already stored
+                with connection(user_id) as conn:
+                    with conn.cursor() as cur:
+                        inserted += upsert_payments(cur, user_id, payments, engine)
+                page_newest = max(p.created_at for p in payments)
+                newest = page_newest if newest is None else max(newest, page_newest)
+            if not cursor:
+                break
+
+        # The mark only advances once every page has been stored
+        set_sync_status(user_id, 'ok', high_water_mark=newest)
+        if inserted:
+            invalidate_transactions(user_id)
+        logger.info(f"Bank sync for user {user_id} inserted {inserted} transactions")
+        return inserted
+
+class SyncWorker:
+    """Background thread that runs queued user syncs with retry and exponential backoff"""
+
+    def __init__(self, client_factory, max_attempts=MAX_ATTEMPTS, backoff_base=BACKOFF_BASE):
+        self._client_factory = client_factory
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="bank-sync-worker", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, user_id):
+        """Queue a sync for user_id; returns False if one is already pending"""
+        with self._lock:
+            if user_id in self._pending:
+                return False
+            self._pending.add(user_id)
+        try:
+            set_sync_status(user_id, 'queued')
+        except Exception:
+            # Nothing was queued, so a later request must not be dropped as a duplicate
+            with self._lock:
+                self._pending.discard(user_id)
+            raise
+        self._queue.put(user_id)
+        return True
+
+    def _run(self):
+        while True:
+            user_id = self._queue.get()
+            try:
+                self._sync_with_retry(user_id)
+            finally:
+                with self._lock:
+                    self._pending.discard(user_id)
+                self._queue.task_done()
+
+    def _sync_with_retry(self, user_id):
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                set_sync_status(user_id, 'running')
+                SyncEngine(self._client_factory()).sync_user(user_id)
+                return
+            except Exception as e:
+                logger.warning(f"Bank sync for user {user_id} failed (attempt {attempt}/{self.max_attempts}): {str(e)}")
+                if attempt == self.max_attempts:
+                    try:
+                        set_sync_status(user_id, 'error', error=str(e))
+                    except Exception as status_error:
+                        logger.error(f"Failed to record bank sync error: {str(status_error)}")
+                    return
+                delay = min(BACKOFF_MAX, self.backoff_base ** attempt) * random.uniform(0.5, 1.0)
+                time.sleep(delay)
@@ -1,6 +1,7 @@
+import os
 import gocardless_pro
 import streamlit as st
-from database import save_transaction
+from bank_sync import SyncWorker, GoCardlessBankClient
 
 def setup_gocardless():
     client = gocardless_pro.Client(
@@ -33,25 +34,18 @@ def setup_gocardless():
     except Exception as e:
         st.error(f"Failed to setup bank connection: {str(e)}")
 
+@st.cache_resource
+def get_sync_worker():
+    """One background sync worker per process; credentials are read here, in the script thread"""
+    access_token = st.secrets["GOCARDLESS_ACCESS_TOKEN"]
+    base_url = os.environ.get('GOCARDLESS_BASE_URL')
+    return SyncWorker(lambda: GoCardlessBankClient(access_token, environment='live', base_url=base_url))
+
 def sync_transactions(user_id):
-    client = gocardless_pro.Client(
-        access_token=st.secrets["GOCARDLESS_ACCESS_TOKEN"],
-        environment='live'
-    )
-    
+    """Queue an incremental sync of the user's bank payments; progress is in bank_sync.get_sync_status"""
     try:
-        # Get transactions from GoCardless
-        transactions = client.payments.list().records
-        
-        for transaction in transactions:
-            save_transaction(
-                user_id=user_id,
-                amount=float(transaction.amount) / 100,  # Convert pence to pounds
-                category="Uncategorized",
-                description=transaction.description or "Bank Transaction",
-                bank_reference=transaction.id
-            )
-            
+        if not get_sync_worker().enqueue(user_id):
+            st.info("A bank sync is already in progress")
         return True
     except Exception as e:
         st.error(f"Failed to sync transactions: {str(e)}")
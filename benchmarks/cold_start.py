@@ -0,0 +1,112 @@
+"""Cold-start benchmark: fresh interpreter to first rendered landing page.
+
+Usage:
+    python -m benchmarks.cold_start --budget-ms 2500 --runs 5
+    python -m benchmarks.cold_start --use-env --top 20
+
+Each run starts a new `python -X importtime` process that renders main.py's
+landing page with Streamlit's AppTest against a migrated database, so the
+time covers interpreter start, imports and the first script run. Prints the
+median and the slowest top-level imports, and exits with status 1 if the
+median exceeds --budget-ms or the landing page imported a page-only module.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import nullcontext
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.pg_fixture import local_postgres
+
+# Modules only the logged-in pages need; the landing page must not import them
+PAGE_ONLY_MODULES = (
+    'pandas', 'plotly.express', 'visualization',
+    'components.dashboard', 'components.transactions', 'components.budget',
+    'csv_import', 'report_dispatch', 'budget_engine',
+)
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+def child():
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    before = set(sys.modules)
+    render_start = time.perf_counter()
+    app = AppTest.from_file(os.path.join(ROOT, 'main.py'), default_timeout=60).run()
+    finished = time.perf_counter()
+    print(json.dumps({
+        'total_s': finished - started,
+        'render_s': finished - render_start,
+        'exception': [str(e.value) for e in app.exception],
+        'page_only_imported': sorted(m for m in PAGE_ONLY_MODULES if m in sys.modules and m not in before),
+    }))
+
+def parse_importtime(stderr):
+    """{top-level module: cumulative seconds} from `python -X importtime` output"""
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and not match.group(3):
+            modules[match.group(4)] = int(match.group(2)) / 1e6
+    return modules
+
+def run_once():
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-m', 'benchmarks.cold_start', '--child'],
+        cwd=ROOT, capture_output=True, text=True, timeout=300
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Cold-start child failed:\n{process.stderr[-2000:]}")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(process.stderr)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FinanceTrackPro cold-start benchmark")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--budget-ms', type=float, default=2500.0, help="maximum median time to first landing render")
+    parser.add_argument('--top', type=int, default=15, help="number of slowest top-level imports to print")
+    parser.add_argument('--use-env', action='store_true', help="use the database in the PG* environment")
+    args = parser.parse_args(argv)
+    if args.child:
+        child()
+        return 0
+
+    with (nullcontext(None) if args.use_env else local_postgres()) as env:
+        if env:
+            os.environ.update(env)
+        # The first run applies migrations; it is not a cold start of a deployed replica
+        run_once()
+        runs = [run_once() for _ in range(args.runs)]
+
+    failures = []
+    for result in runs:
+        failures.extend(result['exception'])
+    total = statistics.median(r['total_s'] for r in runs)
+    render = statistics.median(r['render_s'] for r in runs)
+    print(f"Cold start to landing page: {total * 1000:.0f} ms median ({render * 1000:.0f} ms in the first script run)")
+
+    imports = runs[-1]['imports']
+    print("Slowest top-level imports (cumulative):")
+    for name, seconds in sorted(imports.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:40s} {seconds * 1000:8.1f} ms")
+
+    page_only = sorted({m for r in runs for m in r['page_only_imported']})
+    if page_only:
+        failures.append(f"landing page imported page-only modules: {', '.join(page_only)}")
+    if total * 1000 > args.budget_ms:
+        failures.append(f"median cold start {total * 1000:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import io
+import random
+from datetime import datetime, timedelta
+
+# Merchants per default category; descriptions are drawn from these so categorization has real work
+MERCHANTS = {
+    'Food': ['Tesco grocery', 'Corner cafe', 'Pizza restaurant', 'Sainsbury food shop', 'Sushi bar'],
+    'Transport': ['Uber ride', 'TfL bus fare', 'Train ticket', 'City taxi', 'Shell fuel'],
+    'Entertainment': ['Cinema tickets', 'Netflix', 'Concert hall', 'Movie rental', 'Theater show'],
+    'Shopping': ['Amazon order', 'Retail park store', 'Online shop', 'Bookstore', 'Electronics store'],
+    'Bills': ['Electricity bill', 'Water utility', 'Internet provider', 'Gas supplier', 'Phone plan'],
+    'Other': ['Cash withdrawal', 'Charity donation', 'Bank fee', 'Gift', 'Misc payment'],
+}
+# Typical amount range per category, in currency units
+AMOUNT_RANGES = {
+    'Food': (3, 120),
+    'Transport': (2, 80),
+    'Entertainment': (5, 150),
+    'Shopping': (5, 600),
+    'Bills': (20, 300),
+    'Other': (1, 500),
+}
+TAGS = ['Essential', 'One-time', 'Subscription', 'Investment']
+HISTORY_DAYS = 3 * 365
+COPY_BATCH_ROWS = 50000
+NULL = '\\N'  # COPY text-format NULL marker
+
+def _pg_array(items):
+    return '{' + ','.join(f'"{item}"' for item in items) + '}' if items else ''
+
+def generate_transactions(user_id, count, seed=0, now=None):
+    """Yield deterministic (user_id, amount, category, description, date, tags) tuples"""
+    rng = random.Random(f"{seed}:{user_id}")
+    now = now or datetime(2024, 12, 31, 12, 0, 0)
+    categories = list(MERCHANTS)
+    weights = [30, 20, 10, 20, 10, 10]
+    for _ in range(count):
+        category = rng.choices(categories, weights)[0]
+        low, high = AMOUNT_RANGES[category]
+        amount = round(rng.uniform(low, high), 2)
+        description = rng.choice(MERCHANTS[category])
+        date = now - timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))
+        tags = rng.sample(TAGS, rng.choice([0, 0, 0, 1, 1, 2]))
+        yield (user_id, amount, category, description, date, tags)
+
+def generate_csv(count, seed=0):
+    """A CSV upload in the format accepted by the transaction importer"""
+    buffer = io.StringIO()
+    buffer.write("date,amount,description,tags\n")
+    for _, amount, _, description, date, tags in generate_transactions(0, count, seed):
+        buffer.write(f"{date:%Y-%m-%d},{amount:.2f},{description},\"{','.join(tags)}\"\n")
+    return buffer.getvalue().encode('utf-8')
+
+def _copy_rows(cur, rows):
+    buffer = io.StringIO()
+    for user_id, amount, category, description, date, tags in rows:
+        buffer.write(f"{user_id}\t{round(amount * 100)}\t{category}\t{description}\t{date:%Y-%m-%d %H:%M:%S}\t{_pg_array(tags) or NULL}\n")
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY transactions (user_id, amount_cents, category, description, date, tags) FROM STDIN",
+        buffer
+    )
+
+def seed_database(conn, users, transactions_per_user, seed=0, first_user_id=1):
+    """Create users with default categories, monthly budgets and generated transactions"""
+    from database import DEFAULT_CATEGORIES
+
+    with conn.cursor() as cur:
+        for user_id in range(first_user_id, first_user_id + users):
+            cur.execute(
+                "INSERT INTO users (id, email) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING",
+                (user_id, f"bench{user_id}@example.com")
+            )
+            for name, icon, color in DEFAULT_CATEGORIES:
+                cur.execute("""
+                    INSERT INTO transaction_categories (user_id, name, icon, color)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (user_id, name) DO NOTHING
+                """, (user_id, name, icon, color))
+                cur.execute("""
+                    INSERT INTO budgets (user_id, category, amount_cents, period)
+                    VALUES (%s, %s, %s, 'Monthly')
+                    ON CONFLICT (user_id, category, period) DO NOTHING
+                """, (user_id, name, AMOUNT_RANGES[name][1] * 10 * 100))
+
+            batch = []
+            for row in generate_transactions(user_id, transactions_per_user, seed):
+                batch.append(row)
+                if len(batch) >= COPY_BATCH_ROWS:
+                    _copy_rows(cur, batch)
+                    batch = []
+            if batch:
+                _copy_rows(cur, batch)
+        cur.execute("SELECT setval('users_id_seq', (SELECT max(id) FROM users))")
+        cur.execute("ANALYZE")
+    conn.commit()
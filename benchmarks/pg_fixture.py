@@ -0,0 +1,65 @@
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+def _pg_binary(name):
+    pg_bin = os.environ.get('PG_BIN')
+    path = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+    if not path or not os.path.exists(path):
+        raise RuntimeError(f"'{name}' not found; put the PostgreSQL binaries on PATH or set PG_BIN")
+    return path
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def local_postgres(database='financetrack_bench'):
+    """Start a throwaway PostgreSQL cluster in a temp directory and yield its PG* environment.
+
+    The cluster uses trust authentication on 127.0.0.1 and is removed on exit.
+    PostgreSQL refuses to run as root, so run benchmarks as a regular user.
+    """
+    data_dir = tempfile.mkdtemp(prefix='ftp-bench-pg-')
+    port = _free_port()
+    env = {
+        'PGHOST': '127.0.0.1',
+        'PGPORT': str(port),
+        'PGUSER': 'postgres',
+        'PGPASSWORD': 'postgres',
+        'PGDATABASE': database,
+    }
+    try:
+        subprocess.run(
+            [_pg_binary('initdb'), '-D', data_dir, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-sync'],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        subprocess.run(
+            [_pg_binary('pg_ctl'), '-D', data_dir, '-l', os.path.join(data_dir, 'server.log'), '-w',
+             '-o', f"-p {port} -k {data_dir} -c listen_addresses=127.0.0.1 -c fsync=off",
+             'start'],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        subprocess.run(
+            [_pg_binary('createdb'), '-h', '127.0.0.1', '-p', str(port), '-U', 'postgres', database],
+            check=True
+        )
+        logger.info(f"Started benchmark PostgreSQL on port {port}")
+        yield env
+    finally:
+        if os.path.exists(os.path.join(data_dir, 'postmaster.pid')):
+            subprocess.run(
+                [_pg_binary('pg_ctl'), '-D', data_dir, '-m', 'immediate', '-w', 'stop'],
+                stdout=subprocess.DEVNULL
+            )
+        # Give the postmaster a moment to release files before removing them
+        time.sleep(0.2)
+        shutil.rmtree(data_dir, ignore_errors=True)
@@ -0,0 +1,226 @@
+"""Performance benchmarks for the data and dashboard paths.
+
+Usage:
+    python -m benchmarks.run --sizes 1000,100000,1000000 --output bench.json
+    python -m benchmarks.run --baseline bench-main.json --tolerance 0.2
+
+Each size seeds a fresh schema in a throwaway PostgreSQL cluster (initdb and
+pg_ctl must be on PATH or in PG_BIN). The benchmark user gets `size`
+transactions and the background users share the table with them. With
+--use-env the PG* environment variables are used instead; that database's
+public schema is dropped and recreated. Exits with status 1 if any median is
+more than --tolerance slower than the baseline.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import generate_csv, seed_database
+from benchmarks.pg_fixture import local_postgres
+
+BENCH_USER_ID = 1
+# Users created for CSV import runs start here so they never collide with seeded users
+IMPORT_USER_ID_START = 100000
+
+def _timed(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+def _summary(timings, rows=None):
+    summary = {
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'max_s': max(timings),
+        'runs': len(timings),
+    }
+    if rows is not None:
+        summary['rows'] = rows
+    return summary
+
+def _reset_schema(conn):
+    with conn.cursor() as cur:
+        cur.execute("DROP SCHEMA public CASCADE")
+        cur.execute("CREATE SCHEMA public")
+    conn.commit()
+
+def run_size(size, args):
+    import database
+    import migrate
+    import visualization as viz
+    from transaction_cache import TransactionCache
+    from csv_import import import_csv
+    from components.transactions import get_filtered_transactions, get_filtered_totals, _filter_clause
+    from exporter import export_to_file
+    from components.dashboard import get_data_version, get_spending_metrics, build_spending_trend
+    from budget_engine import budget_status
+
+    conn = database.get_db_connection()
+    try:
+        _reset_schema(conn)
+        migrate.run_migrations(conn)
+        seed_database(conn, 1, size, seed=args.seed, first_user_id=BENCH_USER_ID)
+        seed_database(conn, args.background_users, args.background_rows, seed=args.seed, first_user_id=BENCH_USER_ID + 1)
+    finally:
+        conn.close()
+    database.get_pool().close_all()
+    database.get_transaction_cache.clear()
+
+    results = {}
+    repeat = args.repeat
+
+    timings, rows = _timed(lambda: TransactionCache(database.connection).get(BENCH_USER_ID), repeat)
+    results['get_user_transactions.cold'] = _summary(timings, len(rows))
+
+    warm_cache = TransactionCache(database.connection, check_interval=0)
+    warm_cache.get(BENCH_USER_ID)
+    timings, rows = _timed(lambda: warm_cache.get(BENCH_USER_ID), repeat)
+    results['get_user_transactions.warm'] = _summary(timings, len(rows))
+
+    transactions = rows
+    timings, _ = _timed(lambda: transactions.to_frame(), repeat)
+    results['get_user_transactions.to_frame'] = _summary(timings, len(transactions))
+    newest = transactions[0]['date'] if transactions else datetime.now()
+    date_range = ((newest - timedelta(days=30)).date(), newest.date())
+    filters = (date_range, [], 0, 100000000)
+
+    timings, page = _timed(lambda: get_filtered_transactions(BENCH_USER_ID, *filters, limit=51), repeat)
+    results['get_filtered_transactions.page'] = _summary(timings, len(page))
+    timings, _ = _timed(lambda: get_filtered_totals(BENCH_USER_ID, *filters), repeat)
+    results['get_filtered_transactions.totals'] = _summary(timings)
+
+    history = ((datetime(1970, 1, 1).date(), datetime(2100, 1, 1).date()), [], -10 ** 14, 10 ** 14)
+    # A common merchant over the whole history, a rare phrase, and a misspelling
+    for name, text in (('common', 'amazon'), ('rare', 'electricity bill'), ('typo', 'amazn')):
+        timings, page = _timed(lambda: get_filtered_transactions(BENCH_USER_ID, *history, text, limit=51), repeat)
+        results[f'search_transactions.{name}.page'] = _summary(timings, len(page))
+        if page:
+            last = page[-1]
+            after = (last['rank'], last['date'], last['id'])
+            timings, page = _timed(
+                lambda: get_filtered_transactions(BENCH_USER_ID, *history, text, after=after, limit=51), repeat
+            )
+            results[f'search_transactions.{name}.next_page'] = _summary(timings, len(page))
+        timings, _ = _timed(lambda: get_filtered_totals(BENCH_USER_ID, *history, text), repeat)
+        results[f'search_transactions.{name}.totals'] = _summary(timings)
+
+    for fmt in ('csv.gz', 'parquet'):
+        clause, params = _filter_clause(BENCH_USER_ID, *history)
+
+        def run_export():
+            export_file, rows = export_to_file(BENCH_USER_ID, clause, params, fmt)
+            export_file.close()
+            return rows
+
+        timings, rows = _timed(run_export, repeat)
+        results[f'export_transactions.{fmt}'] = _summary(timings, rows)
+
+    csv_bytes = generate_csv(size, seed=args.seed)
+    import_users = iter(range(IMPORT_USER_ID_START, IMPORT_USER_ID_START + repeat))
+
+    def run_import():
+        user_id = next(import_users)
+        with database.cursor(user_id) as cur:
+            cur.execute("INSERT INTO users (id, email) VALUES (%s, %s)", (user_id, f"import{user_id}@example.com"))
+        upload = io.BytesIO(csv_bytes)
+        upload.size = len(csv_bytes)
+        return import_csv(user_id, upload)
+
+    timings, imported = _timed(run_import, repeat)
+    results['import_transactions_from_csv'] = _summary(timings, imported.imported)
+
+    timings, _ = _timed(lambda: viz.create_spending_trend(transactions), repeat)
+    results['visualization.create_spending_trend'] = _summary(timings, len(transactions))
+
+    timings, (fig, *_) = _timed(lambda: build_spending_trend(BENCH_USER_ID, None), repeat)
+    results['visualization.spending_trend_sql'] = _summary(timings, len(fig.data[0].x) if fig.data else 0)
+    timings, _ = _timed(lambda: viz.create_category_breakdown(transactions), repeat)
+    results['visualization.create_category_breakdown'] = _summary(timings, len(transactions))
+
+    timings, statuses = _timed(lambda: budget_status(BENCH_USER_ID), repeat)
+    results['budget_engine.budget_status'] = _summary(timings, len(statuses))
+
+    def dashboard_data_path():
+        # What components.dashboard.show_dashboard computes when none of its figures are cached
+        get_data_version(BENCH_USER_ID)
+        data = database.get_user_transactions(BENCH_USER_ID)
+        get_spending_metrics(data)
+        build_spending_trend(BENCH_USER_ID, None)
+        viz.create_category_breakdown(data)
+        viz.create_budget_progress(budget_status(BENCH_USER_ID))
+
+    timings, _ = _timed(dashboard_data_path, repeat)
+    results['dashboard.data_path'] = _summary(timings, len(transactions))
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return a list of (name, baseline median, current median) for regressions"""
+    regressions = []
+    for size, benches in results.items():
+        for name, current in benches.items():
+            previous = baseline.get('results', {}).get(size, {}).get(name)
+            if previous and current['median_s'] > previous['median_s'] * (1 + tolerance):
+                regressions.append((f"{name}@{size}", previous['median_s'], current['median_s']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FinanceTrackPro performance benchmarks")
+    parser.add_argument('--sizes', default='1000,100000,1000000', help="comma-separated transaction counts for the benchmark user")
+    parser.add_argument('--background-users', type=int, default=20)
+    parser.add_argument('--background-rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help="results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown before a benchmark counts as a regression")
+    parser.add_argument('--use-env', action='store_true', help="benchmark the database in the PG* environment (its schema is wiped)")
+    args = parser.parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    with (nullcontext(None) if args.use_env else local_postgres()) as env:
+        if env:
+            os.environ.update(env)
+        results = {}
+        for size in sizes:
+            print(f"Benchmarking {size:,} transactions...", flush=True)
+            results[str(size)] = run_size(size, args)
+            for name, summary in results[str(size)].items():
+                print(f"  {name:45s} {summary['median_s'] * 1000:10.2f} ms")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
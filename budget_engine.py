@@ -0,0 +1,171 @@
+"""Budget evaluation against the current Monthly or Weekly period.
+
+Usage:
+    python budget_engine.py status --user USER_ID
+    python budget_engine.py rebuild [--user USER_ID]
+
+Spend is read from budget_spend, which holds a running total and count per
+user, budget period, period bucket and category. Triggers on transactions
+(migration 0013) add each statement's net change to it in the same
+transaction, so evaluating a user's budgets reads one counter row per budget
+however many transactions they have. Monthly buckets start on the first of
+the month and Weekly ones on Monday, like date_trunc.
+
+The counters cover the rows in the transactions table: archiving a month
+takes its rows out of the counters, which only matters for periods long
+past. `rebuild` recomputes them from the transactions, for one user or for
+every shard; writes to the table wait until it has finished.
+"""
+import sys
+import argparse
+import logging
+from datetime import date, timedelta
+from database import cursor, shard_cursor, for_each_shard
+from metrics import instrument_query
+from money import format_money
+
+logger = logging.getLogger(__name__)
+
+# Budget periods with spend counters, as bucketed by migration 0013
+PERIODS = ('Monthly', 'Weekly')
+
+# Blocks writers' trigger updates (not reads) until the rebuild commits, so none are lost or counted twice
+LOCK_COUNTERS = "LOCK TABLE budget_spend IN SHARE ROW EXCLUSIVE MODE"
+COUNT_SPEND = """
+    INSERT INTO budget_spend (user_id, period, bucket_start, category, spent_cents, transaction_count)
+    SELECT t.user_id, p.period, budget_spend_bucket(p.unit, t.date), t.category, sum(t.amount_cents), count(*)
+    FROM transactions t
+    CROSS JOIN (VALUES ('Monthly', 'month'), ('Weekly', 'week')) AS p (period, unit)
+    WHERE t.user_id IS NOT NULL AND t.category IS NOT NULL AND t.date IS NOT NULL
+"""
+
+def period_bounds(period, today=None):
+    """(first day, day after the last) of the period's bucket containing today"""
+    today = today or date.today()
+    if period == 'Weekly':
+        start = today - timedelta(days=today.weekday())
+        return start, start + timedelta(days=7)
+    if period == 'Monthly':
+        start = today.replace(day=1)
+        return start, (start + timedelta(days=32)).replace(day=1)
+    raise ValueError(f"Unknown budget period: {period!r}")
+
+class BudgetStatus:
+    """One budget evaluated against the spend so far in its current period"""
+    __slots__ = ('category', 'period', 'budget_cents', 'spent_cents', 'transaction_count', 'start', 'end', 'today')
+
+    def __init__(self, category, period, budget_cents, spent_cents, transaction_count, start, end, today):
+        self.category = category
+        self.period = period
+        self.budget_cents = budget_cents
+        self.spent_cents = spent_cents
+        self.transaction_count = transaction_count
+        self.start = start
+        self.end = end
+        self.today = today
+
+    @property
+    def remaining_cents(self):
+        return self.budget_cents - self.spent_cents
+
+    @property
+    def days_elapsed(self):
+        """Days of the period so far, today included"""
+        return min((self.today - self.start).days + 1, self.days)
+
+    @property
+    def days(self):
+        return (self.end - self.start).days
+
+    @property
+    def burn_rate_cents(self):
+        """Average spend per day so far"""
+        return round(self.spent_cents / self.days_elapsed)
+
+    @property
+    def projected_cents(self):
+        """Spend by the end of the period if it continues at the burn rate"""
+        return round(self.spent_cents * self.days / self.days_elapsed)
+
+    @property
+    def daily_allowance_cents(self):
+        """What can be spent per remaining day (today included) to stay within the budget"""
+        return max(round(self.remaining_cents / (self.days - self.days_elapsed + 1)), 0)
+
+    @property
+    def over_budget(self):
+        return self.spent_cents > self.budget_cents
+
+@instrument_query("budget_status")
+def budget_status(user_id, today=None):
+    """[BudgetStatus] for each of the user's budgets in its current period, by category"""
+    today = today or date.today()
+    bounds = {period: period_bounds(period, today) for period in PERIODS}
+    with cursor(user_id, readonly=True) as cur:
+        cur.execute("""
+            SELECT b.category, b.period, b.amount_cents,
+                   COALESCE(s.spent_cents, 0), COALESCE(s.transaction_count, 0)
+            FROM budgets b
+            LEFT JOIN budget_spend s
+                ON s.user_id = b.user_id AND s.period = b.period AND s.category = b.category
+                AND s.bucket_start = CASE b.period WHEN 'Monthly' THEN %s::date WHEN 'Weekly' THEN %s::date END
+            WHERE b.user_id = %s AND b.period IN ('Monthly', 'Weekly')
+            ORDER BY b.category, b.period
+        """, (bounds['Monthly'][0], bounds['Weekly'][0], user_id))
+        rows = cur.fetchall()
+    return [
+        BudgetStatus(category, period, budget_cents, spent_cents, count, *bounds[period], today)
+        for category, period, budget_cents, spent_cents, count in rows
+    ]
+
+def _count_spend(cur, where="", params=()):
+    cur.execute(f"{COUNT_SPEND} {where} GROUP BY 1, 2, 3, 4", params)
+    return cur.rowcount
+
+@instrument_query("rebuild_budget_spend")
+def rebuild_user(user_id):
+    """Recompute the user's counters from their transactions; returns the number of counters"""
+    with cursor(user_id) as cur:
+        cur.execute(LOCK_COUNTERS)
+        cur.execute("DELETE FROM budget_spend WHERE user_id = %s", (user_id,))
+        return _count_spend(cur, "AND t.user_id = %s", (user_id,))
+
+def rebuild_shard(shard):
+    """Recompute every counter on the shard in one transaction; returns the number of counters"""
+    with shard_cursor(shard) as cur:
+        cur.execute(LOCK_COUNTERS)
+        cur.execute("DELETE FROM budget_spend")
+        counters = _count_spend(cur)
+    logger.info(f"Rebuilt {counters} budget spend counter(s) on shard {shard}")
+    return counters
+
+def rebuild_all():
+    """{shard: number of counters} after rebuilding every shard"""
+    return for_each_shard(rebuild_shard)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate budgets and maintain their spend counters")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    status = subparsers.add_parser('status', help="show a user's budgets in their current periods")
+    status.add_argument('--user', type=int, required=True)
+    rebuild = subparsers.add_parser('rebuild', help="recompute spend counters from the transactions")
+    rebuild.add_argument('--user', type=int, action='append', help="only rebuild this user (repeatable)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'status':
+        for item in budget_status(args.user):
+            print(f"{item.category:<14} {item.period:<8} {item.start:%Y-%m-%d}  "
+                  f"spent {format_money(item.spent_cents):>12} of {format_money(item.budget_cents):>12}  "
+                  f"remaining {format_money(item.remaining_cents):>12}  "
+                  f"projected {format_money(item.projected_cents):>12}")
+    elif args.user:
+        for user_id in args.user:
+            print(f"User {user_id}: {rebuild_user(user_id)} counter(s)")
+    else:
+        result = rebuild_all()
+        print(f"Rebuilt {sum(result.values())} counter(s) on {len(result)} shard(s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
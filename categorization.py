@@ -0,0 +1,211 @@
+import re
+import threading
+import logging
+from collections import OrderedDict
+import pandas as pd
+from database import cursor
+from metrics import instrument_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATEGORY = "Other"
+# Built-in rules rank below user rules (default priority 100); earlier entries win ties
+BUILTIN_KEYWORDS = {
+    'Food': ['restaurant', 'cafe', 'grocery', 'food'],
+    'Transport': ['uber', 'taxi', 'train', 'bus', 'transport'],
+    'Entertainment': ['cinema', 'movie', 'theater', 'concert'],
+    'Shopping': ['amazon', 'shop', 'store', 'retail'],
+    'Bills': ['utility', 'electricity', 'water', 'gas', 'internet']
+}
+BUILTIN_PRIORITY = 0
+MAX_CACHED_ENGINES = 256
+
+class Rule:
+    """A keyword rule; the optional amount bounds are inclusive int cents"""
+    __slots__ = ('keyword', 'category', 'priority', 'min_amount_cents', 'max_amount_cents')
+
+    def __init__(self, keyword, category, priority=BUILTIN_PRIORITY, min_amount_cents=None, max_amount_cents=None):
+        self.keyword = keyword.lower()
+        self.category = category
+        self.priority = priority
+        self.min_amount_cents = None if min_amount_cents is None else int(min_amount_cents)
+        self.max_amount_cents = None if max_amount_cents is None else int(max_amount_cents)
+
+    @property
+    def has_conditions(self):
+        return self.min_amount_cents is not None or self.max_amount_cents is not None
+
+    def applies_to(self, amount_cents):
+        if not self.has_conditions:
+            return True
+        if amount_cents is None or amount_cents != amount_cents:  # unknown or NaN
+            return False
+        if self.min_amount_cents is not None and amount_cents < self.min_amount_cents:
+            return False
+        if self.max_amount_cents is not None and amount_cents > self.max_amount_cents:
+            return False
+        return True
+
+def builtin_rules():
+    return [
+        Rule(word, category)
+        for category, words in BUILTIN_KEYWORDS.items()
+        for word in words
+    ]
+
+class CategorizationEngine:
+    """Keyword rules compiled into one regular expression.
+
+    A zero-width lookahead alternation of every keyword (longest first) reports
+    the longest keyword starting at each position of a description. Each
+    keyword is precomputed with the rules of every keyword it contains, so the
+    matches cover all keywords present. The applicable rule with the highest
+    priority wins; ties go to the rule listed first.
+    """
+
+    def __init__(self, rules, default=DEFAULT_CATEGORY):
+        self.default = default
+        ranked = sorted(enumerate(rules), key=lambda item: (-item[1].priority, item[0]))
+
+        by_keyword = {}
+        for rank, (_, rule) in enumerate(ranked):
+            if rule.keyword:
+                by_keyword.setdefault(rule.keyword, []).append((rank, rule))
+
+        self._candidates = {}
+        for keyword in by_keyword:
+            contained = [
+                candidate
+                for other, candidates in by_keyword.items() if other in keyword
+                for candidate in candidates
+            ]
+            contained.sort(key=lambda candidate: candidate[0])
+            self._candidates[keyword] = contained
+
+        # Without amount conditions the winner for each keyword is fixed
+        self._has_conditions = any(rule.has_conditions for rule in rules)
+        self._best = {keyword: candidates[0] for keyword, candidates in self._candidates.items()}
+
+        keywords = sorted(by_keyword, key=len, reverse=True)
+        self._pattern = re.compile('(?=(' + '|'.join(map(re.escape, keywords)) + '))') if keywords else None
+
+    def _categorize_lowered(self, description, amount_cents=None):
+        if not description or self._pattern is None:
+            return self.default
+        best = None
+        for keyword in self._pattern.findall(description):
+            if self._has_conditions:
+                candidate = next(
+                    (c for c in self._candidates[keyword] if c[1].applies_to(amount_cents)),
+                    None
+                )
+            else:
+                candidate = self._best[keyword]
+            if candidate is not None and (best is None or candidate[0] < best[0]):
+                best = candidate
+        return best[1].category if best else self.default
+
+    def categorize(self, description, amount_cents=None):
+        return self._categorize_lowered((description or '').lower(), amount_cents)
+
+    def categorize_many(self, descriptions, amounts_cents=None):
+        """Categorize a list or pandas Series of descriptions (amounts in int cents); returns the same kind of container"""
+        is_series = isinstance(descriptions, pd.Series)
+        lowered = pd.Series(descriptions, dtype=object).fillna('').astype(str).str.lower()
+
+        if amounts_cents is None or not self._has_conditions:
+            # Bank exports repeat merchants heavily, so evaluate each distinct description once
+            uniques = lowered.unique()
+            mapping = {description: self._categorize_lowered(description) for description in uniques}
+            result = lowered.map(mapping)
+        else:
+            amount_values = pd.to_numeric(pd.Series(amounts_cents, dtype=object), errors='coerce').tolist()
+            result = pd.Series(
+                [self._categorize_lowered(d, a) for d, a in zip(lowered.tolist(), amount_values)],
+                index=lowered.index,
+                dtype=object
+            )
+
+        if is_series:
+            result.index = descriptions.index
+            return result
+        return result.tolist()
+
+_builtin_engine = None
+_engines = OrderedDict()  # user_id -> (rules version, engine)
+_engines_lock = threading.Lock()
+
+def get_builtin_engine():
+    global _builtin_engine
+    if _builtin_engine is None:
+        _builtin_engine = CategorizationEngine(builtin_rules())
+    return _builtin_engine
+
+@instrument_query("get_engine")
+def get_engine(user_id):
+    """The user's compiled engine, rebuilt only when their rules change"""
+    with cursor(user_id, readonly=True) as cur:
+        cur.execute("""
+            SELECT count(*), max(updated_at) FROM categorization_rules
+            WHERE user_id = %s
+        """, (user_id,))
+        version = tuple(cur.fetchone())
+
+        with _engines_lock:
+            cached = _engines.get(user_id)
+            if cached is not None and cached[0] == version:
+                _engines.move_to_end(user_id)
+                return cached[1]
+
+        if version[0] == 0:
+            engine = get_builtin_engine()
+        else:
+            cur.execute("""
+                SELECT keyword, category, priority, min_amount_cents, max_amount_cents
+                FROM categorization_rules
+                WHERE user_id = %s
+                ORDER BY id
+            """, (user_id,))
+            user_rules = [Rule(*row) for row in cur.fetchall()]
+            engine = CategorizationEngine(user_rules + builtin_rules())
+            logger.info(f"Compiled {len(user_rules)} categorization rule(s) for user {user_id}")
+
+    with _engines_lock:
+        _engines[user_id] = (version, engine)
+        _engines.move_to_end(user_id)
+        while len(_engines) > MAX_CACHED_ENGINES:
+            _engines.popitem(last=False)
+    return engine
+
+def invalidate_engine(user_id):
+    with _engines_lock:
+        _engines.pop(user_id, None)
+
+@instrument_query("get_user_rules")
+def get_user_rules(user_id):
+    with cursor(user_id, dict_rows=True, readonly=True) as cur:
+        cur.execute("""
+            SELECT id, keyword, category, priority, min_amount_cents, max_amount_cents
+            FROM categorization_rules
+            WHERE user_id = %s
+            ORDER BY priority DESC, id
+        """, (user_id,))
+        return cur.fetchall()
+
+@instrument_query("save_rule")
+def save_rule(user_id, keyword, category, priority=100, min_amount_cents=None, max_amount_cents=None):
+    with cursor(user_id) as cur:
+        cur.execute("""
+            INSERT INTO categorization_rules (user_id, keyword, category, priority, min_amount_cents, max_amount_cents)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (user_id, keyword.strip().lower(), category, priority, min_amount_cents, max_amount_cents))
+    invalidate_engine(user_id)
+
+@instrument_query("delete_rule")
+def delete_rule(user_id, rule_id):
+    with cursor(user_id) as cur:
+        cur.execute("""
+            DELETE FROM categorization_rules
+            WHERE id = %s AND user_id = %s
+        """, (rule_id, user_id))
+    invalidate_engine(user_id)
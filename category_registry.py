@@ -0,0 +1,35 @@
+class CategoryRegistry:
+    """A user's categories with constant-time lookup by name"""
+
+    def __init__(self, categories):
+        self.categories = [dict(c) for c in categories]
+        self.names = [c['name'] for c in self.categories]
+        self._by_name = {c['name']: c for c in self.categories}
+        self._positions = {name: idx for idx, name in enumerate(self.names)}
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def __iter__(self):
+        return iter(self.categories)
+
+    def __len__(self):
+        return len(self.categories)
+
+    def get(self, name):
+        return self._by_name.get(name)
+
+    def icon(self, name):
+        category = self._by_name.get(name)
+        return category['icon'] if category else ''
+
+    def color(self, name):
+        category = self._by_name.get(name)
+        return category['color'] if category else None
+
+    def label(self, name):
+        """Display label used as a selectbox format_func"""
+        return f"{self.icon(name)} {name}"
+
+    def index(self, name, default=0):
+        return self._positions.get(name, default)
@@ -0,0 +1,259 @@
+"""Column-oriented transaction results.
+
+TransactionColumns holds a result set as one NumPy array per column rather
+than a dict per row: int64 ids, int64 amounts in cents (see money),
+datetime64[us] dates and dictionary-encoded categories (int8 codes into a
+small array of names, -1 for none). Rows are selected with SELECT_COLUMNS,
+which has the database send dates as epoch microseconds, so no datetime
+object is created per row. Descriptions, bank references and tags
+stay Python objects in object arrays, with repeated descriptions sharing one
+string and tags stored as shared tuples.
+
+to_frame() wraps the arrays in a DataFrame without copying them; indexing
+with an int or iterating yields TransactionRow views for code that wants
+records, and slicing yields another TransactionColumns sharing the arrays.
+"""
+from operator import itemgetter
+import numpy as np
+
+FIELDS = ('id', 'user_id', 'amount_cents', 'category', 'description', 'date', 'bank_reference', 'tags')
+# Select list producing the tuple layout from_rows expects, in FIELDS order
+SELECT_COLUMNS = (
+    "id, user_id, amount_cents, category, description, "
+    "(extract(epoch FROM date) * 1000000)::int8, bank_reference, tags"
+)
+NAT = np.iinfo(np.int64).min  # datetime64 NaT as int64
+# Rows turned into Python tuples at a time when reading from a cursor
+FETCH_ROWS = 10000
+
+def _code_dtype(categories):
+    # The narrowest type pandas' Categorical uses for this many categories, so to_frame can share the codes
+    for dtype in (np.int8, np.int16, np.int32):
+        if categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+def _encode(values, count):
+    """(codes, object array of distinct values) in order of first appearance; None is -1"""
+    index = {}
+    codes = np.fromiter(
+        (-1 if value is None else index.setdefault(value, len(index)) for value in values),
+        dtype=np.int32, count=count
+    )
+    return codes.astype(_code_dtype(len(index)), copy=False), _object_array(list(index))
+
+def _shared(values):
+    # Descriptions repeat (the same merchants); keep one str object per distinct value
+    seen = {}
+    return [seen.setdefault(value, value) for value in values]
+
+def _shared_tags(values):
+    # Tags become tuples, shared between rows with the same tags: one list per row would
+    # cost memory and leave a million objects for every full garbage collection to walk
+    seen = {}
+    return [None if tags is None else seen.setdefault(tuple(tags), tuple(tags)) for tags in values]
+
+def _object_array(values):
+    # np.array would turn a list of lists (tags) into a 2-d array
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+class TransactionColumns:
+    __slots__ = ('id', 'user_id', 'amount_cents', 'category_codes', 'categories',
+                 'description', 'date', 'bank_reference', 'tags')
+
+    def __init__(self, id, user_id, amount_cents, category_codes, categories, description, date, bank_reference, tags):
+        self.id = id
+        self.user_id = user_id
+        self.amount_cents = amount_cents
+        self.category_codes = category_codes
+        self.categories = categories
+        self.description = description
+        self.date = date
+        self.bank_reference = bank_reference
+        self.tags = tags
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from tuples selected with SELECT_COLUMNS"""
+        count = len(rows)
+        if not count:
+            return cls.empty()
+
+        # One pass per column; zip(*rows) would allocate a tuple per column the size of the result
+        def column(index):
+            return map(itemgetter(index), rows)
+
+        codes, names = _encode(column(3), count)
+        return cls(
+            np.fromiter(column(0), dtype=np.int64, count=count),
+            np.fromiter(column(1), dtype=np.int64, count=count),
+            np.fromiter(column(2), dtype=np.int64, count=count),
+            codes,
+            names,
+            _object_array(_shared(column(4))),
+            np.fromiter((NAT if d is None else d for d in column(5)), dtype=np.int64, count=count).view('datetime64[us]'),
+            _object_array(list(column(6))),
+            _object_array(_shared_tags(column(7))),
+        )
+
+    @classmethod
+    def from_cursor(cls, cur, fetch_rows=FETCH_ROWS):
+        """Build from a cursor that executed a SELECT_COLUMNS query, fetch_rows tuples at a time"""
+        parts = []
+        while True:
+            rows = cur.fetchmany(fetch_rows)
+            if not rows:
+                break
+            parts.append(cls.from_rows(rows))
+        return cls.concat(parts)
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64),
+            np.empty(0, np.int8), np.empty(0, object), np.empty(0, object),
+            np.empty(0, 'datetime64[us]'), np.empty(0, object), np.empty(0, object),
+        )
+
+    @classmethod
+    def concat(cls, parts):
+        """One TransactionColumns from several; category dictionaries are merged"""
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+
+        index = {}
+        codes = []
+        for part in parts:
+            remap = np.array([index.setdefault(name, len(index)) for name in part.categories] + [-1], dtype=np.int32)
+            # Code -1 indexes the appended -1, so rows without a category keep it
+            codes.append(remap[part.category_codes])
+        return cls(
+            np.concatenate([part.id for part in parts]),
+            np.concatenate([part.user_id for part in parts]),
+            np.concatenate([part.amount_cents for part in parts]),
+            np.concatenate(codes).astype(_code_dtype(len(index)), copy=False),
+            _object_array(list(index)),
+            np.concatenate([part.description for part in parts]),
+            np.concatenate([part.date for part in parts]),
+            np.concatenate([part.bank_reference for part in parts]),
+            np.concatenate([part.tags for part in parts]),
+        )
+
+    def __len__(self):
+        return len(self.id)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if not -len(self) <= key < len(self):
+                raise IndexError(key)
+            return TransactionRow(self, key % len(self))
+        return self.take(key)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield TransactionRow(self, index)
+
+    def take(self, index):
+        """Rows selected by a slice (views, no copy), boolean mask or index array"""
+        return TransactionColumns(
+            self.id[index], self.user_id[index], self.amount_cents[index],
+            self.category_codes[index], self.categories,
+            self.description[index], self.date[index],
+            self.bank_reference[index], self.tags[index],
+        )
+
+    def without_ids(self, ids):
+        return self.take(~np.isin(self.id, np.asarray(ids, dtype=np.int64)))
+
+    def newest_first(self):
+        """Sorted by (date, id) descending; rows without a date sort last"""
+        order = np.lexsort((self.id, self.date.view(np.int64)))[::-1]
+        return self.take(order)
+
+    @property
+    def category(self):
+        """Category names as an object array (decoded, so this allocates)"""
+        names = np.append(self.categories, None)
+        return names[self.category_codes]
+
+    def category_totals(self):
+        """{category: summed int cents} over rows that have a category"""
+        known = self.category_codes >= 0
+        # np.bincount would sum through float64 weights; add.at keeps the sums exact int64
+        sums = np.zeros(len(self.categories), dtype=np.int64)
+        np.add.at(sums, self.category_codes[known], self.amount_cents[known])
+        return dict(zip(self.categories.tolist(), sums.tolist()))
+
+    @property
+    def nbytes(self):
+        """Size of the arrays; object columns count their pointers only"""
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
+
+    def to_frame(self):
+        """A DataFrame over the same arrays; category becomes a Categorical over the codes"""
+        import pandas as pd
+
+        return pd.DataFrame({
+            'id': self.id,
+            'user_id': self.user_id,
+            'amount_cents': self.amount_cents,
+            'category': pd.Categorical.from_codes(self.category_codes, categories=self.categories, validate=False),
+            'description': self.description,
+            'date': self.date,
+            'bank_reference': self.bank_reference,
+            'tags': self.tags,
+        }, copy=False)
+
+    def records(self):
+        """Plain dicts, for callers that need mutable records"""
+        return [row.as_dict() for row in self]
+
+    def __repr__(self):
+        return f"TransactionColumns({len(self)} rows, {len(self.categories)} categories)"
+
+class TransactionRow:
+    """Read-only record view of one row: row['amount_cents'], row.get('tags')"""
+    __slots__ = ('_columns', '_index')
+
+    def __init__(self, columns, index):
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, name):
+        columns, index = self._columns, self._index
+        if name == 'category':
+            code = columns.category_codes[index]
+            return None if code < 0 else columns.categories[code]
+        if name not in FIELDS:
+            raise KeyError(name)
+        value = getattr(columns, name)[index]
+        # .item() gives int, float and datetime (None for NaT)
+        return value.item() if isinstance(value, np.generic) else value
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return FIELDS
+
+    def as_dict(self):
+        return {name: self[name] for name in FIELDS}
+
+    def __repr__(self):
+        return f"TransactionRow({self.as_dict()!r})"
+
+def as_frame(transactions):
+    """DataFrame for TransactionColumns (zero-copy) or a list of transaction dicts"""
+    if isinstance(transactions, TransactionColumns):
+        return transactions.to_frame()
+    import pandas as pd
+
+    return pd.DataFrame(transactions)
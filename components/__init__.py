@@ -1,6 +1,18 @@
-from .landing import show_landing
-from .dashboard import show_dashboard
-from .budget import show_budget
-from .transactions import show_transactions
+import importlib
+
+# Page modules are imported on first attribute access so that importing one
+# component does not load the others (and pandas/plotly with them)
+_EXPORTS = {
+    'show_landing': 'landing',
+    'show_dashboard': 'dashboard',
+    'show_budget': 'budget',
+    'show_transactions': 'transactions',
+}
 
 __all__ = ['show_landing', 'show_dashboard', 'show_budget', 'show_transactions']
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        module = importlib.import_module(f'.{_EXPORTS[name]}', __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,5 +1,10 @@
 import streamlit as st
-from database import get_db_connection
+from database import cursor
+from budget_engine import budget_status
+from unit_of_work import unit_of_work
+from metrics import instrument_query
+from figure_cache import invalidate_figures
+from money import to_cents, format_money
 import pandas as pd
 
 def show_budget():
@@ -15,41 +20,48 @@ def show_budget():
         period = st.selectbox("Period", ["Monthly", "Weekly"])
         
         if st.form_submit_button("Set Budget"):
-            save_budget(category, amount, period)
+            save_budget(category, to_cents(amount), period)
             st.success(f"Budget set for {category}")
     
     # Show current budgets
     show_budget_table()
 
-def save_budget(category, amount, period):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        INSERT INTO budgets (user_id, category, amount, period)
-        VALUES (%s, %s, %s, %s)
-        ON CONFLICT (user_id, category) 
-        DO UPDATE SET amount = %s, period = %s
-    """, (st.session_state.user["id"], category, amount, period, amount, period))
-    
-    conn.commit()
-    cur.close()
-    conn.close()
+@instrument_query("save_budget")
+def save_budget(category, amount_cents, period, uow=None):
+    user_id = st.session_state.user["id"]
+    with unit_of_work(user_id, uow, "save_budget") as uow:
+        uow.insert(
+            'budgets', ('user_id', 'category', 'amount_cents', 'period'),
+            [(user_id, category, amount_cents, period)],
+            conflict=('user_id', 'category', 'period'),
+            update={'amount_cents': 'EXCLUDED.amount_cents', 'updated_at': 'CURRENT_TIMESTAMP'}
+        )
+        uow.after_commit(invalidate_figures, user_id)
 
 def show_budget_table():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT category, amount, period
-        FROM budgets
-        WHERE user_id = %s
-    """, (st.session_state.user["id"],))
-    
-    budgets = cur.fetchall()
-    if budgets:
-        df = pd.DataFrame(budgets, columns=["Category", "Amount", "Period"])
+    statuses = budget_status(st.session_state.user["id"])
+    if statuses:
+        df = pd.DataFrame(
+            [
+                (
+                    status.category, status.period, format_money(status.budget_cents),
+                    format_money(status.spent_cents), format_money(status.remaining_cents),
+                    format_money(status.burn_rate_cents), format_money(status.projected_cents)
+                )
+                for status in statuses
+            ],
+            columns=["Category", "Period", "Amount", "Spent", "Remaining", "Per Day", "Projected"]
+        )
+        st.caption("Spending in each budget's current week or month")
         st.dataframe(df)
-    
-    cur.close()
-    conn.close()
+
+@instrument_query("get_budget_version")
+def get_budget_version(user_id):
+    """Changes whenever the user's budgets are added, updated or removed"""
+    with cursor(user_id, readonly=True) as cur:
+        cur.execute("""
+            SELECT count(*), max(updated_at)
+            FROM budgets
+            WHERE user_id = %s
+        """, (user_id,))
+        return tuple(cur.fetchone())
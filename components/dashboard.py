@@ -1,7 +1,13 @@
 import streamlit as st
-from database import get_user_transactions, get_db_connection
+from database import get_user_transactions, get_transaction_cache
 import visualization as viz
 import pandas as pd
+from datetime import date, timedelta
+from budget_engine import budget_status
+from report_queries import history_bounds, spending_series
+from figure_cache import get_figure_cache
+from components.budget import get_budget_version
+from money import format_money
 
 def show_dashboard():
     # Add a prominent dashboard button at the top
@@ -18,68 +24,121 @@ def show_dashboard():
     col1, col2 = st.columns(2)
     
     # Get user's transaction data
-    transactions = get_user_transactions(st.session_state.user["id"])
+    user_id = st.session_state.user["id"]
+    # Read before the data so a concurrent write can only make the cached entry newer than its key
+    transactions_version, budget_version = get_data_version(user_id)
+    transactions = get_user_transactions(user_id)
+    figures = get_figure_cache()
     
     with col1:
         # Key metrics
         if transactions:
-            df = pd.DataFrame(transactions)
-            total_spent = df['amount'].sum()
-            avg_transaction = df['amount'].mean()
-            st.metric("Total Spent", f"${total_spent:,.2f}")
-            st.metric("Average Transaction", f"${avg_transaction:,.2f}")
+            total_spent, avg_transaction = figures.get_or_build(
+                user_id, 'spending_metrics', transactions_version, None,
+                lambda: get_spending_metrics(transactions)
+            )
+            st.metric("Total Spent", format_money(total_spent))
+            st.metric("Average Transaction", format_money(avg_transaction))
         
         # Spending trend
-        spending_trend = viz.create_spending_trend(transactions)
-        st.plotly_chart(spending_trend, use_container_width=True, key="spending_trend_chart")
+        show_spending_trend(user_id, figures, transactions_version)
         
         # Recent transactions
         st.subheader("Recent Transactions")
         if transactions:
             for transaction in transactions[:5]:
-                st.write(f"{transaction['date'].strftime('%Y-%m-%d')}: ${transaction['amount']:,.2f} - {transaction['description']}")
+                st.write(f"{transaction['date'].strftime('%Y-%m-%d')}: {format_money(transaction['amount_cents'])} - {transaction['description']}")
         else:
             st.info("No recent transactions")
     
     with col2:
         # Category breakdown
-        category_chart = viz.create_category_breakdown(transactions)
+        category_chart = figures.get_or_build(
+            user_id, 'category_breakdown', transactions_version, None,
+            lambda: viz.create_category_breakdown(transactions)
+        )
         st.plotly_chart(category_chart, use_container_width=True, key="category_breakdown_chart")
         
         # Budget overview
         st.subheader("Budget Overview")
-        budget_data = get_budget_data()
-        actual_spending = get_actual_spending(transactions)
-        if not budget_data.empty and not actual_spending.empty:
-            budget_progress = viz.create_budget_progress(budget_data, actual_spending)
-            st.plotly_chart(budget_progress, use_container_width=True, key="budget_progress_chart")
-        else:
-            st.info("Set up your budget to see the overview")
+        show_budget_overview(user_id, figures, (transactions_version, budget_version))
 
-def get_budget_data():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT category, amount
-        FROM budgets
-        WHERE user_id = %s
-    """, (st.session_state.user["id"],))
-    
-    budgets = cur.fetchall()
-    cur.close()
-    conn.close()
-    
-    if budgets:
-        # Convert tuple list to list of dictionaries for proper DataFrame creation
-        budget_dicts = [{'category': b[0], 'amount': b[1]} for b in budgets]
-        return pd.DataFrame(budget_dicts)
-    return pd.DataFrame({'category': [], 'amount': []})
+def get_data_version(user_id):
+    """(transactions version, budgets version) identifying the data behind the dashboard's figures"""
+    return (get_transaction_cache().version(user_id), get_budget_version(user_id))
 
-def get_actual_spending(transactions):
-    if not transactions:
-        return pd.DataFrame()
-    
-    df = pd.DataFrame(transactions)
-    actual = df.groupby('category')['amount'].sum().reset_index()
-    return actual[['category', 'amount']]
+def get_spending_metrics(transactions):
+    """(total, average) in int cents"""
+    amounts = transactions.amount_cents
+    return int(amounts.sum()), round(amounts.mean())
+
+def show_budget_overview(user_id, figures, version):
+    """Each budget against the spend so far in its current period, from the budget engine's counters"""
+    today = date.today()
+    statuses = budget_status(user_id, today)
+    if not statuses:
+        st.info("Set up your budget to see the overview")
+        return
+    # Keyed by day as well: the periods roll over and projections change with the date
+    budget_progress = figures.get_or_build(
+        user_id, 'budget_progress', version, today,
+        lambda: viz.create_budget_progress(statuses)
+    )
+    st.plotly_chart(budget_progress, use_container_width=True, key="budget_progress_chart")
+    for status in statuses:
+        if status.over_budget:
+            st.error(f"{status.category} ({status.period}): {format_money(-status.remaining_cents)} over budget")
+        elif status.projected_cents > status.budget_cents:
+            st.warning(
+                f"{status.category} ({status.period}): on pace for {format_money(status.projected_cents)}; "
+                f"{format_money(status.daily_allowance_cents)} a day keeps it within {format_money(status.budget_cents)}"
+            )
+
+def build_spending_trend(user_id, trend_range):
+    """(figure, start, end, grain) for the visible range, or None without transactions"""
+    bounds = history_bounds(user_id)
+    if bounds is None:
+        return None
+    start, end = trend_range or (bounds[0], bounds[1] + timedelta(microseconds=1))
+    grain = viz.choose_trend_grain(start, end)
+    series = spending_series(user_id, start, end, grain)
+    fig = viz.create_trend_figure([bucket for bucket, _ in series], [total for _, total in series], grain)
+    return fig, start, end, grain
+
+def show_spending_trend(user_id, figures, version):
+    """Trend over the visible range; a box selection zooms in and re-queries at a finer grain"""
+    trend_range = st.session_state.get("trend_range")
+    trend = figures.get_or_build(
+        user_id, 'spending_trend', version, trend_range,
+        lambda: build_spending_trend(user_id, trend_range)
+    )
+    if trend is None:
+        st.plotly_chart(viz.create_trend_figure([], [], 'day'), use_container_width=True, key="spending_trend_chart")
+        return
+    fig, start, end, grain = trend
+
+    # A fresh key per zoom level so the previous selection does not carry over
+    zoom = st.session_state.get("trend_zoom", 0)
+    event = st.plotly_chart(
+        fig,
+        use_container_width=True,
+        key=f"spending_trend_chart_{zoom}",
+        on_select="rerun",
+        selection_mode="box"
+    )
+    boxes = event.selection.get("box", []) if event else []
+    if boxes and len(boxes[0].get("x", [])) == 2:
+        x0, x1 = sorted(pd.to_datetime(boxes[0]["x"]))
+        if x1 > x0:
+            st.session_state.trend_range = (x0.to_pydatetime(), x1.to_pydatetime())
+            st.session_state.trend_zoom = zoom + 1
+            st.rerun()
+
+    if st.session_state.get("trend_range"):
+        st.caption(f"Showing {start:%Y-%m-%d} to {end:%Y-%m-%d} by {grain}")
+        if st.button("Reset zoom", key="reset_trend_zoom"):
+            st.session_state.pop("trend_range", None)
+            st.session_state.trend_zoom = zoom + 1
+            st.rerun()
+    else:
+        st.caption("Drag a box on the chart to zoom in")
@@ -1,17 +1,31 @@
+import os
 import streamlit as st
 from database import (
-    get_db_connection, 
-    get_user_transactions, 
-    get_user_categories,
+    cursor,
+    invalidate_transactions,
+    get_category_registry,
     save_transaction,
     save_category
 )
-import pandas as pd
-from utils import categorize_transaction
-import io
-import csv
+from csv_import import import_csv
+from exporter import EXPORT_FORMATS, export_to_file
+from archive import reaches_archive, iter_archived_batches, read_archive, archived_totals, merge_pages
+from categorization import get_user_rules, save_rule, delete_rule
+from transaction_search import search_tiers, search_condition
+from metrics import instrument_query
+from unit_of_work import unit_of_work
+from money import to_cents, to_units, format_money
 from datetime import datetime, timedelta
 
+PAGE_SIZE_OPTIONS = [25, 50, 100]
+EXPORT_FORMAT_LABELS = {'csv': 'CSV', 'csv.gz': 'CSV (gzip)', 'parquet': 'Parquet'}
+# st.download_button keeps the whole file in memory while serving it, so larger exports are refused
+DOWNLOAD_MAX_BYTES = 256 * 1024 * 1024
+# Newest rows checked for search matches before falling back to the search indexes
+SEARCH_SCAN_ROWS = 5000
+# Search matches counted for the summary metrics; a common term can match most of the table
+SEARCH_TOTALS_LIMIT = 10000
+
 def show_transactions():
     st.subheader("Transactions")
     
@@ -42,11 +56,11 @@ def show_transaction_form():
                 help="Enter the transaction amount"
             )
             
-            categories = get_user_categories(st.session_state.user["id"])
+            categories = get_category_registry(st.session_state.user["id"])
             category = st.selectbox(
                 "Category",
-                options=[cat["name"] for cat in categories],
-                format_func=lambda x: f"{next((c['icon'] for c in categories if c['name'] == x), '')} {x}"
+                options=categories.names,
+                format_func=categories.label
             )
         
         with col2:
@@ -75,7 +89,7 @@ def show_transaction_form():
         if submit:
             save_transaction(
                 st.session_state.user["id"],
-                amount,
+                to_cents(amount),
                 category,
                 description,
                 date,
@@ -99,16 +113,23 @@ def show_transaction_list():
             )
         
         with col2:
-            categories = get_user_categories(st.session_state.user["id"])
+            categories = get_category_registry(st.session_state.user["id"])
             category_filter = st.multiselect(
                 "Categories",
-                options=[cat["name"] for cat in categories],
-                format_func=lambda x: f"{next((c['icon'] for c in categories if c['name'] == x), '')} {x}"
+                options=categories.names,
+                format_func=categories.label
             )
         
         with col3:
             min_amount = st.number_input("Min Amount", value=0.0, step=10.0)
             max_amount = st.number_input("Max Amount", value=1000000.0, step=10.0)
+
+        search = st.text_input(
+            "Search",
+            placeholder="e.g. amazon",
+            help="Find transactions whose description contains these words"
+        ).strip()
+    filters = (date_range, category_filter, to_cents(min_amount), to_cents(max_amount), search)
     
     # Import/Export options
     col1, col2 = st.columns(2)
@@ -120,33 +141,80 @@ def show_transaction_list():
     
     with col2:
         st.subheader("Export Transactions")
-        if st.button("Export to CSV"):
-            export_transactions_to_csv()
+        export_format = st.selectbox(
+            "Format",
+            list(EXPORT_FORMATS),
+            format_func=lambda fmt: EXPORT_FORMAT_LABELS[fmt]
+        )
+        if st.button("Export"):
+            export_transactions_to_file(st.session_state.user["id"], filters, export_format)
     
-    # Get and display transactions
-    transactions = get_filtered_transactions(date_range, category_filter, min_amount, max_amount)
-    if transactions:
+    # Summary metrics come from SQL aggregates; only one page of rows is fetched
+    user_id = st.session_state.user["id"]
+    count, total_cents, average_cents = get_filtered_totals(user_id, *filters)
+    if search and reaches_archive(user_id, date_range):
+        st.caption("Archived transactions are not included in search results")
+    if count:
         st.subheader("Transaction List")
-        
-        # Summary metrics
-        total_amount = sum(t['amount'] for t in transactions)
-        avg_amount = total_amount / len(transactions)
-        
+
         col1, col2, col3 = st.columns(3)
-        col1.metric("Total Amount", f"${total_amount:,.2f}")
-        col2.metric("Number of Transactions", len(transactions))
-        col3.metric("Average Amount", f"${avg_amount:,.2f}")
-        
-        # Transaction list with expanded details
-        for idx, transaction in enumerate(transactions):
-            with st.expander(
-                f"{transaction['date'].strftime('%Y-%m-%d')} - ${transaction['amount']:,.2f} - {transaction['description']}",
-                expanded=False
-            ):
-                edit_transaction(transaction, idx)
+        if count > SEARCH_TOTALS_LIMIT:
+            col1.metric("Total Amount", "—")
+            col2.metric("Number of Transactions", f"{SEARCH_TOTALS_LIMIT:,}+")
+            col3.metric("Average Amount", "—")
+            st.caption("Narrow the search or the filters to see totals")
+        else:
+            col1.metric("Total Amount", format_money(total_cents))
+            col2.metric("Number of Transactions", count)
+            col3.metric("Average Amount", format_money(average_cents))
+
+        show_transaction_page(user_id, filters)
     else:
         st.info("No transactions found")
 
+def show_transaction_page(user_id, filters):
+    page_size = st.selectbox("Rows per page", PAGE_SIZE_OPTIONS, key="txn_page_size")
+
+    # Restart from the first page whenever the filters or page size change
+    signature = repr((filters, page_size))
+    if st.session_state.get("txn_page_signature") != signature:
+        st.session_state.txn_page_signature = signature
+        st.session_state.txn_page_cursors = [None]
+        st.session_state.editing_transaction = None
+    cursors = st.session_state.txn_page_cursors
+
+    # Fetch one extra row to know whether there is a next page
+    transactions = get_filtered_transactions(user_id, *filters, after=cursors[-1], limit=page_size + 1)
+    has_next = len(transactions) > page_size
+    transactions = transactions[:page_size]
+
+    for transaction in transactions:
+        col1, col2 = st.columns([6, 1])
+        col1.write(f"{transaction['date'].strftime('%Y-%m-%d')} - {format_money(transaction['amount_cents'])} - {transaction['description']}")
+        if transaction.get('archived'):
+            col2.caption("Archived")
+        elif col2.button("Edit", key=f"edit_btn_{transaction['id']}"):
+            st.session_state.editing_transaction = transaction['id']
+        # Only the row being edited builds a form
+        if st.session_state.get("editing_transaction") == transaction['id']:
+            edit_transaction(transaction)
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("← Previous", disabled=len(cursors) == 1, key="txn_prev_page"):
+            cursors.pop()
+            st.session_state.editing_transaction = None
+            st.rerun()
+    with col2:
+        st.caption(f"Page {len(cursors)}")
+    with col3:
+        if st.button("Next →", disabled=not has_next, key="txn_next_page"):
+            last = transactions[-1]
+            # Search results are ordered by relevance first
+            cursors.append((last['rank'], last['date'], last['id']) if 'rank' in last else (last['date'], last['id']))
+            st.session_state.editing_transaction = None
+            st.rerun()
+
 def manage_categories():
     st.subheader("Manage Categories")
     
@@ -165,7 +233,7 @@ def manage_categories():
             st.rerun()
     
     # Display existing categories
-    categories = get_user_categories(st.session_state.user["id"])
+    categories = get_category_registry(st.session_state.user["id"])
     if categories:
         st.subheader("Current Categories")
         cols = st.columns(3)
@@ -185,106 +253,286 @@ def manage_categories():
                     unsafe_allow_html=True
                 )
 
+    manage_categorization_rules(categories)
+
+def manage_categorization_rules(categories):
+    st.subheader("Auto-categorization Rules")
+    st.caption("Imported transactions whose description contains the keyword get the rule's category. Higher priority wins.")
+    user_id = st.session_state.user["id"]
+
+    with st.form("rule_form", clear_on_submit=True):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            keyword = st.text_input("Keyword")
+            category = st.selectbox("Category", options=categories.names, format_func=categories.label)
+        with col2:
+            priority = st.number_input("Priority", value=100, step=1)
+        with col3:
+            min_amount = st.number_input("Min Amount (optional)", value=None, min_value=0.0, step=10.0)
+            max_amount = st.number_input("Max Amount (optional)", value=None, min_value=0.0, step=10.0)
+
+        if st.form_submit_button("Add Rule"):
+            if keyword.strip():
+                save_rule(user_id, keyword, category, int(priority), to_cents(min_amount), to_cents(max_amount))
+                st.success(f"Rule for '{keyword}' added successfully")
+                st.rerun()
+            else:
+                st.warning("Enter a keyword for the rule")
+
+    for rule in get_user_rules(user_id):
+        col1, col2 = st.columns([6, 1])
+        amount_range = ""
+        min_cents, max_cents = rule['min_amount_cents'], rule['max_amount_cents']
+        if min_cents is not None or max_cents is not None:
+            amount_range = f" (amount {format_money(min_cents or 0)} – {'∞' if max_cents is None else format_money(max_cents)})"
+        col1.write(f"**{rule['keyword']}** → {categories.label(rule['category'])}, priority {rule['priority']}{amount_range}")
+        if col2.button("Remove", key=f"delete_rule_{rule['id']}"):
+            delete_rule(user_id, rule['id'])
+            st.rerun()
+
 def import_transactions_from_csv(csv_file):
+    # The uploader keeps its file across reruns, so only import each upload once
+    upload_key = (csv_file.name, csv_file.size)
+    if st.session_state.get("imported_upload") == upload_key:
+        return
+
+    progress_bar = st.progress(0.0, text="Importing transactions...")
     try:
-        content = csv_file.read().decode('utf-8')
-        csv_data = csv.DictReader(io.StringIO(content))
-        
-        for row in csv_data:
-            try:
-                amount = float(row.get('amount', 0))
-                date = datetime.strptime(row.get('date', datetime.now().strftime('%Y-%m-%d')), '%Y-%m-%d')
-                description = row.get('description', '')
-                category = row.get('category', categorize_transaction(description))
-                tags = row.get('tags', '').split(',') if row.get('tags') else None
-                
-                save_transaction(
-                    st.session_state.user["id"],
-                    amount,
-                    category,
-                    description,
-                    date,
-                    tags=tags
-                )
-            except ValueError as e:
-                st.warning(f"Skipped invalid row: {str(e)}")
-        
-        st.success("CSV import completed successfully")
-        st.rerun()
+        result = import_csv(
+            st.session_state.user["id"],
+            csv_file,
+            progress=lambda fraction, rows: progress_bar.progress(
+                fraction, text=f"Importing transactions... {rows:,} rows read"
+            )
+        )
     except Exception as e:
+        progress_bar.empty()
         st.error(f"Error importing CSV: {str(e)}")
+        return
 
-def export_transactions_to_csv():
-    transactions = get_user_transactions(st.session_state.user["id"])
-    if transactions:
-        df = pd.DataFrame(transactions)
-        csv = df.to_csv(index=False)
-        
+    st.session_state["imported_upload"] = upload_key
+    progress_bar.progress(1.0, text=f"Imported {result.imported:,} transactions")
+    for line, message in result.errors:
+        st.warning(f"Skipped row {line}: {message}")
+    if result.skipped > len(result.errors):
+        st.warning(f"{result.skipped - len(result.errors):,} more invalid rows were skipped")
+    st.success(f"CSV import completed: {result.imported:,} imported, {result.skipped:,} skipped")
+
+def export_transactions_to_file(user_id, filters, export_format):
+    """Export the rows matching the list filters; rows are streamed from the database in chunks.
+
+    The export is generated into a spooled file and only read into memory for
+    the download button when it is at most DOWNLOAD_MAX_BYTES.
+    """
+    clause, params = _filter_clause(user_id, *filters)
+    date_range, categories, min_cents, max_cents, search = filters
+    archived = ()
+    if not search and reaches_archive(user_id, date_range):
+        archived = iter_archived_batches(user_id, date_range, categories, min_cents, max_cents)
+    try:
+        with st.spinner("Preparing export..."):
+            export_file, rows = export_to_file(user_id, clause, params, export_format, archived_batches=archived)
+    except Exception as e:
+        st.error(f"Failed to export transactions: {str(e)}")
+        return
+    with export_file:
+        if not rows:
+            st.warning("No transactions to export")
+            return
+        size = export_file.seek(0, os.SEEK_END)
+        if size > DOWNLOAD_MAX_BYTES:
+            st.error(
+                f"The export is {size / 2**20:,.0f} MB, over the {DOWNLOAD_MAX_BYTES // 2**20} MB download limit. "
+                "Narrow the filters or choose a compressed format."
+            )
+            return
+        export_file.seek(0)
+        file_name, mime = EXPORT_FORMATS[export_format]
         st.download_button(
-            label="Download CSV",
-            data=csv,
-            file_name="transactions.csv",
-            mime="text/csv"
+            label=f"Download {EXPORT_FORMAT_LABELS[export_format]} ({rows:,} rows)",
+            data=export_file.read(),
+            file_name=file_name,
+            mime=mime
         )
-    else:
-        st.warning("No transactions to export")
 
-def get_filtered_transactions(date_range, categories, min_amount, max_amount):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    query = """
-        SELECT id, amount, category, description, date, tags
-        FROM transactions
+def _filter_clause(user_id, date_range, categories, min_cents, max_cents, search=None):
+    # Compare the raw timestamp against a half-open range so the (user_id, date) index applies
+    start_date = date_range[0]
+    end_date = date_range[1] if len(date_range) > 1 else start_date
+    clause = """
         WHERE user_id = %s
-        AND date::date BETWEEN %s AND %s
-        AND amount BETWEEN %s AND %s
+        AND date >= %s AND date < %s
+        AND amount_cents BETWEEN %s AND %s
     """
-    params = [st.session_state.user["id"], date_range[0], date_range[1], min_amount, max_amount]
-    
+    params = [user_id, start_date, end_date + timedelta(days=1), min_cents, max_cents]
+
     if categories:
-        query += " AND category = ANY(%s)"
+        clause += " AND category = ANY(%s)"
         params.append(categories)
-    
-    query += " ORDER BY date DESC"
-    
+
+    matched = search_condition(search)
+    if matched is not None:
+        condition, search_params = matched
+        clause += f" AND {condition}"
+        params.extend(search_params)
+    return clause, params
+
+def _search_tier(cur, user_id, filters, condition, condition_params, after, limit):
+    # A common term fills a page within the newest few thousand rows, so the (user_id, date)
+    # index is scanned first, bounded. Rarer terms are looked up in the search indexes, which
+    # is cheap because they have few matches; the MATERIALIZED CTE stops the planner from
+    # turning that into an unbounded scan of the date index, which tsvector statistics
+    # often mislead it into.
+    clause, params = _filter_clause(user_id, *filters)
+    if after is not None:
+        clause += " AND (date, id) < (%s, %s)"
+        params.extend(after)
+    columns = "id, amount_cents, category, description, date, tags"
+
+    if limit is not None:
+        cur.execute(f"""
+            SELECT {columns} FROM (
+                SELECT {columns}, description_search FROM transactions{clause}
+                ORDER BY date DESC, id DESC LIMIT %s
+            ) AS recent
+            WHERE {condition}
+            ORDER BY date DESC, id DESC LIMIT %s
+        """, params + [SEARCH_SCAN_ROWS] + condition_params + [limit])
+        rows = cur.fetchall()
+        if len(rows) == limit:
+            return rows
+
+    query = f"""
+        WITH matches AS MATERIALIZED (
+            SELECT {columns} FROM transactions{clause} AND {condition}
+        )
+        SELECT * FROM matches ORDER BY date DESC, id DESC
+    """
+    params = params + condition_params
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
     cur.execute(query, params)
-    transactions = cur.fetchall()
-    
-    cur.close()
-    conn.close()
-    
-    if transactions:
-        return [
-            {
-                'id': t[0],
-                'amount': t[1],
-                'category': t[2],
-                'description': t[3],
-                'date': t[4],
-                'tags': t[5]
-            }
-            for t in transactions
-        ]
-    return []
-
-def edit_transaction(transaction, idx):
-    with st.form(f"edit_transaction_{idx}"):
+    return cur.fetchall()
+
+def _search_rows(user_id, filters, tiers, after, limit):
+    # Better tiers first; a page that ended inside a tier skips the tiers above it
+    rows = []
+    with cursor(user_id, readonly=True) as cur:
+        for rank, condition, condition_params in tiers:
+            if after is not None and rank > after[0]:
+                continue
+            tier_after = after[1:] if after is not None and rank == after[0] else None
+            remaining = None if limit is None else limit - len(rows)
+            rows.extend(
+                row + (rank,)
+                for row in _search_tier(cur, user_id, filters, condition, condition_params, tier_after, remaining)
+            )
+            if limit is not None and len(rows) >= limit:
+                break
+    return rows
+
+@instrument_query("get_filtered_transactions")
+def get_filtered_transactions(user_id, date_range, categories, min_cents, max_cents, search=None,
+                              after=None, limit=None):
+    """Matching transactions, newest first.
+
+    Pages are addressed by keyset: pass the (date, id) of the last row of the
+    previous page as `after` so each page is a bounded index range scan.
+    When the date range reaches into the archive, archived rows (marked
+    'archived') are merged in by the same keyset.
+
+    With search text, rows carry the 'rank' of their match tier (see
+    transaction_search), are ordered by rank and then newest first, and are
+    paged by (rank, date, id). Archived rows are not searched.
+    """
+    tiers = search_tiers(search)
+    if tiers:
+        rows = _search_rows(user_id, (date_range, categories, min_cents, max_cents), tiers, after, limit)
+    else:
+        clause, params = _filter_clause(user_id, date_range, categories, min_cents, max_cents)
+        query = "SELECT id, amount_cents, category, description, date, tags FROM transactions" + clause
+
+        if after is not None:
+            query += " AND (date, id) < (%s, %s)"
+            params.extend(after)
+
+        query += " ORDER BY date DESC, id DESC"
+
+        if limit is not None:
+            query += " LIMIT %s"
+            params.append(limit)
+
+        with cursor(user_id, readonly=True) as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+
+    transactions = [
+        {
+            'id': t[0],
+            'amount_cents': t[1],
+            'category': t[2],
+            'description': t[3],
+            'date': t[4],
+            'tags': t[5]
+        }
+        for t in rows
+    ]
+    if tiers:
+        for transaction, row in zip(transactions, rows):
+            transaction['rank'] = row[6]
+    elif reaches_archive(user_id, date_range):
+        archived = read_archive(user_id, date_range, categories, min_cents, max_cents, after, limit)
+        for row in archived:
+            row['archived'] = True
+        transactions = merge_pages(transactions, archived, limit)
+    return transactions
+
+@instrument_query("get_filtered_totals")
+def get_filtered_totals(user_id, date_range, categories, min_cents, max_cents, search=None):
+    """(count, total, average) in int cents over all matching transactions.
+
+    With search text at most SEARCH_TOTALS_LIMIT + 1 matches are read; when
+    there are more, count is SEARCH_TOTALS_LIMIT + 1 and total and average
+    are None.
+    """
+    clause, params = _filter_clause(user_id, date_range, categories, min_cents, max_cents, search)
+    query = "SELECT count(*), COALESCE(sum(amount_cents), 0)::bigint FROM transactions" + clause
+    if search_condition(search) is not None:
+        query = f"""
+            SELECT count(*), COALESCE(sum(amount_cents), 0)::bigint FROM (
+                SELECT amount_cents FROM transactions{clause} LIMIT %s
+            ) AS matches
+        """
+        params.append(SEARCH_TOTALS_LIMIT + 1)
+    with cursor(user_id, readonly=True) as cur:
+        cur.execute(query, params)
+        count, total = cur.fetchone()
+    if count > SEARCH_TOTALS_LIMIT:
+        return count, None, None
+    if not search and reaches_archive(user_id, date_range):
+        archived_count, archived_total = archived_totals(user_id, date_range, categories, min_cents, max_cents)
+        count += archived_count
+        total += archived_total
+    return count, total, round(total / count) if count else 0
+
+def edit_transaction(transaction):
+    with st.form(f"edit_transaction_{transaction['id']}"):
         col1, col2 = st.columns(2)
         with col1:
             new_amount = st.number_input(
                 "Amount",
-                value=float(transaction['amount']),
+                value=to_units(transaction['amount_cents']),
                 min_value=0.0,
                 step=1.0
             )
             
-            categories = get_user_categories(st.session_state.user["id"])
+            categories = get_category_registry(st.session_state.user["id"])
             new_category = st.selectbox(
                 "Category",
-                options=[cat["name"] for cat in categories],
-                index=[cat["name"] for cat in categories].index(transaction['category']),
-                format_func=lambda x: f"{next((c['icon'] for c in categories if c['name'] == x), '')} {x}"
+                options=categories.names,
+                index=categories.index(transaction['category']),
+                format_func=categories.label
             )
         
         with col2:
@@ -306,47 +554,40 @@ def edit_transaction(transaction, idx):
         if update:
             update_transaction(
                 transaction['id'],
-                new_amount,
+                to_cents(new_amount),
                 new_category,
                 new_description,
                 new_date,
                 new_tags
             )
+            st.session_state.editing_transaction = None
             st.success("Transaction updated successfully")
             st.rerun()
         
         if delete:
             delete_transaction(transaction['id'])
+            st.session_state.editing_transaction = None
             st.success("Transaction deleted successfully")
             st.rerun()
 
-def update_transaction(transaction_id, amount, category, description, date, tags):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute("""
+@instrument_query("update_transaction")
+def update_transaction(transaction_id, amount_cents, category, description, date, tags, uow=None):
+    """Update one of the session user's transactions; edits queued on one uow go out as a single batch"""
+    user_id = st.session_state.user["id"]
+    with unit_of_work(user_id, uow, "update_transaction") as uow:
+        uow.execute("""
             UPDATE transactions
-            SET amount = %s, category = %s, description = %s, date = %s, tags = %s
+            SET amount_cents = %s, category = %s, description = %s, date = %s, tags = %s
             WHERE id = %s AND user_id = %s
-        """, (amount, category, description, date, tags, transaction_id, st.session_state.user["id"]))
-        
-        conn.commit()
-    finally:
-        cur.close()
-        conn.close()
-
-def delete_transaction(transaction_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute("""
+        """, (amount_cents, category, description, date, tags, transaction_id, user_id))
+        uow.after_commit(invalidate_transactions, user_id)
+
+@instrument_query("delete_transaction")
+def delete_transaction(transaction_id, uow=None):
+    user_id = st.session_state.user["id"]
+    with unit_of_work(user_id, uow, "delete_transaction") as uow:
+        uow.execute("""
             DELETE FROM transactions
             WHERE id = %s AND user_id = %s
-        """, (transaction_id, st.session_state.user["id"]))
-        
-        conn.commit()
-    finally:
-        cur.close()
-        conn.close()
+        """, (transaction_id, user_id))
+        uow.after_commit(invalidate_transactions, user_id)
@@ -0,0 +1,161 @@
+import io
+import logging
+from datetime import datetime
+import pandas as pd
+from database import connection, invalidate_transactions
+from categorization import get_engine
+from metrics import instrument_query
+from money import CENTS_PER_UNIT
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+# Only the first errors are kept for display; the rest are counted
+MAX_REPORTED_ERRORS = 200
+# Beyond this many units float64 no longer holds every cent exactly
+MAX_AMOUNT = 2 ** 53 // CENTS_PER_UNIT
+# transactions.category is VARCHAR(50)
+MAX_CATEGORY_LENGTH = 50
+
+STAGING_COLUMNS = ['amount_cents', 'category', 'description', 'date', 'tags']
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    def add_errors(self, errors):
+        self.skipped += len(errors)
+        room = MAX_REPORTED_ERRORS - len(self.errors)
+        if room > 0:
+            self.errors.extend(errors[:room])
+
+def _pg_array(tags):
+    if not tags:
+        return None
+    items = []
+    for tag in tags:
+        tag = tag.strip()
+        if tag:
+            items.append('"' + tag.replace('\\', '\\\\').replace('"', '\\"') + '"')
+    return '{' + ','.join(items) + '}' if items else None
+
+def _validate_chunk(chunk, first_line, engine):
+    """Parse one chunk with vectorized conversions; returns (staging frame, [(line, message)])"""
+    size = len(chunk)
+    lines = pd.RangeIndex(first_line, first_line + size)
+    errors = pd.Series('', index=chunk.index)
+
+    if 'amount' in chunk:
+        raw_amount = chunk['amount'].str.strip()
+        amount = pd.to_numeric(raw_amount, errors='coerce')
+        errors = errors.mask(amount.isna(), 'invalid amount ' + raw_amount.map(repr))
+        errors = errors.mask(amount.abs() > MAX_AMOUNT, 'amount out of range')
+        # Out-of-range and invalid rows are dropped below; zero them so the cast cannot overflow
+        amount_cents = (amount.where(errors == '', 0) * CENTS_PER_UNIT).round().astype('int64')
+    else:
+        amount_cents = pd.Series(0, index=chunk.index, dtype='int64')
+
+    if 'date' in chunk:
+        raw_date = chunk['date'].str.strip()
+        date = pd.to_datetime(raw_date, format='%Y-%m-%d', errors='coerce')
+        errors = errors.mask((errors == '') & date.isna(), 'invalid date ' + raw_date.map(repr) + ', expected YYYY-MM-DD')
+    else:
+        date = pd.Series(pd.Timestamp(datetime.now().date()), index=chunk.index)
+
+    if 'category' in chunk:
+        category = chunk['category'].str.strip()
+        errors = errors.mask(
+            (errors == '') & (category.str.len() > MAX_CATEGORY_LENGTH),
+            f"category longer than {MAX_CATEGORY_LENGTH} characters"
+        )
+    else:
+        category = pd.Series('', index=chunk.index)
+
+    description = chunk['description'] if 'description' in chunk else pd.Series('', index=chunk.index)
+
+    valid = errors == ''
+    staging = pd.DataFrame({
+        'amount_cents': amount_cents,
+        'category': category,
+        'description': description,
+        'date': date,
+        'tags': chunk['tags'].str.split(',').map(_pg_array) if 'tags' in chunk else None,
+    })[valid]
+
+    needs_category = staging['category'] == ''
+    if needs_category.any():
+        staging.loc[needs_category, 'category'] = engine.categorize_many(
+            staging.loc[needs_category, 'description'],
+            staging.loc[needs_category, 'amount_cents']
+        )
+
+    invalid = ~valid.to_numpy()
+    chunk_errors = [(int(line), message) for line, message in zip(lines[invalid], errors[~valid])]
+    return staging, chunk_errors
+
+@instrument_query("import_csv")
+def import_csv(user_id, csv_file, chunk_size=CHUNK_SIZE, progress=None):
+    """Stream a CSV upload into transactions in one database transaction.
+
+    Rows are parsed and validated chunk by chunk, loaded into a temporary
+    staging table with COPY and merged at the end, so either every valid
+    row is imported or none is. progress(fraction, rows_read) is called
+    after each chunk.
+    """
+    result = ImportResult()
+    engine = get_engine(user_id)
+    total_size = getattr(csv_file, 'size', None)
+    reader = pd.read_csv(
+        csv_file,
+        chunksize=chunk_size,
+        dtype=str,
+        keep_default_na=False,
+        index_col=False,
+        encoding='utf-8'
+    )
+
+    with connection(user_id) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE import_staging (
+                    amount_cents BIGINT,
+                    category TEXT,
+                    description TEXT,
+                    date TIMESTAMP,
+                    tags TEXT[]
+                ) ON COMMIT DROP
+            """)
+
+            rows_read = 0
+            for chunk in reader:
+                staging, errors = _validate_chunk(chunk, rows_read + 2, engine)
+                rows_read += len(chunk)
+                result.add_errors(errors)
+
+                if not staging.empty:
+                    buffer = io.StringIO()
+                    staging.to_csv(buffer, header=False, index=False, columns=STAGING_COLUMNS)
+                    buffer.seek(0)
+                    cur.copy_expert(
+                        "COPY import_staging (amount_cents, category, description, date, tags) "
+                        "FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (category, description))",
+                        buffer
+                    )
+
+                if progress:
+                    position = csv_file.tell() if hasattr(csv_file, 'tell') else None
+                    fraction = min(position / total_size, 1.0) if total_size and position else 0.0
+                    progress(fraction, rows_read)
+
+            cur.execute("""
+                INSERT INTO transactions (user_id, amount_cents, category, description, date, tags)
+                SELECT %s, amount_cents, category, description, date, tags
+                FROM import_staging
+            """, (user_id,))
+            result.imported = cur.rowcount
+
+    invalidate_transactions(user_id)
+    logger.info(f"Imported {result.imported} transactions for user {user_id} ({result.skipped} skipped)")
+    return result
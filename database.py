@@ -3,19 +3,42 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 import streamlit as st
 import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from db_pool import ConnectionPool
+from migrate import run_migrations
+from partitioning import ensure_partitions
+from transaction_cache import TransactionCache, prune_change_log
+from category_registry import CategoryRegistry
+from sharding import ShardRouter, ShardRoutingError, configured_shards, ensure_id_range
+from replicas import CONNECT_TIMEOUT, ReplicaSet, configured_replicas
+from metrics import REGISTRY, instrument_query, observe_pool_wait
 
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
+CATEGORY_REGISTRY_KEY = "category_registry"
+# Checkouts retried when the user turns out to have moved to another shard
+MAX_ROUTE_ATTEMPTS = 3
+
+_pools = {}
+_replica_sets = {}
+
+def get_db_connection(shard=None):
+    """A new connection to the shard (the first configured one by default)"""
+    shards = dict(configured_shards())
+    dsn = shards[shard] if shard is not None else next(iter(shards.values()))
     try:
-        logger.info("Attempting database connection...")
-        conn = psycopg2.connect(
-            host=os.environ['PGHOST'],
-            database=os.environ['PGDATABASE'],
-            user=os.environ['PGUSER'],
-            password=os.environ['PGPASSWORD'],
-            port=os.environ['PGPORT']
-        )
+        logger.info(f"Attempting database connection{f' to shard {shard}' if shard else ''}...")
+        if dsn is not None:
+            conn = psycopg2.connect(dsn)
+        else:
+            conn = psycopg2.connect(
+                host=os.environ['PGHOST'],
+                database=os.environ['PGDATABASE'],
+                user=os.environ['PGUSER'],
+                password=os.environ['PGPASSWORD'],
+                port=os.environ['PGPORT']
+            )
         logger.info("Database connection successful")
         return conn
     except Exception as e:
@@ -24,170 +47,333 @@ def get_db_connection():
         st.error("Database connection error. Please try again.")
         raise
 
+@st.cache_resource
+def get_router():
+    """Process-wide shard router (see sharding)"""
+    router = ShardRouter([name for name, _ in configured_shards()], lambda: shard_connection(router.directory))
+    REGISTRY.register_gauges(
+        'shard_router', "Shard router statistics",
+        lambda: {(('stat', key),): value for key, value in router.stats().items()}
+    )
+    return router
+
+def _new_pool(connect):
+    return ConnectionPool(
+        connect,
+        size=int(os.environ.get('DB_POOL_SIZE', 5)),
+        max_overflow=int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+        timeout=float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        recycle=float(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        on_wait=observe_pool_wait
+    )
+
+@st.cache_resource
+def _shard_pool(shard):
+    pool = _new_pool(lambda: get_db_connection(shard))
+    _pools[shard] = pool
+    REGISTRY.register_gauges(
+        'db_pool', "Connection pool statistics",
+        lambda: {
+            (('shard', name), ('stat', key)): value
+            for name, shard_pool in list(_pools.items())
+            for key, value in shard_pool.stats().items()
+        }
+    )
+    return pool
+
+def get_pool(shard=None):
+    """Process-wide connection pool of the shard (the directory shard by default), shared by all sessions"""
+    return _shard_pool(shard or get_router().directory)
+
+@st.cache_resource
+def get_replicas(shard):
+    """The shard's ReplicaSet, or None when DB_REPLICAS lists no replicas for it"""
+    dsns = configured_replicas().get(shard)
+    if not dsns:
+        return None
+    replicas = ReplicaSet(
+        shard,
+        [
+            (f"{shard}/{index}", _new_pool(lambda dsn=dsn: psycopg2.connect(dsn, connect_timeout=CONNECT_TIMEOUT)))
+            for index, dsn in enumerate(dsns)
+        ],
+        lambda: shard_connection(shard)
+    )
+    _replica_sets[shard] = replicas
+    REGISTRY.register_gauges(
+        'db_replicas', "Read replica statistics per shard",
+        lambda: {
+            (('shard', name), ('stat', key)): value
+            for name, replica_set in list(_replica_sets.items())
+            for key, value in replica_set.stats().items()
+        }
+    )
+    REGISTRY.register_gauges(
+        'db_replica', "Lag and reads per replica",
+        lambda: {
+            (('replica', replica), ('stat', key)): value
+            for replica_set in list(_replica_sets.values())
+            for replica, stats in replica_set.replica_stats().items()
+            for key, value in stats.items()
+        }
+    )
+    logger.info(f"Shard {shard} reads from {len(dsns)} replica(s)")
+    return replicas
+
+@contextmanager
+def _transaction(pool, conn, after_commit=None):
+    # Commit on success and roll back on error; a connection that cannot roll back is discarded
+    discard = False
+    try:
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+            raise
+        # The write has committed, so a failure here is logged rather than raised to the caller
+        if after_commit is not None:
+            try:
+                after_commit(conn)
+            except Exception as e:
+                logger.error(f"After-commit step failed: {str(e)}")
+    finally:
+        pool.release(conn, discard=discard)
+
+def _checkout(user_id):
+    router = get_router()
+    for _ in range(MAX_ROUTE_ATTEMPTS):
+        shard = router.shard_for(user_id)
+        pool = get_pool(shard)
+        conn = pool.acquire()
+        try:
+            if user_id is None or router.holds(conn, user_id):
+                return shard, pool, conn
+            conn.rollback()
+        except Exception:
+            pool.release(conn, discard=True)
+            raise
+        pool.release(conn)
+        # The user moved since their route was cached
+        router.forget(user_id)
+    raise ShardRoutingError(f"Could not settle the shard of user {user_id}")
+
+def _replica_checkout(user_id):
+    router = get_router()
+    replicas = get_replicas(router.shard_for(user_id))
+    checkout = replicas.acquire(user_id) if replicas is not None else None
+    if checkout is None:
+        return None
+    pool, conn = checkout
+    try:
+        # Replicas replay moved_users like everything else; the shard lock only matters on primaries
+        if router.holds(conn, user_id, lock=False):
+            return checkout
+    except Exception as e:
+        logger.warning(f"Replica read for user {user_id} failed, reading from the primary: {str(e)}")
+        pool.release(conn, discard=True)
+        return None
+    pool.release(conn)
+    router.forget(user_id)
+    return None
+
+@contextmanager
+def connection(user_id=None, readonly=False):
+    """Check out a pooled connection to the user's shard (the directory shard without a user),
+    committing on success and rolling back on error.
+
+    readonly=True tags a read, which a replica of the shard may serve (see
+    replicas). Any other connection for a user counts as a write: on commit
+    it records the primary's WAL position so the user's next reads see it.
+    """
+    if readonly and user_id is not None:
+        checkout = _replica_checkout(user_id)
+        if checkout is not None:
+            pool, conn = checkout
+            with _transaction(pool, conn):
+                yield conn
+            return
+
+    shard, pool, conn = _checkout(user_id)
+    replicas = get_replicas(shard) if user_id is not None and not readonly else None
+    after_commit = (lambda conn: replicas.note_write(conn, user_id)) if replicas is not None else None
+    with _transaction(pool, conn, after_commit):
+        yield conn
+
+@contextmanager
+def shard_connection(shard):
+    """Pooled connection to a named shard, for admin jobs and moves; no per-user routing"""
+    pool = get_pool(shard)
+    conn = pool.acquire()
+    with _transaction(pool, conn):
+        yield conn
+
+@contextmanager
+def cursor(user_id=None, dict_rows=False, readonly=False):
+    """Pooled cursor on the user's shard; the surrounding transaction commits when the block exits cleanly"""
+    with connection(user_id, readonly) as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor if dict_rows else None)
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+@contextmanager
+def shard_cursor(shard, dict_rows=False):
+    with shard_connection(shard) as conn:
+        cur = conn.cursor(cursor_factory=RealDictCursor if dict_rows else None)
+        try:
+            yield cur
+        finally:
+            cur.close()
+
+def for_each_shard(fn, shards=None):
+    """{shard: fn(shard)} for every shard (or the given ones), run concurrently; for admin-wide jobs"""
+    shards = get_router().shards if shards is None else list(shards)
+    if len(shards) == 1:
+        return {shards[0]: fn(shards[0])}
+    with ThreadPoolExecutor(len(shards), thread_name_prefix="shard") as executor:
+        futures = {shard: executor.submit(fn, shard) for shard in shards}
+        return {shard: future.result() for shard, future in futures.items()}
+
+@st.cache_resource
 def init_database():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
+    """Apply pending schema migrations and create upcoming partitions on every shard once per process"""
+    router = get_router()
+
+    def init_shard(shard):
+        with shard_connection(shard) as conn:
+            applied = run_migrations(conn)
+            ensure_id_range(conn, router.shards.index(shard))
+            ensure_partitions(conn)
+            prune_change_log(conn)
+        return applied
+
     try:
-        # Create tables in proper order
-        logger.info("Creating database tables...")
-        
-        # Users table first
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                email VARCHAR(255) UNIQUE NOT NULL,
-                google_id VARCHAR(255) UNIQUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        logger.info("Users table created successfully")
-        
-        # Categories table second
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS transaction_categories (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id),
-                name VARCHAR(50) NOT NULL,
-                icon VARCHAR(20),
-                color VARCHAR(20),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, name)
-            )
-        ''')
-        logger.info("Transaction categories table created successfully")
-        
-        # Transactions table third
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id),
-                amount DECIMAL(10,2) NOT NULL,
-                category VARCHAR(50),
-                description TEXT,
-                date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                bank_reference VARCHAR(255),
-                tags TEXT[]
-            )
-        ''')
-        logger.info("Transactions table created successfully")
-        
-        # Budgets table last
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS budgets (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id),
-                category VARCHAR(50),
-                amount DECIMAL(10,2),
-                period VARCHAR(20),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, category, period)
-            )
-        ''')
-        logger.info("Budgets table created successfully")
-        
-        conn.commit()
-        logger.info("All tables created successfully")
-        
+        logger.info("Running database migrations...")
+        applied = for_each_shard(init_shard)
+        for shard, versions in applied.items():
+            logger.info(f"Database schema of shard {shard} up to date ({len(versions)} migration(s) applied)")
+        return True
     except Exception as e:
-        conn.rollback()
         logger.error(f"Database initialization error: {str(e)}")
         raise
-    finally:
-        cur.close()
-        conn.close()
 
-@st.cache_data(ttl=300)
+@st.cache_resource
+def get_transaction_cache():
+    """Process-wide transaction cache shared by all sessions"""
+    cache = TransactionCache(
+        lambda user_id: connection(user_id, readonly=True),
+        max_users=int(os.environ.get('TRANSACTION_CACHE_MAX_USERS', 256)),
+        max_rows=int(os.environ.get('TRANSACTION_CACHE_MAX_ROWS', 500000))
+    )
+    REGISTRY.register_gauges(
+        'transaction_cache', "Transaction cache statistics",
+        lambda: {(('stat', key),): value for key, value in cache.stats().items()}
+    )
+    return cache
+
+def invalidate_transactions(user_id):
+    """Write hook: call after any change to a user's transactions"""
+    get_transaction_cache().invalidate(user_id)
+
+@instrument_query("get_user_transactions")
 def get_user_transactions(user_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+    """The user's transactions as columnar.TransactionColumns, newest first"""
     try:
-        cur.execute("""
-            SELECT * FROM transactions 
-            WHERE user_id = %s 
-            ORDER BY date DESC
-        """, (user_id,))
-        return cur.fetchall()
+        return get_transaction_cache().get(user_id)
     except Exception as e:
         logger.error(f"Error fetching transactions: {str(e)}")
-        return []
-    finally:
-        cur.close()
-        conn.close()
+        from columnar import TransactionColumns
+        return TransactionColumns.empty()
+
+DEFAULT_CATEGORIES = [
+    ('Food', '🍽️', '#FF6B6B'),
+    ('Transport', '🚗', '#4ECDC4'),
+    ('Entertainment', '🎮', '#45B7D1'),
+    ('Shopping', '🛍️', '#96CEB4'),
+    ('Bills', '📄', '#FFEEAD'),
+    ('Other', '📌', '#D4D4D4')
+]
 
+@instrument_query("seed_default_categories")
+def seed_default_categories(user_id, uow=None):
+    """Insert the default categories for a new user; existing names are left alone"""
+    from unit_of_work import unit_of_work
+
+    with unit_of_work(user_id, uow, "seed_default_categories") as uow:
+        uow.insert(
+            'transaction_categories', ('user_id', 'name', 'icon', 'color'),
+            [(user_id, name, icon, color) for name, icon, color in DEFAULT_CATEGORIES],
+            conflict=('user_id', 'name')
+        )
+        uow.after_commit(invalidate_category_registry, user_id)
+
+@instrument_query("get_user_categories")
 def get_user_categories(user_id):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
     try:
-        cur.execute("""
-            SELECT name, icon, color FROM transaction_categories 
-            WHERE user_id = %s 
-            ORDER BY name
-        """, (user_id,))
-        categories = cur.fetchall()
-        if not categories:
-            # Insert default categories if none exist
-            default_categories = [
-                ('Food', '🍽️', '#FF6B6B'),
-                ('Transport', '🚗', '#4ECDC4'),
-                ('Entertainment', '🎮', '#45B7D1'),
-                ('Shopping', '🛍️', '#96CEB4'),
-                ('Bills', '📄', '#FFEEAD'),
-                ('Other', '📌', '#D4D4D4')
-            ]
-            for cat in default_categories:
-                cur.execute("""
-                    INSERT INTO transaction_categories (user_id, name, icon, color)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (user_id, name) DO NOTHING
-                """, (user_id, cat[0], cat[1], cat[2]))
-            conn.commit()
+        with cursor(user_id, dict_rows=True, readonly=True) as cur:
             cur.execute("""
-                SELECT name, icon, color FROM transaction_categories 
-                WHERE user_id = %s 
+                SELECT name, icon, color FROM transaction_categories
+                WHERE user_id = %s
                 ORDER BY name
             """, (user_id,))
-            categories = cur.fetchall()
-        return categories
+            return cur.fetchall()
     except Exception as e:
         logger.error(f"Error fetching categories: {str(e)}")
         return []
-    finally:
-        cur.close()
-        conn.close()
 
-def save_transaction(user_id, amount, category, description, date=None, bank_reference=None, tags=None):
-    conn = get_db_connection()
-    cur = conn.cursor()
+def get_category_registry(user_id):
+    """The user's categories, loaded once per session until save_category changes them"""
+    cached = st.session_state.get(CATEGORY_REGISTRY_KEY)
+    if cached is not None and cached[0] == user_id:
+        return cached[1]
+    registry = CategoryRegistry(get_user_categories(user_id))
+    # An empty result may be a failed read, so only non-empty registries are kept
+    if registry:
+        st.session_state[CATEGORY_REGISTRY_KEY] = (user_id, registry)
+    return registry
+
+def invalidate_category_registry(user_id):
+    cached = st.session_state.get(CATEGORY_REGISTRY_KEY)
+    if cached is not None and cached[0] == user_id:
+        del st.session_state[CATEGORY_REGISTRY_KEY]
+
+@instrument_query("save_transaction")
+def save_transaction(user_id, amount_cents, category, description, date=None, bank_reference=None, tags=None,
+                     uow=None):
+    """The new transaction's id; with uow, a unit_of_work.Pending holding it once uow commits"""
+    from unit_of_work import unit_of_work
+
     try:
-        cur.execute("""
-            INSERT INTO transactions (user_id, amount, category, description, date, bank_reference, tags)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (user_id, amount, category, description, date, bank_reference, tags))
-        conn.commit()
+        with unit_of_work(user_id, uow, "save_transaction") as own:
+            created = own.insert(
+                'transactions',
+                ('user_id', 'amount_cents', 'category', 'description', 'date', 'bank_reference', 'tags'),
+                [(user_id, amount_cents, category, description, date, bank_reference, tags)],
+                returning='id',
+                template="(%s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP), %s, %s)"
+            )
+            own.after_commit(invalidate_transactions, user_id)
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error saving transaction: {str(e)}")
         raise
-    finally:
-        cur.close()
-        conn.close()
+    return created if uow is not None else created.id
 
+@instrument_query("save_category")
 def save_category(user_id, name, icon, color):
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        cur.execute("""
-            INSERT INTO transaction_categories (user_id, name, icon, color)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (user_id, name) 
-            DO UPDATE SET icon = EXCLUDED.icon, color = EXCLUDED.color
-        """, (user_id, name, icon, color))
-        conn.commit()
+        with cursor(user_id) as cur:
+            cur.execute("""
+                INSERT INTO transaction_categories (user_id, name, icon, color)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (user_id, name)
+                DO UPDATE SET icon = EXCLUDED.icon, color = EXCLUDED.color
+            """, (user_id, name, icon, color))
+        invalidate_category_registry(user_id)
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error saving category: {str(e)}")
         raise
-    finally:
-        cur.close()
-        conn.close()
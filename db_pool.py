@@ -0,0 +1,163 @@
+import threading
+import time
+import logging
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the wait limit"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of database connections shared by every session in the process.
+
+    `size` connections are kept open between checkouts; up to `max_overflow`
+    extra connections may be opened under load and are closed again when
+    returned. Checkouts wait at most `timeout` seconds for a free slot.
+    """
+
+    def __init__(self, connect, size=5, max_overflow=10, timeout=10.0,
+                 recycle=1800, ping_after=10.0, on_wait=None):
+        self._connect = connect
+        self._on_wait = on_wait
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = []  # stack of (conn, last_used)
+        self._created_at = {}
+        self._in_use = 0
+        self._stats = {
+            'checkouts': 0,
+            'connections_created': 0,
+            'connections_closed': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'peak_in_use': 0,
+        }
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        conn = None
+        last_used = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._in_use + len(self._idle) < self.size + self.max_overflow:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"No database connection available after {timeout:.1f}s "
+                        f"({self._in_use} in use)"
+                    )
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            waited = time.monotonic() - start
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+
+        if self._on_wait is not None:
+            self._on_wait(waited)
+
+        try:
+            if conn is not None and not self._is_healthy(conn, last_used):
+                self._close(conn)
+                conn = None
+            if conn is None:
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return conn
+
+    def release(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception as e:
+                logger.warning(f"Discarding connection that failed to reset: {str(e)}")
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            keep = not discard and not conn.closed and len(self._idle) < self.size
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+        if not keep:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats['in_use'] = self._in_use
+            stats['idle'] = len(self._idle)
+            stats['size'] = self.size
+            stats['max_overflow'] = self.max_overflow
+        checkouts = stats['checkouts']
+        stats['wait_time_avg'] = stats['wait_time_total'] / checkouts if checkouts else 0.0
+        return stats
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._created_at[id(conn)] = time.monotonic()
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _close(self, conn):
+        with self._cond:
+            self._created_at.pop(id(conn), None)
+            self._stats['connections_closed'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        now = time.monotonic()
+        created_at = self._created_at.get(id(conn), now)
+        if self.recycle and now - created_at > self.recycle:
+            return False
+        if now - last_used < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled connection failed health check: {str(e)}")
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+            return False
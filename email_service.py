@@ -1,46 +1,168 @@
+import os
+import time
+import queue
 import smtplib
+import threading
+import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import streamlit as st
-from database import get_user_transactions
-import pandas as pd
+from money import format_money
 
-def send_monthly_report(user_email, user_id):
-    # Get transaction data
-    transactions = get_user_transactions(user_id)
-    df = pd.DataFrame(transactions)
-    
-    # Create report content
-    total_spent = df['amount'].sum()
-    top_categories = df.groupby('category')['amount'].sum().nlargest(5)
-    
-    # Create email content
+logger = logging.getLogger(__name__)
+
+DEFAULT_SMTP_HOST = 'smtp.gmail.com'
+DEFAULT_SMTP_PORT = 587
+# Reconnect after this many messages; providers drop long-lived sessions
+MAX_MESSAGES_PER_CONNECTION = 100
+
+def _setting(name, default=None):
+    """Environment variable first, then Streamlit secrets"""
+    value = os.environ.get(name)
+    if value is not None:
+        return value
+    try:
+        return st.secrets[name]
+    except Exception:
+        return default
+
+def get_smtp_settings():
+    """SMTP_HOST/SMTP_PORT/SMTP_STARTTLS let a local SMTP sink stand in for the real server"""
+    return {
+        'host': _setting('SMTP_HOST', DEFAULT_SMTP_HOST),
+        'port': int(_setting('SMTP_PORT', DEFAULT_SMTP_PORT)),
+        'starttls': str(_setting('SMTP_STARTTLS', 'true')).lower() in ('1', 'true', 'yes'),
+        'username': _setting('EMAIL_USERNAME'),
+        'password': _setting('EMAIL_PASSWORD'),
+        'from_addr': _setting('EMAIL_FROM'),
+        'timeout': float(_setting('SMTP_TIMEOUT', 30)),
+    }
+
+class RateLimiter:
+    """Token bucket shared by every sender thread"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+class SMTPConnectionPool:
+    """A few persistent SMTP sessions reused across messages.
+
+    Sessions are opened lazily, checked out one per sender, and dropped after
+    an error or MAX_MESSAGES_PER_CONNECTION messages.
+    """
+
+    def __init__(self, settings, size=2, max_messages=MAX_MESSAGES_PER_CONNECTION):
+        self.settings = settings
+        self.size = size
+        self.max_messages = max_messages
+        self._slots = queue.LifoQueue()
+        for _ in range(size):
+            self._slots.put(None)
+
+    def _connect(self):
+        settings = self.settings
+        smtp = smtplib.SMTP(settings['host'], settings['port'], timeout=settings['timeout'])
+        if settings['starttls']:
+            smtp.starttls()
+        if settings['username']:
+            smtp.login(settings['username'], settings['password'])
+        return [smtp, 0]
+
+    def send(self, msg):
+        slot = self._slots.get()
+        try:
+            if slot is None:
+                slot = self._connect()
+            slot[0].send_message(msg)
+            slot[1] += 1
+            if slot[1] >= self.max_messages:
+                self._quit(slot)
+                slot = None
+        except Exception:
+            if slot is not None:
+                self._quit(slot)
+            slot = None
+            raise
+        finally:
+            self._slots.put(slot)
+
+    def _quit(self, slot):
+        try:
+            slot[0].quit()
+        except Exception:
+            try:
+                slot[0].close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        slots = []
+        for _ in range(self.size):
+            slot = self._slots.get()
+            if slot is not None:
+                self._quit(slot)
+            slots.append(None)
+        for slot in slots:
+            self._slots.put(slot)
+
+def render_report(user_email, summary, from_addr, title='Monthly Financial Report'):
+    """Build the report message from a report_queries.PeriodSummary"""
     msg = MIMEMultipart()
-    msg['Subject'] = 'Monthly Financial Report'
-    msg['From'] = st.secrets["EMAIL_FROM"]
+    msg['Subject'] = title
+    msg['From'] = from_addr
     msg['To'] = user_email
-    
+
+    categories = '\n    '.join(
+        f"{name:<20} {format_money(cents)}" for name, cents in summary.top_categories
+    ) or 'No spending recorded'
     body = f"""
-    Monthly Financial Summary
-    
-    Total Spent: ${total_spent:.2f}
-    
+    {title.replace('Report', 'Summary')}
+
+    Total Spent: {format_money(summary.total_spent)}
+    Transactions: {summary.transaction_count}
+    Average Transaction: {format_money(summary.average_transaction)}
+    Largest Transaction: {format_money(summary.largest_transaction)}
+
     Top Spending Categories:
-    {top_categories.to_string()}
-    
-    View your full dashboard at: http://localhost:5000
+    {categories}
+
+    View your full dashboard at: {_setting('APP_URL', 'http://localhost:5000')}
     """
-    
+
     msg.attach(MIMEText(body, 'plain'))
-    
-    # Send email
+    return msg
+
+def send_monthly_report(user_email, user_id):
+    from report_dispatch import report_period
+    from report_queries import window_summary
+
+    start, end = report_period('Monthly')
+    summary = window_summary(user_id, start, end)
+    settings = get_smtp_settings()
+    pool = SMTPConnectionPool(settings, size=1)
     try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(st.secrets["EMAIL_USERNAME"], st.secrets["EMAIL_PASSWORD"])
-        server.send_message(msg)
-        server.quit()
+        pool.send(render_report(user_email, summary, settings['from_addr']))
         return True
     except Exception as e:
         st.error(f"Failed to send email: {str(e)}")
         return False
+    finally:
+        pool.close_all()
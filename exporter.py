@@ -0,0 +1,141 @@
+import io
+import csv
+import gzip
+import tempfile
+import logging
+from database import connection
+from metrics import instrument_query
+from money import CENTS_PER_UNIT, DECIMAL_PRECISION, to_arrow_decimal
+
+logger = logging.getLogger(__name__)
+
+# Files carry amount as a decimal in currency units; the table stores amount_cents
+EXPORT_COLUMNS = ['id', 'amount', 'category', 'description', 'date', 'bank_reference', 'tags']
+AMOUNT_DECIMAL = f"(amount_cents::numeric / {CENTS_PER_UNIT})::numeric({DECIMAL_PRECISION}, 2) AS amount"
+# (file name, MIME type) per format
+EXPORT_FORMATS = {
+    'csv': ('transactions.csv', 'text/csv'),
+    'csv.gz': ('transactions.csv.gz', 'application/gzip'),
+    'parquet': ('transactions.parquet', 'application/vnd.apache.parquet'),
+}
+# Rows fetched per round trip from the server-side cursor and written per Parquet row group
+CHUNK_ROWS = 50000
+# Exports up to this size stay in memory; larger ones spill to a temporary file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+def select_list(amount):
+    """EXPORT_COLUMNS as a select list, with amount replaced by the given expression"""
+    return ', '.join(amount if column == 'amount' else column for column in EXPORT_COLUMNS)
+
+def _select(where_clause, amount=AMOUNT_DECIMAL):
+    return f"SELECT {select_list(amount)} FROM transactions {where_clause} ORDER BY date DESC, id DESC"
+
+def _csv_value(value):
+    # Match COPY's CSV output so archived rows look like live ones
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return '{' + ','.join(value) + '}'
+    return value
+
+def _write_csv(cur, where_clause, params, out, archived_batches):
+    # COPY streams the result in the server's send buffer sized pieces straight into out
+    query = cur.mogrify(_select(where_clause), params).decode()
+    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+    rows_written = cur.rowcount
+
+    text = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(text)
+    for batch in archived_batches:
+        for row in batch.to_pylist():
+            writer.writerow([_csv_value(row[column]) for column in EXPORT_COLUMNS])
+        rows_written += batch.num_rows
+    text.detach()
+    return rows_written
+
+def parquet_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ('id', pa.int64()),
+        ('amount', pa.decimal128(DECIMAL_PRECISION, 2)),
+        ('category', pa.string()),
+        ('description', pa.string()),
+        ('date', pa.timestamp('us')),
+        ('bank_reference', pa.string()),
+        ('tags', pa.list_(pa.string())),
+    ])
+
+def to_record_batch(rows):
+    """A parquet_schema() record batch from rows selected with select_list('amount_cents')"""
+    import pyarrow as pa
+
+    schema = parquet_schema()
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    arrays = [
+        to_arrow_decimal(column) if field.name == 'amount' else pa.array(column, type=field.type)
+        for column, field in zip(columns, schema)
+    ]
+    return pa.record_batch(arrays, schema=schema)
+
+def _write_parquet(conn, where_clause, params, out, chunk_rows, archived_batches):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow")
+
+    schema = parquet_schema()
+    rows_written = 0
+    # A named cursor keeps the result on the server; fetchmany pulls one chunk at a time
+    with conn.cursor(name='transactions_export') as cur:
+        cur.itersize = chunk_rows
+        # Cents arrive as ints and become decimals column-wise, not through a Decimal per row
+        cur.execute(_select(where_clause, 'amount_cents'), params)
+        with pq.ParquetWriter(out, schema, compression='snappy') as writer:
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                writer.write_table(pa.Table.from_batches([to_record_batch(rows)]), row_group_size=chunk_rows)
+                rows_written += len(rows)
+            for batch in archived_batches:
+                writer.write_table(pa.Table.from_batches([batch.select(schema.names)]), row_group_size=chunk_rows)
+                rows_written += batch.num_rows
+            if not rows_written:
+                writer.write_table(schema.empty_table())
+    return rows_written
+
+@instrument_query("export_transactions")
+def export_transactions(user_id, where_clause, params, fmt, out, chunk_rows=CHUNK_ROWS, archived_batches=()):
+    """Stream the user's transactions matching where_clause into the binary file out; returns rows written.
+
+    where_clause/params come from the transaction list's filters, e.g.
+    components.transactions._filter_clause. archived_batches (see
+    archive.iter_archived_batches) are appended after the live rows, which
+    are all newer. Memory use is bounded by one chunk regardless of how many
+    rows match.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    with connection(user_id, readonly=True) as conn:
+        if fmt == 'parquet':
+            return _write_parquet(conn, where_clause, params, out, chunk_rows, archived_batches)
+        with conn.cursor() as cur:
+            if fmt == 'csv.gz':
+                with gzip.GzipFile(fileobj=out, mode='wb') as compressed:
+                    return _write_csv(cur, where_clause, params, compressed, archived_batches)
+            return _write_csv(cur, where_clause, params, out, archived_batches)
+
+def export_to_file(user_id, where_clause, params, fmt, chunk_rows=CHUNK_ROWS, archived_batches=()):
+    """(spooled temporary file positioned at the start, rows written); the caller closes the file"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        rows = export_transactions(user_id, where_clause, params, fmt, spool, chunk_rows, archived_batches)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    logger.info(f"Exported {rows} transactions as {fmt}")
+    return spool, rows
@@ -0,0 +1,74 @@
+import threading
+import logging
+from collections import OrderedDict
+import streamlit as st
+from database import get_transaction_cache
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 512
+
+class FigureCache:
+    """LRU of built dashboard figures keyed by (user, chart, params, data version).
+
+    A changed data version makes old keys unreachable, so stale figures are
+    never served; invalidate() additionally frees a user's entries as soon as
+    their data is written. Cached figures are shared and must not be mutated.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (user_id, chart, params, version) -> value
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get_or_build(self, user_id, chart, version, params, build):
+        key = (user_id, chart, params, version)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                return self._entries[key]
+            self._stats['misses'] += 1
+
+        value = build()
+
+        with self._lock:
+            # Older versions of this chart can no longer be hit
+            for stale in [k for k in self._entries if k[:3] == key[:3]]:
+                del self._entries[stale]
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return value
+
+    def invalidate(self, user_id):
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == user_id]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+@st.cache_resource
+def get_figure_cache():
+    """Process-wide figure cache, dropped per user whenever their transactions change"""
+    cache = FigureCache()
+    get_transaction_cache().add_listener(cache.invalidate)
+    REGISTRY.register_gauges(
+        'figure_cache', "Dashboard figure cache statistics",
+        lambda: {(('stat', key),): value for key, value in cache.stats().items()}
+    )
+    return cache
+
+def invalidate_figures(user_id):
+    """Write hook for data behind the dashboard that is not covered by invalidate_transactions"""
+    get_figure_cache().invalidate(user_id)
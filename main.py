@@ -2,10 +2,9 @@ import streamlit as st
 import logging
 import traceback
 import os
-from components import dashboard, budget, transactions
 import database
-from auth import initialize_mock_data
-import visualization as viz
+import metrics
+import startup_profiler
 
 # Must call set_page_config as the first Streamlit command
 st.set_page_config(
@@ -21,6 +20,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Page modules load on first use, so the landing page never imports pandas or plotly
+PAGES = {
+    "Dashboard": ("components.dashboard", "show_dashboard"),
+    "Transactions": ("components.transactions", "show_transactions"),
+    "Budget": ("components.budget", "show_budget"),
+}
+
 # Load and inject custom CSS
 def load_css():
     try:
@@ -44,21 +50,11 @@ def main():
         # Add debug logging
         logger.info("Starting main application flow")
         
-        # Initialize database with better error handling
+        metrics.start_file_exporter()
+
+        # Apply schema migrations (runs once per process)
         try:
             database.init_database()
-            logger.info("Database initialized successfully")
-            
-            # Verify database connection
-            conn = database.get_db_connection()
-            if conn:
-                logger.info("Database connection established")
-                conn.close()
-                logger.info("Database connection verified and closed")
-            else:
-                logger.error("Failed to establish database connection")
-                raise Exception("Database connection failed")
-            
         except Exception as db_error:
             logger.error(f"Database initialization error: {str(db_error)}")
             st.error("Failed to initialize database. Please try again.")
@@ -76,10 +72,11 @@ def main():
             logger.info("User not authenticated, showing landing page")
             # Show landing page for non-authenticated users
             try:
-                from components.landing import show_landing
+                show_landing = startup_profiler.load("components.landing").show_landing
                 logger.info("Landing page component imported successfully")
                 st.empty()  # Clear any existing content
-                show_landing()
+                with startup_profiler.first_render("Landing"):
+                    show_landing()
                 logger.info("Landing page rendered successfully")
             except Exception as e:
                 logger.error(f"Failed to load landing page: {str(e)}")
@@ -89,27 +86,17 @@ def main():
             # Handle Get Started button click
             if st.session_state.get("cta_button", False):
                 # Create mock user for demo
-                conn = database.get_db_connection()
-                cur = conn.cursor()
                 try:
-                    # Insert mock user
-                    cur.execute(
-                        "INSERT INTO users (id, email) VALUES (%s, %s) ON CONFLICT (id) DO NOTHING",
-                        (1, "dev@example.com")
-                    )
-                    conn.commit()
-                    
+                    # The mock user and their sample data go in as one transaction
+                    with startup_profiler.load("unit_of_work").UnitOfWork(1, "onboarding") as uow:
+                        uow.insert('users', ('id', 'email'), [(1, "dev@example.com")], conflict=('id',))
+                        startup_profiler.load("auth").initialize_mock_data(1, uow)
+
                     # Set session state
                     st.session_state["user"] = {"id": 1, "email": "dev@example.com"}
-                    
-                    # Initialize mock data after user exists
-                    initialize_mock_data(1)
                     st.rerun()
                 except Exception as e:
                     st.error(f"Failed to initialize user: {str(e)}")
-                finally:
-                    cur.close()
-                    conn.close()
             return
         
         # Show navigation and content for authenticated users
@@ -136,14 +123,13 @@ def main():
         
         try:
             logger.info(f"Loading {selected_page} page...")
-            if selected_page == "Dashboard":
-                dashboard.show_dashboard()
-            elif selected_page == "Transactions":
-                transactions.show_transactions()
-            elif selected_page == "Budget":
-                budget.show_budget()
-            elif selected_page == "Settings":
-                show_settings()
+            with metrics.timed("page_render_seconds", "Page render time in seconds", page=selected_page), \
+                    startup_profiler.first_render(selected_page):
+                if selected_page in PAGES:
+                    module_name, function_name = PAGES[selected_page]
+                    getattr(startup_profiler.load(module_name), function_name)()
+                elif selected_page == "Settings":
+                    show_settings()
             logger.info(f"{selected_page} page loaded successfully")
         except Exception as page_error:
             logger.error(f"Error in {selected_page} page: {str(page_error)}")
@@ -159,10 +145,17 @@ def main():
 def show_settings():
     st.subheader("Settings")
     
+    report_dispatch = startup_profiler.load("report_dispatch")
+
     # Email report settings
     st.subheader("Email Reports")
-    email = st.text_input("Email Address", value=st.session_state.user.get("email", ""))
-    frequency = st.selectbox("Report Frequency", ["Weekly", "Monthly"])
+    subscription = report_dispatch.get_subscription(st.session_state.user["id"]) or {}
+    email = st.text_input("Email Address", value=subscription.get("email") or st.session_state.user.get("email", ""))
+    frequency = st.selectbox(
+        "Report Frequency",
+        list(report_dispatch.FREQUENCIES),
+        index=list(report_dispatch.FREQUENCIES).index(subscription.get("frequency", "Weekly"))
+    )
     if st.button("Save Email Preferences"):
         try:
             save_email_preferences(email, frequency)
@@ -172,9 +165,43 @@ def show_settings():
             logger.error(traceback.format_exc())
             st.error("Failed to save email preferences. Please try again.")
 
+    if metrics.is_admin(st.session_state.user):
+        show_metrics_panel()
+
+def show_metrics_panel():
+    st.subheader("Performance Metrics")
+    rows = []
+    for (name, labels), histogram in metrics.REGISTRY.histograms():
+        _, total, count = histogram.snapshot()
+        if not count:
+            continue
+        is_latency = histogram.buckets == metrics.LATENCY_BUCKETS
+        scale = 1000 if is_latency else 1
+        rows.append({
+            "Metric": name,
+            "Labels": ", ".join(f"{key}={value}" for key, value in labels),
+            "Count": count,
+            "Mean": total / count * scale,
+            "p50": histogram.quantile(0.5) * scale,
+            "p95": histogram.quantile(0.95) * scale,
+            "Unit": "ms" if is_latency else "statements" if histogram.buckets == metrics.STATEMENT_BUCKETS else "rows",
+        })
+    if rows:
+        st.dataframe(rows, use_container_width=True)
+    else:
+        st.info("No metrics recorded yet")
+
+    st.download_button(
+        label="Download Prometheus metrics",
+        data=metrics.REGISTRY.render_prometheus(),
+        file_name="metrics.prom",
+        mime="text/plain"
+    )
+
 def save_email_preferences(email, frequency):
-    # TODO: Implement email preferences saving
-    pass
+    if not email or "@" not in email:
+        raise ValueError("A valid email address is required")
+    startup_profiler.load("report_dispatch").save_subscription(st.session_state.user["id"], email, frequency)
 
 if __name__ == "__main__":
     main()
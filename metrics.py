@@ -0,0 +1,208 @@
+import os
+import time
+import bisect
+import threading
+import logging
+import functools
+from collections.abc import Sized
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+# Round trips per batched write, e.g. a unit of work commit
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 1000)
+EXPORT_INTERVAL = 15.0
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three additions under a lock"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self._counts), self._sum, self._count
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating within the bucket that contains it"""
+        counts, _, count = self.snapshot()
+        if not count:
+            return 0.0
+        target = q * count
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= target:
+                if index >= len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index]
+                fraction = (target - cumulative) / bucket_count if bucket_count else 0.0
+                return lower + (upper - lower) * fraction
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._help = {}
+        self._gauges = {}  # name -> (help, callback returning {labels: value})
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = Histogram(buckets)
+                    self._histograms[key] = histogram
+                    self._help.setdefault(name, help_text)
+        return histogram
+
+    def register_gauges(self, name, help_text, callback):
+        """callback() returns {labels tuple: value}; it is evaluated at export time"""
+        with self._lock:
+            self._gauges[name] = (help_text, callback)
+
+    def histograms(self):
+        with self._lock:
+            return sorted(self._histograms.items())
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        seen = set()
+        for (name, labels), histogram in self.histograms():
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        with self._lock:
+            gauges = sorted(self._gauges.items())
+        for name, (help_text, callback) in gauges:
+            try:
+                values = callback()
+            except Exception as e:
+                logger.error(f"Metrics gauge {name} failed: {str(e)}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(values.items()):
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+REGISTRY = MetricsRegistry()
+
+class timed:
+    """Record elapsed seconds into a latency histogram; works as a context manager or decorator"""
+
+    def __init__(self, name, help_text="Elapsed time in seconds", **labels):
+        self.histogram = REGISTRY.histogram(name, help_text, LATENCY_BUCKETS, **labels)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self._start)
+        return False
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.histogram.observe(time.perf_counter() - start)
+        return wrapper
+
+def instrument_query(name):
+    """Decorator for data access functions: latency plus, for sized results, row count"""
+    latency = REGISTRY.histogram('db_query_duration_seconds', "Data access function latency", LATENCY_BUCKETS, query=name)
+    rows = REGISTRY.histogram('db_query_rows', "Rows returned by data access functions", ROW_BUCKETS, query=name)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                latency.observe(time.perf_counter() - start)
+            # Lists, DataFrames, columnar.TransactionColumns and other sized results
+            if isinstance(result, Sized) and not isinstance(result, (str, bytes)):
+                rows.observe(len(result))
+            return result
+        return wrapper
+    return decorator
+
+def observe_pool_wait(seconds):
+    REGISTRY.histogram('db_pool_wait_seconds', "Time spent waiting for a pooled connection", LATENCY_BUCKETS).observe(seconds)
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+def start_file_exporter(path=None, interval=EXPORT_INTERVAL):
+    """Periodically write the metrics to path (METRICS_FILE), e.g. for a node_exporter textfile collector"""
+    global _exporter_started
+    path = path or os.environ.get('METRICS_FILE')
+    if not path:
+        return False
+    with _exporter_lock:
+        if _exporter_started:
+            return True
+        _exporter_started = True
+
+    def export_loop():
+        while True:
+            try:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    f.write(REGISTRY.render_prometheus())
+                os.replace(tmp_path, path)
+            except Exception as e:
+                logger.error(f"Failed to export metrics to {path}: {str(e)}")
+            time.sleep(interval)
+
+    threading.Thread(target=export_loop, name="metrics-exporter", daemon=True).start()
+    logger.info(f"Exporting metrics to {path} every {interval:.0f}s")
+    return True
+
+def is_admin(user):
+    """Admins are listed by email in the comma-separated ADMIN_EMAILS variable"""
+    admins = {email.strip().lower() for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()}
+    return bool(user) and user.get('email', '').lower() in admins
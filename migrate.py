@@ -0,0 +1,96 @@
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d{4})_([a-z0-9_]+)\.sql$')
+# Migrations that cannot run inside a transaction block (e.g. CREATE INDEX CONCURRENTLY);
+# such files must contain a single statement
+NO_TRANSACTION_MARKER = '-- migrate: no-transaction'
+# Arbitrary application-wide key so concurrent processes apply migrations one at a time
+ADVISORY_LOCK_KEY = 7203411
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Return (version, name, sql) for every migration file, ordered by version"""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_PATTERN.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            sql = f.read()
+        migrations.append((int(match.group(1)), match.group(2), sql))
+
+    versions = [m[0] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"Duplicate migration version in {directory}")
+    return migrations
+
+def run_migrations(conn, directory=MIGRATIONS_DIR):
+    """Apply pending migrations on conn; returns the list of versions applied"""
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    cur = conn.cursor()
+    applied_now = []
+    try:
+        cur.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+        try:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            cur.execute("SELECT version FROM schema_migrations")
+            applied = {row[0] for row in cur.fetchall()}
+
+            for version, name, sql in load_migrations(directory):
+                if version in applied:
+                    continue
+                logger.info(f"Applying migration {version:04d}_{name}...")
+                if NO_TRANSACTION_MARKER in sql:
+                    cur.execute(sql)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                else:
+                    conn.autocommit = False
+                    try:
+                        cur.execute(sql)
+                        cur.execute(
+                            "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                            (version, name)
+                        )
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    finally:
+                        conn.autocommit = True
+                applied_now.append(version)
+                logger.info(f"Migration {version:04d}_{name} applied successfully")
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,))
+    finally:
+        cur.close()
+        conn.autocommit = autocommit
+
+    return applied_now
+
+if __name__ == "__main__":
+    from database import get_db_connection
+    from sharding import configured_shards, ensure_id_range
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    for index, (shard, _) in enumerate(configured_shards()):
+        conn = get_db_connection(shard)
+        try:
+            applied = run_migrations(conn)
+            ensure_id_range(conn, index)
+            logger.info(f"Applied {len(applied)} migration(s) on shard {shard}")
+        finally:
+            conn.close()
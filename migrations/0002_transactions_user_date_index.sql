@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Covering index for per-user, date-ordered reads and date-range filters
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_transactions_user_date
+    ON transactions (user_id, date DESC, id DESC)
+    INCLUDE (amount, category)
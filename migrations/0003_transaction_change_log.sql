@@ -0,0 +1,62 @@
+-- Per-user change log for transactions; its max id per user is that user's data version
+
+CREATE TABLE IF NOT EXISTS transaction_changes (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    transaction_id INTEGER NOT NULL,
+    operation CHAR(1) NOT NULL,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_transaction_changes_user
+    ON transaction_changes (user_id, id);
+
+CREATE INDEX IF NOT EXISTS idx_transaction_changes_changed_at
+    ON transaction_changes (changed_at);
+
+-- Statement-level triggers with transition tables keep bulk imports to one log INSERT per statement
+CREATE OR REPLACE FUNCTION log_transaction_inserts() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO transaction_changes (user_id, transaction_id, operation)
+    SELECT user_id, id, 'I' FROM new_rows WHERE user_id IS NOT NULL;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION log_transaction_updates() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO transaction_changes (user_id, transaction_id, operation)
+    SELECT user_id, id, 'U' FROM new_rows WHERE user_id IS NOT NULL
+    UNION ALL
+    SELECT o.user_id, o.id, 'D'
+    FROM old_rows o JOIN new_rows n ON n.id = o.id
+    WHERE o.user_id IS DISTINCT FROM n.user_id AND o.user_id IS NOT NULL;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION log_transaction_deletes() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO transaction_changes (user_id, transaction_id, operation)
+    SELECT user_id, id, 'D' FROM old_rows WHERE user_id IS NOT NULL;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS transactions_log_inserts ON transactions;
+CREATE TRIGGER transactions_log_inserts
+    AFTER INSERT ON transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION log_transaction_inserts();
+
+DROP TRIGGER IF EXISTS transactions_log_updates ON transactions;
+CREATE TRIGGER transactions_log_updates
+    AFTER UPDATE ON transactions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION log_transaction_updates();
+
+DROP TRIGGER IF EXISTS transactions_log_deletes ON transactions;
+CREATE TRIGGER transactions_log_deletes
+    AFTER DELETE ON transactions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION log_transaction_deletes();
@@ -0,0 +1,16 @@
+-- Default categories for existing users that have none; new users are seeded at onboarding
+INSERT INTO transaction_categories (user_id, name, icon, color)
+SELECT u.id, d.name, d.icon, d.color
+FROM users u
+CROSS JOIN (VALUES
+    ('Food', '🍽️', '#FF6B6B'),
+    ('Transport', '🚗', '#4ECDC4'),
+    ('Entertainment', '🎮', '#45B7D1'),
+    ('Shopping', '🛍️', '#96CEB4'),
+    ('Bills', '📄', '#FFEEAD'),
+    ('Other', '📌', '#D4D4D4')
+) AS d(name, icon, color)
+WHERE NOT EXISTS (
+    SELECT 1 FROM transaction_categories c WHERE c.user_id = u.id
+)
+ON CONFLICT (user_id, name) DO NOTHING;
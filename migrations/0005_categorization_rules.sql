@@ -0,0 +1,14 @@
+-- User-defined keyword rules for automatic categorization
+CREATE TABLE IF NOT EXISTS categorization_rules (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    keyword VARCHAR(255) NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 100,
+    min_amount DECIMAL(10,2),
+    max_amount DECIMAL(10,2),
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_categorization_rules_user
+    ON categorization_rules (user_id);
@@ -0,0 +1,36 @@
+-- Deduplicate synced bank transactions and track per-user sync progress
+
+-- Earlier syncs could insert the same bank payment more than once; keep the first copy
+DELETE FROM transactions t
+USING transactions d
+WHERE t.bank_reference IS NOT NULL
+  AND d.user_id = t.user_id
+  AND d.bank_reference = t.bank_reference
+  AND d.id < t.id;
+
+-- A partitioned transactions table cannot enforce uniqueness without the partition key,
+-- so it gets a plain lookup index and relies on the sync's per-user lock instead
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = 'transactions' AND n.nspname = current_schema() AND c.relkind = 'p'
+    ) THEN
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_bank_reference
+            ON transactions (user_id, bank_reference)
+            WHERE bank_reference IS NOT NULL;
+    ELSE
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_user_bank_reference
+            ON transactions (user_id, bank_reference)
+            WHERE bank_reference IS NOT NULL;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS bank_sync_state (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    high_water_mark TIMESTAMP,
+    status VARCHAR(20) NOT NULL DEFAULT 'idle',
+    last_error TEXT,
+    last_synced_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
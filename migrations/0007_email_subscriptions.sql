@@ -0,0 +1,13 @@
+-- Report subscriptions saved from Settings and read by the report dispatcher
+CREATE TABLE IF NOT EXISTS email_subscriptions (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    email VARCHAR(255) NOT NULL,
+    frequency VARCHAR(10) NOT NULL CHECK (frequency IN ('Weekly', 'Monthly')),
+    active BOOLEAN NOT NULL DEFAULT TRUE,
+    last_sent_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_email_subscriptions_due
+    ON email_subscriptions (frequency, last_sent_at)
+    WHERE active;
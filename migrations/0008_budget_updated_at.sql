@@ -0,0 +1,4 @@
+-- Lets readers tell when a user's budgets last changed, e.g. to key cached charts
+ALTER TABLE budgets ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_budgets_user ON budgets (user_id);
@@ -0,0 +1,12 @@
+-- One row per user and month moved out of transactions into the Parquet cold tier
+CREATE TABLE IF NOT EXISTS transaction_archive_months (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    month DATE NOT NULL,
+    transaction_count INTEGER NOT NULL,
+    total_amount DECIMAL(14,2) NOT NULL,
+    max_amount DECIMAL(10,2),
+    category_totals JSONB NOT NULL DEFAULT '{}',
+    file_path TEXT NOT NULL,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, month)
+);
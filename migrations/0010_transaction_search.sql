@@ -0,0 +1,23 @@
+-- Full-text and fuzzy search over transaction descriptions
+
+-- The 'simple' configuration keeps merchant names as typed (no stemming or stop words)
+ALTER TABLE transactions ADD COLUMN IF NOT EXISTS description_search tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', COALESCE(description, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_transactions_description_search
+    ON transactions USING GIN (description_search);
+
+-- Trigram matching catches misspelt merchants; it is skipped where pg_trgm is not
+-- available or may not be created, and search then falls back to full-text only
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS idx_transactions_description_trgm
+            ON transactions USING GIN (description gin_trgm_ops);
+    ELSE
+        RAISE NOTICE 'pg_trgm is not available; transaction search will not match misspellings';
+    END IF;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'Not allowed to create pg_trgm; transaction search will not match misspellings';
+END $$;
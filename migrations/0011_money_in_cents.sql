@@ -0,0 +1,25 @@
+-- Money is stored as BIGINT minor units (cents): exact integer arithmetic, and no
+-- DECIMAL(10,2) cap at 99,999,999.99. Columns are renamed so a query still using the
+-- old unit fails instead of reading amounts a hundred times too large.
+
+ALTER TABLE transactions ALTER COLUMN amount TYPE BIGINT USING round(amount * 100)::bigint;
+ALTER TABLE transactions RENAME COLUMN amount TO amount_cents;
+
+ALTER TABLE budgets ALTER COLUMN amount TYPE BIGINT USING round(amount * 100)::bigint;
+ALTER TABLE budgets RENAME COLUMN amount TO amount_cents;
+
+ALTER TABLE categorization_rules ALTER COLUMN min_amount TYPE BIGINT USING round(min_amount * 100)::bigint;
+ALTER TABLE categorization_rules RENAME COLUMN min_amount TO min_amount_cents;
+ALTER TABLE categorization_rules ALTER COLUMN max_amount TYPE BIGINT USING round(max_amount * 100)::bigint;
+ALTER TABLE categorization_rules RENAME COLUMN max_amount TO max_amount_cents;
+
+ALTER TABLE transaction_archive_months ALTER COLUMN total_amount TYPE BIGINT USING round(total_amount * 100)::bigint;
+ALTER TABLE transaction_archive_months RENAME COLUMN total_amount TO total_cents;
+ALTER TABLE transaction_archive_months ALTER COLUMN max_amount TYPE BIGINT USING round(max_amount * 100)::bigint;
+ALTER TABLE transaction_archive_months RENAME COLUMN max_amount TO max_cents;
+-- Per-category totals were decimal strings
+UPDATE transaction_archive_months m
+SET category_totals = COALESCE((
+    SELECT jsonb_object_agg(key, round(value::numeric * 100)::bigint)
+    FROM jsonb_each_text(m.category_totals)
+), '{}');
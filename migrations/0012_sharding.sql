@@ -0,0 +1,20 @@
+-- User-id sharding (see sharding.py). Transactions keep their ids when a user moves
+-- between shards, so ids come from a per-shard range and need BIGINT.
+
+ALTER TABLE transactions ALTER COLUMN id TYPE BIGINT;
+ALTER SEQUENCE transactions_id_seq AS BIGINT;
+ALTER TABLE transaction_changes ALTER COLUMN transaction_id TYPE BIGINT;
+
+-- Used on the directory (first) shard: the shard of every user
+CREATE TABLE IF NOT EXISTS shard_directory (
+    user_id INTEGER PRIMARY KEY,
+    shard VARCHAR(64) NOT NULL,
+    moved_at TIMESTAMP
+);
+
+-- Users moved off this shard; requests that still route here are turned away
+CREATE TABLE IF NOT EXISTS moved_users (
+    user_id INTEGER PRIMARY KEY,
+    shard VARCHAR(64) NOT NULL,
+    moved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
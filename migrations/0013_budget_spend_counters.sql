@@ -0,0 +1,100 @@
+-- Running spend per user, category and budget period bucket (see budget_engine.py), kept current
+-- by triggers so budget status is one lookup per budget instead of a scan of the user's transactions.
+-- Monthly buckets start at date_trunc('month', date), Weekly ones at date_trunc('week', date) (Mondays).
+
+CREATE TABLE IF NOT EXISTS budget_spend (
+    user_id INTEGER NOT NULL,
+    period VARCHAR(20) NOT NULL,
+    bucket_start DATE NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    spent_cents BIGINT NOT NULL DEFAULT 0,
+    transaction_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, period, bucket_start, category)
+);
+
+CREATE OR REPLACE FUNCTION budget_spend_bucket(unit TEXT, d TIMESTAMP) RETURNS DATE AS $$
+    SELECT date_trunc(unit, d)::date
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Each statement adds its net change per counter in one upsert. Counters are upserted in key
+-- order so concurrent writers lock them in the same order, and counters whose changes cancel
+-- out (e.g. a description edit) are left alone.
+CREATE OR REPLACE FUNCTION count_budget_spend_inserts() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO budget_spend AS s (user_id, period, bucket_start, category, spent_cents, transaction_count)
+    SELECT n.user_id, p.period, budget_spend_bucket(p.unit, n.date), n.category, sum(n.amount_cents), count(*)
+    FROM new_rows n
+    CROSS JOIN (VALUES ('Monthly', 'month'), ('Weekly', 'week')) AS p (period, unit)
+    WHERE n.user_id IS NOT NULL AND n.category IS NOT NULL AND n.date IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 1, 2, 3, 4
+    ON CONFLICT (user_id, period, bucket_start, category) DO UPDATE SET
+        spent_cents = s.spent_cents + EXCLUDED.spent_cents,
+        transaction_count = s.transaction_count + EXCLUDED.transaction_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_budget_spend_updates() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO budget_spend AS s (user_id, period, bucket_start, category, spent_cents, transaction_count)
+    SELECT c.user_id, p.period, budget_spend_bucket(p.unit, c.date), c.category, sum(c.amount_cents), sum(c.sign)
+    FROM (
+        SELECT user_id, category, date, amount_cents, 1 AS sign FROM new_rows
+        UNION ALL
+        SELECT user_id, category, date, -amount_cents, -1 FROM old_rows
+    ) c
+    CROSS JOIN (VALUES ('Monthly', 'month'), ('Weekly', 'week')) AS p (period, unit)
+    WHERE c.user_id IS NOT NULL AND c.category IS NOT NULL AND c.date IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+    HAVING sum(c.amount_cents) <> 0 OR sum(c.sign) <> 0
+    ORDER BY 1, 2, 3, 4
+    ON CONFLICT (user_id, period, bucket_start, category) DO UPDATE SET
+        spent_cents = s.spent_cents + EXCLUDED.spent_cents,
+        transaction_count = s.transaction_count + EXCLUDED.transaction_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION count_budget_spend_deletes() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO budget_spend AS s (user_id, period, bucket_start, category, spent_cents, transaction_count)
+    SELECT o.user_id, p.period, budget_spend_bucket(p.unit, o.date), o.category, -sum(o.amount_cents), -count(*)
+    FROM old_rows o
+    CROSS JOIN (VALUES ('Monthly', 'month'), ('Weekly', 'week')) AS p (period, unit)
+    WHERE o.user_id IS NOT NULL AND o.category IS NOT NULL AND o.date IS NOT NULL
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 1, 2, 3, 4
+    ON CONFLICT (user_id, period, bucket_start, category) DO UPDATE SET
+        spent_cents = s.spent_cents + EXCLUDED.spent_cents,
+        transaction_count = s.transaction_count + EXCLUDED.transaction_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS transactions_count_budget_spend_inserts ON transactions;
+CREATE TRIGGER transactions_count_budget_spend_inserts
+    AFTER INSERT ON transactions
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_budget_spend_inserts();
+
+DROP TRIGGER IF EXISTS transactions_count_budget_spend_updates ON transactions;
+CREATE TRIGGER transactions_count_budget_spend_updates
+    AFTER UPDATE ON transactions
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_budget_spend_updates();
+
+DROP TRIGGER IF EXISTS transactions_count_budget_spend_deletes ON transactions;
+CREATE TRIGGER transactions_count_budget_spend_deletes
+    AFTER DELETE ON transactions
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION count_budget_spend_deletes();
+
+-- Counters for the transactions already stored; creating the triggers locked out writes until
+-- this migration commits, so none are missed or counted twice
+INSERT INTO budget_spend (user_id, period, bucket_start, category, spent_cents, transaction_count)
+SELECT t.user_id, p.period, budget_spend_bucket(p.unit, t.date), t.category, sum(t.amount_cents), count(*)
+FROM transactions t
+CROSS JOIN (VALUES ('Monthly', 'month'), ('Weekly', 'week')) AS p (period, unit)
+WHERE t.user_id IS NOT NULL AND t.category IS NOT NULL AND t.date IS NOT NULL
+GROUP BY 1, 2, 3, 4;
@@ -0,0 +1,11 @@
+-- Change-log ids are handed out when a row is inserted, not when its transaction commits, so a
+-- reader that has seen id N can later find new entries below N. Each entry also records the
+-- writing transaction's xid: entries not yet visible in a snapshot all have an xid at or above
+-- the snapshot's xmin, which readers keep as a watermark (see transaction_cache and
+-- sharding.move_user). Entries written before this migration have no xid and are all committed.
+
+ALTER TABLE transaction_changes ADD COLUMN IF NOT EXISTS xid xid8;
+ALTER TABLE transaction_changes ALTER COLUMN xid SET DEFAULT pg_current_xact_id();
+
+CREATE INDEX IF NOT EXISTS idx_transaction_changes_user_xid
+    ON transaction_changes (user_id, xid);
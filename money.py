@@ -0,0 +1,66 @@
+"""Money as integer minor units (cents).
+
+Amounts are stored as BIGINT cents (the *_cents columns) and handled as
+Python ints or int64 NumPy/pandas columns, so sums are exact and
+vectorized. Conversions happen only at the edges: to_cents for user input,
+CSV files and other decimal sources, to_units for widgets and charts, and
+format_money for display. Exports and the Parquet archive keep a decimal
+amount column, converted with to_arrow_decimal and cents_from_arrow.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENTS_PER_UNIT = 100
+CURRENCY_SYMBOL = '$'
+# BIGINT range
+MAX_CENTS = 2 ** 63 - 1
+# Decimal type of exported and archived amounts; wide enough for any BIGINT amount
+DECIMAL_PRECISION = 20
+
+def to_cents(value):
+    """int cents for an amount in currency units (int, float, Decimal or numeric string), rounded half up"""
+    if value is None:
+        return None
+    if isinstance(value, float):
+        # The shortest repr is the amount as typed, e.g. 0.29 rather than 0.28999999999999998
+        value = repr(value)
+    try:
+        cents = (Decimal(value) * CENTS_PER_UNIT).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not cents.is_finite() or abs(cents) > MAX_CENTS:
+        raise ValueError(f"Amount out of range: {value!r}")
+    return int(cents)
+
+def to_units(cents):
+    """Amount in currency units as a float, for number inputs and charts"""
+    return None if cents is None else cents / CENTS_PER_UNIT
+
+def format_money(cents):
+    """'$1,234.56' (or '-$1,234.56') from int cents, without going through float"""
+    cents = int(round(cents))
+    sign = '-' if cents < 0 else ''
+    units, fraction = divmod(abs(cents), CENTS_PER_UNIT)
+    return f"{sign}{CURRENCY_SYMBOL}{units:,}.{fraction:02d}"
+
+def cents_array(values):
+    """int64 cents from an array of unit amounts (floats), rounded to the nearest cent"""
+    import numpy as np
+
+    return np.rint(np.asarray(values, dtype=np.float64) * CENTS_PER_UNIT).astype(np.int64)
+
+def to_arrow_decimal(cents):
+    """An Arrow decimal128(DECIMAL_PRECISION, 2) array of unit amounts from int cents"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    whole = pa.array(cents, type=pa.int64()).cast(pa.decimal128(DECIMAL_PRECISION, 0))
+    units = pc.divide(whole, pa.scalar(Decimal(CENTS_PER_UNIT), pa.decimal128(3, 0)))
+    return units.cast(pa.decimal128(DECIMAL_PRECISION, 2))
+
+def cents_from_arrow(amounts):
+    """int64 cents from an Arrow decimal array of unit amounts"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    scaled = pc.multiply(amounts, pa.scalar(Decimal(CENTS_PER_UNIT), pa.decimal128(3, 0)))
+    return pc.cast(scaled, pa.int64())
@@ -0,0 +1,195 @@
+import re
+import sys
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+# Monthly partitions are created this many months past the current month
+DEFAULT_MONTHS_AHEAD = 3
+# Holds rows outside every monthly partition, e.g. dates older than the conversion or far in the future
+DEFAULT_PARTITION = 'transactions_default'
+
+def _month_start(d):
+    return date(d.year, d.month, 1)
+
+def _add_months(d, months):
+    month_index = d.month - 1 + months
+    return date(d.year + month_index // 12, month_index % 12 + 1, 1)
+
+def _partition_name(month):
+    return f"transactions_p{month.year:04d}_{month.month:02d}"
+
+def is_partitioned(cur):
+    cur.execute("""
+        SELECT c.relkind = 'p'
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relname = 'transactions' AND n.nspname = current_schema()
+    """)
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+def _create_month_partition(cur, month):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {_partition_name(month)}
+        PARTITION OF transactions
+        FOR VALUES FROM (%s) TO (%s)
+    """, (month, _add_months(month, 1)))
+
+def _stored_columns(cur, table):
+    """Column list of table without generated columns, which are recomputed on insert"""
+    cur.execute("""
+        SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+    """, (table,))
+    return cur.fetchone()[0]
+
+def _default_has_rows(cur, month):
+    cur.execute("SELECT to_regclass(%s)", (DEFAULT_PARTITION,))
+    if cur.fetchone()[0] is None:
+        return False
+    cur.execute(f"""
+        SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s)
+    """, (month, _add_months(month, 1)))
+    return cur.fetchone()[0]
+
+def _create_month_partition_from_default(cur, month):
+    """Create the month's partition when the default partition already holds rows of that month.
+
+    Postgres refuses to add a partition whose range has rows in the default
+    partition, so the default is detached while the rows are moved and then
+    attached again. The rows are moved between partitions directly, which
+    fires none of the statement triggers on transactions: to the change log
+    and budget counters nothing has changed.
+    """
+    cur.execute(f"ALTER TABLE transactions DETACH PARTITION {DEFAULT_PARTITION}")
+    _create_month_partition(cur, month)
+    columns = _stored_columns(cur, DEFAULT_PARTITION)
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING {columns}
+        )
+        INSERT INTO {_partition_name(month)} ({columns}) SELECT {columns} FROM moved
+    """, (month, _add_months(month, 1)))
+    logger.info(f"Moved {cur.rowcount} transaction(s) from {DEFAULT_PARTITION} to {_partition_name(month)}")
+    cur.execute(f"ALTER TABLE transactions ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+
+def _retarget(definition):
+    return re.sub(r' ON (\S+\.)?transactions_unpartitioned ', ' ON transactions ', definition)
+
+def _copy_indexes_and_triggers(cur):
+    """Recreate the unpartitioned table's secondary indexes and triggers on the partitioned table"""
+    cur.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid), i.indisunique
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = 'transactions_unpartitioned'::regclass AND NOT i.indisprimary
+    """)
+    indexes = cur.fetchall()
+    cur.execute("""
+        SELECT tgname, pg_get_triggerdef(oid)
+        FROM pg_trigger
+        WHERE tgrelid = 'transactions_unpartitioned'::regclass AND NOT tgisinternal
+    """)
+    triggers = cur.fetchall()
+
+    for name, definition, unique in indexes:
+        cur.execute(f"DROP INDEX {name}")
+        if unique and not re.search(r'\bdate\b', definition):
+            # Unique indexes on a partitioned table must include the partition key; keep it for lookups
+            logger.warning(f"Recreating unique index {name} as non-unique: it does not include the partition key")
+            definition = definition.replace('CREATE UNIQUE INDEX', 'CREATE INDEX', 1)
+        cur.execute(_retarget(definition))
+    for name, definition in triggers:
+        cur.execute(_retarget(definition))
+
+def ensure_partitions(conn, months_ahead=DEFAULT_MONTHS_AHEAD, today=None):
+    """Create monthly partitions up to months_ahead; no-op when transactions is not partitioned.
+
+    Rows already stored in the default partition for a new month are moved
+    into it.
+    """
+    with conn.cursor() as cur:
+        if not is_partitioned(cur):
+            return []
+        current = _month_start(today or date.today())
+        created = []
+        for offset in range(months_ahead + 1):
+            month = _add_months(current, offset)
+            cur.execute("SELECT to_regclass(%s)", (_partition_name(month),))
+            if cur.fetchone()[0] is None:
+                if _default_has_rows(cur, month):
+                    _create_month_partition_from_default(cur, month)
+                else:
+                    _create_month_partition(cur, month)
+                created.append(_partition_name(month))
+    conn.commit()
+    if created:
+        logger.info(f"Created transaction partitions: {', '.join(created)}")
+    return created
+
+def partition_transactions(conn, months_ahead=DEFAULT_MONTHS_AHEAD):
+    """Convert transactions into a table range-partitioned by month on date.
+
+    Runs in one transaction under an exclusive lock, so the table is
+    unavailable while existing rows are copied.
+    """
+    with conn.cursor() as cur:
+        if is_partitioned(cur):
+            logger.info("Transactions table is already partitioned")
+            return False
+
+        cur.execute("LOCK TABLE transactions IN ACCESS EXCLUSIVE MODE")
+        # The partition key is part of the primary key, so it cannot be NULL
+        cur.execute("UPDATE transactions SET date = CURRENT_TIMESTAMP WHERE date IS NULL")
+        if cur.rowcount:
+            logger.warning(f"Set date on {cur.rowcount} transaction(s) that had none")
+        cur.execute("SELECT min(date), max(date) FROM transactions")
+        min_date, max_date = cur.fetchone()
+
+        cur.execute("ALTER TABLE transactions RENAME TO transactions_unpartitioned")
+        cur.execute("""
+            CREATE TABLE transactions (
+                LIKE transactions_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED,
+                PRIMARY KEY (id, date)
+            ) PARTITION BY RANGE (date)
+        """)
+        cur.execute("ALTER TABLE transactions ADD FOREIGN KEY (user_id) REFERENCES users(id)")
+        cur.execute("ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id")
+
+        first = _month_start(min_date or date.today())
+        last = _add_months(_month_start(max(max_date.date() if max_date else date.today(), date.today())), months_ahead)
+        month = first
+        while month <= last:
+            _create_month_partition(cur, month)
+            month = _add_months(month, 1)
+        cur.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF transactions DEFAULT")
+
+        # Generated columns (e.g. description_search) are recomputed on insert, so they are not copied
+        columns = _stored_columns(cur, 'transactions_unpartitioned')
+        cur.execute(f"INSERT INTO transactions ({columns}) SELECT {columns} FROM transactions_unpartitioned")
+        # Triggers are attached after the copy so moved rows do not fire them again
+        _copy_indexes_and_triggers(cur)
+        cur.execute("DROP TABLE transactions_unpartitioned")
+    conn.commit()
+    logger.info("Transactions table converted to monthly range partitions")
+    return True
+
+if __name__ == "__main__":
+    from database import get_db_connection
+    from sharding import configured_shards
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else "ensure"
+    if command not in ("convert", "ensure"):
+        sys.exit("Usage: python partitioning.py [convert|ensure]")
+    for shard, _ in configured_shards():
+        conn = get_db_connection(shard)
+        try:
+            if command == "convert":
+                partition_transactions(conn)
+            else:
+                ensure_partitions(conn)
+        finally:
+            conn.close()
@@ -0,0 +1,296 @@
+"""Read replicas: reads tagged read-only are served by streaming replicas of the user's shard.
+
+Replicas are configured with DB_REPLICAS, a JSON object mapping shard names
+(see sharding; "default" without DB_SHARDS) to lists of libpq connection
+strings, e.g.
+    DB_REPLICAS='{"default": ["host=db-replica-1 dbname=ftp", "host=db-replica-2 dbname=ftp"]}'
+Shards without replicas serve every read from the primary.
+
+Every REPLICA_CHECK_INTERVAL seconds the replicas' replay positions are
+compared with the primary's WAL position. A replica that is unreachable, not
+in recovery, or more than MAX_LAG_BYTES of WAL or MAX_LAG_SECONDS behind is
+taken out of rotation until a later check finds it caught up.
+
+Reads see the user's own writes: when a write commits, the primary's WAL
+position is recorded for the user, and until the replicas have replayed it
+a read for that user waits up to READ_YOUR_WRITES_WAIT seconds for the chosen
+replica to get there, and otherwise reads from the primary.
+
+Long reads such as exports can be cancelled on a replica by conflicts with
+replay; enable hot_standby_feedback on the replicas (or raise
+max_standby_streaming_delay) if that happens.
+"""
+import os
+import json
+import time
+import threading
+import logging
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+REPLICA_CHECK_INTERVAL = 5.0
+MAX_LAG_BYTES = 16 * 1024 * 1024
+MAX_LAG_SECONDS = 10.0
+READ_YOUR_WRITES_WAIT = 0.5
+REPLAY_POLL_INTERVAL = 0.01
+# Users whose last write position is remembered; the oldest are dropped first
+MAX_TRACKED_WRITES = 100000
+# Replica connections give up quickly so a dead replica does not stall reads
+CONNECT_TIMEOUT = 3
+NOT_CHECKED = "not checked yet"
+
+# WAL positions as byte offsets, so they compare and subtract as plain ints
+CURRENT_LSN = "SELECT pg_wal_lsn_diff(pg_current_wal_insert_lsn(), '0/0')::bigint"
+FLUSHED_LSN = "SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')::bigint"
+REPLAY_LSN = "SELECT pg_is_in_recovery(), pg_wal_lsn_diff(pg_last_wal_replay_lsn(), '0/0')::bigint"
+
+def configured_replicas():
+    """{shard name: [connection string]} from DB_REPLICAS; empty when it is unset"""
+    raw = os.environ.get('DB_REPLICAS')
+    if not raw:
+        return {}
+    replicas = json.loads(raw)
+    if not isinstance(replicas, dict) or not all(isinstance(dsns, list) for dsns in replicas.values()):
+        raise ValueError("DB_REPLICAS must be a JSON object of shard name to a list of connection strings")
+    return replicas
+
+class _Replica:
+    __slots__ = ('name', 'pool', 'in_rotation', 'replay_lsn', 'lag_bytes', 'lag_seconds', 'reads', 'problem')
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        # Out of rotation until the first check has measured it
+        self.in_rotation = False
+        self.replay_lsn = 0
+        self.lag_bytes = None
+        self.lag_seconds = None
+        self.reads = 0
+        self.problem = NOT_CHECKED
+
+class ReplicaSet:
+    """The read replicas of one shard, with lag tracking and read-your-writes positions.
+
+    replicas is [(name, db_pool.ConnectionPool)]; primary_connection() is a
+    context manager yielding a connection to the shard's primary
+    (database.shard_connection).
+    """
+
+    def __init__(self, shard, replicas, primary_connection, check_interval=REPLICA_CHECK_INTERVAL,
+                 max_lag_bytes=MAX_LAG_BYTES, max_lag_seconds=MAX_LAG_SECONDS, wait=READ_YOUR_WRITES_WAIT,
+                 max_tracked_writes=MAX_TRACKED_WRITES):
+        self.shard = shard
+        self.check_interval = check_interval
+        self.max_lag_bytes = max_lag_bytes
+        self.max_lag_seconds = max_lag_seconds
+        self.wait = wait
+        self.max_tracked_writes = max_tracked_writes
+        self._replicas = [_Replica(name, pool) for name, pool in replicas]
+        self._primary_connection = primary_connection
+
+        self._lock = threading.Lock()
+        self._writes = OrderedDict()  # user_id -> primary WAL position after their last write
+        self._samples = deque()  # (checked_at, primary WAL position), oldest first
+        self._checked_at = None
+        self._checking = False
+        self._turn = 0
+        self._stats = {'replica_reads': 0, 'primary_reads': 0, 'replay_waits': 0, 'checks': 0}
+
+    def note_write(self, conn, user_id):
+        """Record the WAL position after the user's write; conn is the primary connection it just committed on"""
+        with conn.cursor() as cur:
+            cur.execute(CURRENT_LSN)
+            lsn = cur.fetchone()[0]
+        with self._lock:
+            self._writes[user_id] = lsn
+            self._writes.move_to_end(user_id)
+            while len(self._writes) > self.max_tracked_writes:
+                self._writes.popitem(last=False)
+        return lsn
+
+    def acquire(self, user_id):
+        """(pool, connection) on a replica that has replayed the user's writes, or None to read from the primary"""
+        self._maybe_check()
+        with self._lock:
+            candidates = [replica for replica in self._replicas if replica.in_rotation]
+            required = self._writes.get(user_id)
+            if not candidates:
+                self._stats['primary_reads'] += 1
+                return None
+            # Round robin, trying first the replicas last seen past the user's writes
+            self._turn += 1
+            start = self._turn % len(candidates)
+            candidates = candidates[start:] + candidates[:start]
+            if required is not None:
+                candidates.sort(key=lambda replica: replica.replay_lsn < required)
+            replica = candidates[0]
+
+        try:
+            conn = replica.pool.acquire()
+        except Exception as e:
+            self._take_out(replica, f"unreachable: {str(e)}")
+            return self._primary_read()
+        try:
+            if required is not None and not self._wait_for(conn, required, time.monotonic() + self.wait):
+                replica.pool.release(conn)
+                return self._primary_read()
+        except Exception as e:
+            replica.pool.release(conn, discard=True)
+            self._take_out(replica, f"failed: {str(e)}")
+            return self._primary_read()
+
+        with self._lock:
+            replica.reads += 1
+            self._stats['replica_reads'] += 1
+        return replica.pool, conn
+
+    def catch_up(self, conn, timeout=MAX_LAG_SECONDS):
+        """Wait until every replica in rotation has replayed the primary's current position.
+
+        conn is a connection to the primary. Returns whether they all did within timeout.
+        """
+        with conn.cursor() as cur:
+            cur.execute(CURRENT_LSN)
+            lsn = cur.fetchone()[0]
+        self._maybe_check()
+        deadline = time.monotonic() + timeout
+        caught_up = True
+        for replica in [replica for replica in self._replicas if replica.in_rotation]:
+            try:
+                replica_conn = replica.pool.acquire()
+            except Exception as e:
+                self._take_out(replica, f"unreachable: {str(e)}")
+                continue
+            try:
+                caught_up &= self._wait_for(replica_conn, lsn, deadline)
+            finally:
+                replica.pool.release(replica_conn)
+        return caught_up
+
+    def check(self):
+        """Measure each replica's lag behind the primary and update the rotation"""
+        with self._primary_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(FLUSHED_LSN)
+                primary_lsn = cur.fetchone()[0]
+        now = time.monotonic()
+        self._samples.append((now, primary_lsn))
+        while len(self._samples) > 1 and now - self._samples[1][0] > 2 * self.max_lag_seconds:
+            self._samples.popleft()
+
+        for replica in self._replicas:
+            try:
+                conn = replica.pool.acquire()
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(REPLAY_LSN)
+                        in_recovery, replay_lsn = cur.fetchone()
+                finally:
+                    replica.pool.release(conn)
+            except Exception as e:
+                self._take_out(replica, f"unreachable: {str(e)}")
+                continue
+            if not in_recovery:
+                self._take_out(replica, "not in recovery")
+                continue
+
+            # The replica is older than the first sampled primary position it has not replayed
+            behind = [checked_at for checked_at, lsn in self._samples if lsn > replay_lsn]
+            lag_seconds = now - behind[0] if behind else 0.0
+            lag_bytes = max(primary_lsn - replay_lsn, 0)
+            problem = None
+            if lag_bytes > self.max_lag_bytes:
+                problem = f"{lag_bytes} bytes behind"
+            elif lag_seconds > self.max_lag_seconds:
+                problem = f"{lag_seconds:.1f}s behind"
+            with self._lock:
+                replica.replay_lsn = replay_lsn
+                replica.lag_bytes = lag_bytes
+                replica.lag_seconds = lag_seconds
+            if problem:
+                self._take_out(replica, problem)
+            else:
+                self._put_back(replica)
+
+        with self._lock:
+            self._stats['checks'] += 1
+            # Writes every replica in rotation has replayed no longer hold reads back
+            in_rotation = [replica.replay_lsn for replica in self._replicas if replica.in_rotation]
+            if in_rotation:
+                floor = min(in_rotation)
+                for user_id in [user_id for user_id, lsn in self._writes.items() if lsn <= floor]:
+                    del self._writes[user_id]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['replicas'] = len(self._replicas)
+            stats['in_rotation'] = sum(replica.in_rotation for replica in self._replicas)
+            stats['tracked_writes'] = len(self._writes)
+        return stats
+
+    def replica_stats(self):
+        """{replica name: stats}"""
+        with self._lock:
+            return {
+                replica.name: {
+                    'in_rotation': int(replica.in_rotation),
+                    'lag_bytes': replica.lag_bytes or 0,
+                    'lag_seconds': replica.lag_seconds or 0.0,
+                    'reads': replica.reads,
+                }
+                for replica in self._replicas
+            }
+
+    def _maybe_check(self):
+        with self._lock:
+            due = self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval
+            if not due or self._checking:
+                return
+            self._checking = True
+        try:
+            self.check()
+        except Exception as e:
+            logger.error(f"Replica check for shard {self.shard} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._checking = False
+                self._checked_at = time.monotonic()
+
+    def _wait_for(self, conn, lsn, deadline):
+        waited = False
+        with conn.cursor() as cur:
+            while True:
+                cur.execute(REPLAY_LSN)
+                if cur.fetchone()[1] >= lsn:
+                    break
+                if time.monotonic() >= deadline:
+                    return False
+                waited = True
+                time.sleep(REPLAY_POLL_INTERVAL)
+        if waited:
+            with self._lock:
+                self._stats['replay_waits'] += 1
+        return True
+
+    def _primary_read(self):
+        with self._lock:
+            self._stats['primary_reads'] += 1
+        return None
+
+    def _take_out(self, replica, problem):
+        with self._lock:
+            announce = replica.in_rotation or replica.problem == NOT_CHECKED
+            replica.in_rotation = False
+            replica.problem = problem
+        if announce:
+            logger.warning(f"Replica {replica.name} taken out of rotation: {problem}")
+
+    def _put_back(self, replica):
+        with self._lock:
+            was_in = replica.in_rotation
+            replica.in_rotation = True
+            replica.problem = None
+        if not was_in:
+            logger.info(f"Replica {replica.name} in rotation")
@@ -0,0 +1,180 @@
+"""Batch dispatch of scheduled email reports.
+
+Usage:
+    python report_dispatch.py --frequency Monthly [--render-workers 4] [--smtp-connections 2] [--rate 5]
+
+Run from cron shortly after each period closes. Subscribers whose report for
+the last closed period has not been sent yet get one; their summaries are
+computed together in one windowed query (see report_queries).
+"""
+import argparse
+import random
+import smtplib
+import sys
+import time
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from database import cursor, shard_cursor, for_each_shard, get_router
+from email_service import get_smtp_settings, render_report, RateLimiter, SMTPConnectionPool
+from metrics import instrument_query
+from report_queries import window_summaries
+
+logger = logging.getLogger(__name__)
+
+FREQUENCIES = ('Weekly', 'Monthly')
+MAX_SEND_ATTEMPTS = 3
+SEND_BACKOFF = 2.0
+
+@instrument_query("save_subscription")
+def save_subscription(user_id, email, frequency, active=True):
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Unknown report frequency: {frequency}")
+    with cursor(user_id) as cur:
+        cur.execute("""
+            INSERT INTO email_subscriptions (user_id, email, frequency, active, updated_at)
+            VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE SET
+                email = EXCLUDED.email,
+                frequency = EXCLUDED.frequency,
+                active = EXCLUDED.active,
+                updated_at = CURRENT_TIMESTAMP
+        """, (user_id, email.strip(), frequency, active))
+
+@instrument_query("get_subscription")
+def get_subscription(user_id):
+    with cursor(user_id, dict_rows=True, readonly=True) as cur:
+        cur.execute("""
+            SELECT email, frequency, active, last_sent_at
+            FROM email_subscriptions
+            WHERE user_id = %s
+        """, (user_id,))
+        return cur.fetchone()
+
+def report_period(frequency, now=None):
+    """[start, end) of the last closed period: the previous calendar month or Monday-to-Monday week"""
+    now = now or datetime.now()
+    today = datetime(now.year, now.month, now.day)
+    if frequency == 'Weekly':
+        end = today - timedelta(days=today.weekday())
+        return end - timedelta(days=7), end
+    end = today.replace(day=1)
+    return (end - timedelta(days=1)).replace(day=1), end
+
+@instrument_query("get_due_subscriptions")
+def get_due_subscriptions(frequency, period_end):
+    """[(user_id, email)] ordered by user, gathered from every shard"""
+    def due_on(shard):
+        with shard_cursor(shard) as cur:
+            cur.execute("""
+                SELECT user_id, email
+                FROM email_subscriptions
+                WHERE active AND frequency = %s
+                  AND (last_sent_at IS NULL OR last_sent_at < %s)
+                  AND user_id NOT IN (SELECT user_id FROM moved_users)
+            """, (frequency, period_end))
+            return cur.fetchall()
+
+    # A user caught mid-move can show up on both shards
+    due = {}
+    for rows in for_each_shard(due_on).values():
+        due.update(rows)
+    return sorted(due.items())
+
+def mark_sent(user_ids, sent_at):
+    if not user_ids:
+        return
+    groups = get_router().group(user_ids)
+
+    def mark_on(shard):
+        with shard_cursor(shard) as cur:
+            cur.execute("""
+                UPDATE email_subscriptions SET last_sent_at = %s
+                WHERE user_id = ANY(%s)
+            """, (sent_at, groups[shard]))
+
+    for_each_shard(mark_on, groups)
+
+def _is_transient(error):
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return False
+    return isinstance(error, (smtplib.SMTPException, OSError))
+
+def _send_with_retry(pool, limiter, msg):
+    for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+        limiter.acquire()
+        try:
+            pool.send(msg)
+            return
+        except Exception as e:
+            if attempt == MAX_SEND_ATTEMPTS or not _is_transient(e):
+                raise
+            logger.warning(f"Sending to {msg['To']} failed (attempt {attempt}): {str(e)}")
+            time.sleep(SEND_BACKOFF ** attempt * random.uniform(0.5, 1.0))
+
+def dispatch_reports(frequency, now=None, render_workers=4, smtp_connections=2, rate=5.0, settings=None):
+    """Send every due report for frequency; returns {'sent', 'failed'} counts"""
+    now = now or datetime.now()
+    start, end = report_period(frequency, now)
+    settings = settings or get_smtp_settings()
+    subscriptions = get_due_subscriptions(frequency, end)
+    if not subscriptions:
+        logger.info(f"No {frequency.lower()} reports due")
+        return {'sent': 0, 'failed': 0}
+
+    reports = window_summaries([user_id for user_id, _ in subscriptions], start, end)
+    title = f"{frequency} Financial Report"
+    pool = SMTPConnectionPool(settings, size=smtp_connections)
+    limiter = RateLimiter(rate)
+    sent, failed = [], []
+
+    try:
+        with ThreadPoolExecutor(render_workers, thread_name_prefix="report-render") as renderers, \
+                ThreadPoolExecutor(smtp_connections, thread_name_prefix="report-send") as senders:
+            rendering = {
+                renderers.submit(render_report, email, reports[user_id], settings['from_addr'], title): user_id
+                for user_id, email in subscriptions
+            }
+            sending = {}
+            for future in as_completed(rendering):
+                user_id = rendering[future]
+                try:
+                    sending[senders.submit(_send_with_retry, pool, limiter, future.result())] = user_id
+                except Exception as e:
+                    logger.error(f"Failed to render report for user {user_id}: {str(e)}")
+                    failed.append(user_id)
+            for future in as_completed(sending):
+                user_id = sending[future]
+                try:
+                    future.result()
+                    sent.append(user_id)
+                except Exception as e:
+                    logger.error(f"Failed to send report to user {user_id}: {str(e)}")
+                    failed.append(user_id)
+    finally:
+        pool.close_all()
+
+    mark_sent(sent, now)
+    logger.info(f"Sent {len(sent)} {frequency.lower()} report(s), {len(failed)} failed")
+    return {'sent': len(sent), 'failed': len(failed)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Send scheduled email reports")
+    parser.add_argument('--frequency', choices=FREQUENCIES, default='Monthly')
+    parser.add_argument('--render-workers', type=int, default=4)
+    parser.add_argument('--smtp-connections', type=int, default=2)
+    parser.add_argument('--rate', type=float, default=5.0, help="messages per second across all connections")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    result = dispatch_reports(
+        args.frequency,
+        render_workers=args.render_workers,
+        smtp_connections=args.smtp_connections,
+        rate=args.rate
+    )
+    return 1 if result['failed'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
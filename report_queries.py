@@ -0,0 +1,131 @@
+import logging
+from database import cursor, shard_cursor, for_each_shard, get_router
+from metrics import instrument_query
+
+logger = logging.getLogger(__name__)
+
+GRAINS = ('day', 'week', 'month', 'quarter', 'year')
+TOP_CATEGORIES = 5
+# Label of transactions without a category in the top categories
+UNCATEGORIZED = 'Uncategorized'
+
+class PeriodSummary:
+    """Spending for one user over one period, amounts in int cents; top_categories is [(category, total)] largest first"""
+    __slots__ = ('user_id', 'period_start', 'total_spent', 'transaction_count',
+                 'largest_transaction', 'top_categories')
+
+    def __init__(self, user_id, period_start, total_spent=0, transaction_count=0,
+                 largest_transaction=0, top_categories=None):
+        self.user_id = user_id
+        self.period_start = period_start
+        self.total_spent = total_spent
+        self.transaction_count = transaction_count
+        self.largest_transaction = largest_transaction
+        self.top_categories = top_categories or []
+
+    @property
+    def average_transaction(self):
+        return round(self.total_spent / self.transaction_count) if self.transaction_count else 0
+
+    def __repr__(self):
+        return (f"PeriodSummary(user_id={self.user_id}, period_start={self.period_start}, "
+                f"total_spent={self.total_spent}, transaction_count={self.transaction_count})")
+
+@instrument_query("period_summaries")
+def period_summaries(user_ids, start, end, grain=None, top=TOP_CATEGORIES):
+    """{user_id: [PeriodSummary]} for transactions in [start, end), one statement per shard for all its users.
+
+    With a grain ('day', 'week', 'month', ...) the window is split into
+    date_trunc buckets and each user gets one summary per bucket that has
+    transactions; without one each user gets a single summary starting at
+    start (zeros when there were no transactions). Only rows inside the window
+    are read, through the (user_id, date) index.
+    """
+    user_ids = list(user_ids)
+    if grain is not None and grain not in GRAINS:
+        raise ValueError(f"Unknown grain: {grain}")
+    summaries = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return summaries
+
+    period = "date_trunc(%(grain)s, date)" if grain else "%(start)s::timestamp"
+    groups = get_router().group(user_ids)
+
+    def summarize(shard):
+        with shard_cursor(shard) as cur:
+            cur.execute(f"""
+                WITH by_category AS (
+                    SELECT user_id, {period} AS period, COALESCE(category, %(uncategorized)s) AS category,
+                           SUM(amount_cents)::bigint AS category_total,
+                           COUNT(*) AS category_count,
+                           MAX(amount_cents) AS category_max
+                    FROM transactions
+                    WHERE user_id = ANY(%(user_ids)s) AND date >= %(start)s AND date < %(end)s
+                    GROUP BY 1, 2, 3
+                ),
+                ranked AS (
+                    SELECT user_id, period, category, category_total,
+                           (SUM(category_total) OVER per_period)::bigint AS total,
+                           SUM(category_count) OVER per_period AS count,
+                           MAX(category_max) OVER per_period AS largest,
+                           row_number() OVER (PARTITION BY user_id, period ORDER BY category_total DESC, category) AS rank
+                    FROM by_category
+                    WINDOW per_period AS (PARTITION BY user_id, period)
+                )
+                SELECT user_id, period, total, count, largest, category, category_total
+                FROM ranked
+                WHERE rank <= %(top)s
+                ORDER BY user_id, period, rank
+            """, {'user_ids': groups[shard], 'start': start, 'end': end, 'grain': grain, 'top': top,
+                  'uncategorized': UNCATEGORIZED})
+            return cur.fetchall()
+
+    for rows in for_each_shard(summarize, groups).values():
+        current = None
+        for user_id, period_start, total, count, largest, category, category_total in rows:
+            if current is None or current.user_id != user_id or current.period_start != period_start:
+                current = PeriodSummary(user_id, period_start, total, int(count), largest)
+                summaries[user_id].append(current)
+            current.top_categories.append((category, category_total))
+
+    if grain is None:
+        for user_id, periods in summaries.items():
+            if not periods:
+                periods.append(PeriodSummary(user_id, start))
+    return summaries
+
+def window_summaries(user_ids, start, end, top=TOP_CATEGORIES):
+    """{user_id: PeriodSummary} covering the whole window"""
+    return {
+        user_id: periods[0]
+        for user_id, periods in period_summaries(user_ids, start, end, top=top).items()
+    }
+
+def window_summary(user_id, start, end, top=TOP_CATEGORIES):
+    return window_summaries([user_id], start, end, top=top)[user_id]
+
+@instrument_query("history_bounds")
+def history_bounds(user_id):
+    """(first, last) transaction date for the user, or None without transactions"""
+    with cursor(user_id, readonly=True) as cur:
+        cur.execute("""
+            SELECT MIN(date), MAX(date) FROM transactions
+            WHERE user_id = %s AND date IS NOT NULL
+        """, (user_id,))
+        first, last = cur.fetchone()
+    return (first, last) if first is not None else None
+
+@instrument_query("spending_series")
+def spending_series(user_id, start, end, grain):
+    """[(bucket start, total cents)] per date_trunc bucket in [start, end), oldest first"""
+    if grain not in GRAINS:
+        raise ValueError(f"Unknown grain: {grain}")
+    with cursor(user_id, readonly=True) as cur:
+        cur.execute("""
+            SELECT date_trunc(%s, date) AS bucket, SUM(amount_cents)::bigint
+            FROM transactions
+            WHERE user_id = %s AND date >= %s AND date < %s
+            GROUP BY 1
+            ORDER BY 1
+        """, (grain, user_id, start, end))
+        return cur.fetchall()
@@ -0,0 +1,459 @@
+"""Routing of per-user data across Postgres shards.
+
+Usage:
+    python sharding.py status
+    python sharding.py register
+    python sharding.py locate --user USER_ID
+    python sharding.py move --user USER_ID --to SHARD
+
+Shards are configured with DB_SHARDS, a JSON object mapping shard names to
+libpq connection strings, e.g.
+    DB_SHARDS='{"a": "host=db-a dbname=ftp", "b": "host=db-b dbname=ftp"}'
+Without it there is one shard, "default", reached through the PG*
+variables, and routing costs nothing.
+
+Every table is keyed by user_id, so all of a user's rows live on one shard.
+The first shard is also the directory: shard_directory records the shard of
+every user. A user seen for the first time is placed by a consistent-hash
+ring over the shard names and recorded, so adding a shard never re-routes
+existing users; they move only through move_user. Run `register` once when
+sharding is enabled to record where existing users' rows already are.
+
+Shards keep their position in DB_SHARDS: it picks the range their
+transaction ids are allocated from (ensure_id_range), so a user's
+transactions keep their ids when they move.
+"""
+import os
+import sys
+import json
+import bisect
+import hashlib
+import tempfile
+import argparse
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD = 'default'
+# Points per shard on the hash ring; more points spread users more evenly
+RING_REPLICAS = 64
+# Cached user -> shard routes; a stale route is caught by the fence in ShardRouter.holds
+ROUTE_TTL = 30.0
+MAX_CACHED_ROUTES = 100000
+# Transaction ids of shard i start at i << ID_RANGE_BITS
+ID_RANGE_BITS = 48
+# Two-key advisory lock: shared by every per-user transaction, exclusive for the last step of a move
+SHARD_LOCK_KEY = 7203413
+# A move re-copies changed transactions up to this many times before blocking the user's writes
+CATCH_UP_ROUNDS = 5
+# ... and blocks them once no more than this many changed while a round ran
+FINAL_CHANGES = 100
+CLEANUP_BATCH_ROWS = 10000
+COPY_SPOOL_BYTES = 8 * 1024 * 1024
+# Per-user tables besides users and transactions, parents first. They are small and copied
+# whole in the last step of a move; nothing refers to their ids, so rows get new ones there.
+# budget_spend is not among them: triggers derive it on the target from the copied transactions.
+USER_TABLES = ('transaction_categories', 'budgets', 'categorization_rules', 'bank_sync_state',
+               'email_subscriptions', 'transaction_archive_months')
+
+class ShardRoutingError(Exception):
+    """Raised when a user's shard cannot be settled, e.g. while they are moved repeatedly"""
+
+def configured_shards():
+    """[(name, connection string)] in DB_SHARDS order; [('default', None)] when it is unset"""
+    raw = os.environ.get('DB_SHARDS')
+    if not raw:
+        return [(DEFAULT_SHARD, None)]
+    shards = json.loads(raw)
+    if not isinstance(shards, dict) or not shards:
+        raise ValueError("DB_SHARDS must be a non-empty JSON object of shard name to connection string")
+    return list(shards.items())
+
+def _hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """Consistent-hash ring over shard names: adding a shard takes over about 1/n of the keys"""
+
+    def __init__(self, names, replicas=RING_REPLICAS):
+        points = sorted((_hash(f"{name}#{replica}"), name) for name in names for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def shard_for(self, key):
+        index = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._names[index]
+
+class ShardRouter:
+    """Maps user ids to shards through the directory, caching routes for route_ttl seconds.
+
+    directory_connection() is a context manager yielding a connection to the
+    directory shard (database.shard_connection).
+    """
+
+    def __init__(self, shards, directory_connection, route_ttl=ROUTE_TTL, max_routes=MAX_CACHED_ROUTES):
+        self.shards = list(shards)
+        self.directory = self.shards[0]
+        self.sharded = len(self.shards) > 1
+        self.route_ttl = route_ttl
+        self.max_routes = max_routes
+        self._ring = HashRing(self.shards)
+        self._directory_connection = directory_connection
+        self._lock = threading.Lock()
+        self._routes = OrderedDict()  # user_id -> (shard, fetched_at)
+        self._stats = {'hits': 0, 'lookups': 0, 'placements': 0, 'stale_routes': 0}
+
+    def shard_for(self, user_id):
+        """The user's shard; the directory shard for user_id None. Unknown users are placed."""
+        if not self.sharded or user_id is None:
+            return self.directory
+        with self._lock:
+            route = self._routes.get(user_id)
+            if route is not None and time.monotonic() - route[1] < self.route_ttl:
+                self._routes.move_to_end(user_id)
+                self._stats['hits'] += 1
+                return route[0]
+
+        with self._directory_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT shard FROM shard_directory WHERE user_id = %s", (user_id,))
+                row = cur.fetchone()
+                placed = False
+                if row is None:
+                    cur.execute("""
+                        INSERT INTO shard_directory (user_id, shard) VALUES (%s, %s)
+                        ON CONFLICT (user_id) DO NOTHING
+                    """, (user_id, self._ring.shard_for(user_id)))
+                    placed = cur.rowcount == 1
+                    # A concurrent placement wins the conflict; read whichever was recorded
+                    cur.execute("SELECT shard FROM shard_directory WHERE user_id = %s", (user_id,))
+                    row = cur.fetchone()
+                shard = row[0]
+        if shard not in self.shards:
+            raise ShardRoutingError(f"User {user_id} is on shard {shard}, which is not in DB_SHARDS")
+        if placed:
+            logger.info(f"Placed user {user_id} on shard {shard}")
+
+        with self._lock:
+            self._stats['lookups'] += 1
+            self._stats['placements'] += placed
+            self._routes[user_id] = (shard, time.monotonic())
+            self._routes.move_to_end(user_id)
+            while len(self._routes) > self.max_routes:
+                self._routes.popitem(last=False)
+        return shard
+
+    def forget(self, user_id):
+        with self._lock:
+            self._routes.pop(user_id, None)
+
+    def holds(self, conn, user_id, lock=True):
+        """Whether conn's shard still holds the user, checked at the start of its transaction.
+
+        The shared lock is held until the transaction ends, so the last step
+        of a move (which takes it exclusively) waits for transactions in
+        flight, and transactions arriving meanwhile wait and then see the
+        user in moved_users. Replica reads pass lock=False.
+        """
+        if not self.sharded:
+            return True
+        with conn.cursor() as cur:
+            if lock:
+                cur.execute("SELECT pg_advisory_xact_lock_shared(%s, %s)", (SHARD_LOCK_KEY, user_id))
+            # A separate statement, so its snapshot is taken after any wait on the lock
+            cur.execute("SELECT EXISTS (SELECT 1 FROM moved_users WHERE user_id = %s)", (user_id,))
+            moved = cur.fetchone()[0]
+        if moved:
+            with self._lock:
+                self._stats['stale_routes'] += 1
+        return not moved
+
+    def place(self, user_id, shard, cur=None):
+        """Record the user's shard in the directory"""
+        sql = """
+            INSERT INTO shard_directory (user_id, shard, moved_at) VALUES (%s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE SET shard = EXCLUDED.shard, moved_at = EXCLUDED.moved_at
+        """
+        if cur is not None:
+            cur.execute(sql, (user_id, shard))
+        else:
+            with self._directory_connection() as conn:
+                with conn.cursor() as own_cur:
+                    own_cur.execute(sql, (user_id, shard))
+        self.forget(user_id)
+
+    def group(self, user_ids):
+        """{shard: [user_id]} for the given users"""
+        groups = {}
+        for user_id in user_ids:
+            groups.setdefault(self.shard_for(user_id), []).append(user_id)
+        return groups
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_routes'] = len(self._routes)
+        return stats
+
+def ensure_id_range(conn, index):
+    """Start the shard's transaction ids at index << ID_RANGE_BITS, so ids stay unique across shards"""
+    if index == 0:
+        return
+    floor = index << ID_RANGE_BITS
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_get_serial_sequence('transactions', 'id')")
+        sequence = cur.fetchone()[0]
+        cur.execute(
+            "SELECT setval(%s::regclass, %s) WHERE COALESCE(pg_sequence_last_value(%s::regclass), 0) < %s",
+            (sequence, floor, sequence, floor)
+        )
+        if cur.rowcount:
+            logger.info(f"Transaction ids on this shard start at {floor}")
+    conn.commit()
+
+def _columns(cur, table, with_id=True):
+    # Generated columns (description_search) are recomputed on the target
+    cur.execute("""
+        SELECT quote_ident(attname) FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+        ORDER BY attnum
+    """, (table,))
+    return [name for (name,) in cur.fetchall() if with_id or name != 'id']
+
+def _copy(source_cur, target_cur, table, columns, where, params):
+    """Copy table rows matching where from the source shard to the target; returns rows copied"""
+    column_list = ', '.join(columns)
+    select = source_cur.mogrify(f"SELECT {column_list} FROM {table} WHERE {where}", params).decode()
+    with tempfile.SpooledTemporaryFile(max_size=COPY_SPOOL_BYTES) as spool:
+        source_cur.copy_expert(f"COPY ({select}) TO STDOUT", spool)
+        copied = source_cur.rowcount
+        spool.seek(0)
+        target_cur.copy_expert(f"COPY {table} ({column_list}) FROM STDIN", spool)
+    return copied
+
+def _change_version(cur, user_id):
+    """The user's newest change-log id"""
+    cur.execute("SELECT COALESCE(max(id), 0) FROM transaction_changes WHERE user_id = %s", (user_id,))
+    return cur.fetchone()[0]
+
+def _changes_since(cur, user_id, horizon):
+    """(watermark, ids of the user's transactions in change-log entries at or above horizon).
+
+    Change-log ids follow insert order, not commit order, so a late commit can
+    log below an id already seen. Entries carry their writer's xid instead
+    (migration 0014): every entry the statement's snapshot cannot see is at
+    or above its xmin, which is the watermark for the next call. Entries
+    seen before may come back; copying them again is harmless.
+    """
+    cur.execute("""
+        SELECT w.xmin::text, ARRAY(
+            SELECT DISTINCT transaction_id FROM transaction_changes
+            WHERE user_id = %s AND xid >= %s::text::xid8
+        )
+        FROM (SELECT pg_snapshot_xmin(pg_current_snapshot()) AS xmin) w
+    """, (user_id, horizon))
+    return cur.fetchone()
+
+def _copy_changed(source_cur, target_cur, columns, user_id, ids):
+    # Deleted rows are simply not copied back
+    target_cur.execute("DELETE FROM transactions WHERE user_id = %s AND id = ANY(%s)", (user_id, ids))
+    return _copy(source_cur, target_cur, 'transactions', columns, "user_id = %s AND id = ANY(%s)", (user_id, ids))
+
+def _delete_user_rows(conn, user_id, include_user=False):
+    """Delete the user's rows from one shard, transactions in batches; moved_users is kept"""
+    with conn.cursor() as cur:
+        while True:
+            cur.execute("""
+                DELETE FROM transactions WHERE id IN (
+                    SELECT id FROM transactions WHERE user_id = %s LIMIT %s
+                )
+            """, (user_id, CLEANUP_BATCH_ROWS))
+            conn.commit()
+            if cur.rowcount < CLEANUP_BATCH_ROWS:
+                break
+        for table in reversed(USER_TABLES):
+            cur.execute(f"DELETE FROM {table} WHERE user_id = %s", (user_id,))
+        # Only zeroed by the transaction deletes
+        cur.execute("DELETE FROM budget_spend WHERE user_id = %s", (user_id,))
+        if include_user:
+            cur.execute("DELETE FROM users WHERE id = %s", (user_id,))
+    conn.commit()
+
+def move_user(user_id, target):
+    """Move all of the user's rows to the target shard while the application keeps serving them.
+
+    Transactions are bulk-copied first, then the ones changed meanwhile (per
+    the change log, followed by commit order) are re-copied until few remain. Only the last step blocks
+    the user's requests: it holds the shard lock on the source while the
+    final changes and the small per-user tables are copied, the directory is
+    updated and the user is recorded in the source's moved_users, which turns
+    away requests that arrive with the old route. Rows left on the source are
+    deleted afterwards. Returns the number of transactions moved.
+
+    Archive files are referenced by path and stay where they are, so
+    ARCHIVE_DIR must be shared by every shard's application servers.
+    """
+    from database import get_router, get_replicas, shard_connection
+
+    router = get_router()
+    if target not in router.shards:
+        raise ValueError(f"Unknown shard: {target}")
+    router.forget(user_id)
+    source = router.shard_for(user_id)
+    if source == target:
+        logger.info(f"User {user_id} is already on shard {target}")
+        return 0
+
+    started = time.monotonic()
+    with shard_connection(source) as source_conn, shard_connection(target) as target_conn:
+        source_cur = source_conn.cursor()
+        target_cur = target_conn.cursor()
+        columns = _columns(source_cur, 'transactions')
+
+        # Leftovers of an earlier, interrupted move
+        _delete_user_rows(target_conn, user_id)
+        target_cur.execute("SELECT 1 FROM users WHERE id = %s", (user_id,))
+        if target_cur.fetchone() is None:
+            _copy(source_cur, target_cur, 'users', _columns(source_cur, 'users'), "id = %s", (user_id,))
+
+        # Take the watermark before the rows; changes the copy may miss are at or above it
+        horizon, _ = _changes_since(source_cur, user_id, None)
+        moved = _copy(source_cur, target_cur, 'transactions', columns, "user_id = %s", (user_id,))
+        source_conn.commit()
+        target_conn.commit()
+        logger.info(f"Copied {moved} transactions of user {user_id} from {source} to {target}")
+
+        # A long transaction elsewhere on the source holds the watermark back, and rounds re-copy
+        # more than changed; the last step then copies what is left while blocking the user
+        for _ in range(CATCH_UP_ROUNDS):
+            next_horizon, changed = _changes_since(source_cur, user_id, horizon)
+            if changed:
+                _copy_changed(source_cur, target_cur, columns, user_id, changed)
+            source_conn.commit()
+            target_conn.commit()
+            horizon = next_horizon
+            if len(changed) <= FINAL_CHANGES:
+                break
+
+        # Last step: the user's requests wait on the lock until the move is recorded. Their
+        # writes all hold the lock shared, so once it is granted every change has committed
+        blocked = time.monotonic()
+        source_cur.execute("SELECT pg_advisory_xact_lock(%s, %s)", (SHARD_LOCK_KEY, user_id))
+        _, changed = _changes_since(source_cur, user_id, horizon)
+        if changed:
+            _copy_changed(source_cur, target_cur, columns, user_id, changed)
+        latest = _change_version(source_cur, user_id)
+        for table in USER_TABLES:
+            target_cur.execute(f"DELETE FROM {table} WHERE user_id = %s", (user_id,))
+            _copy(source_cur, target_cur, table, _columns(source_cur, table, with_id=False), "user_id = %s", (user_id,))
+        source_cur.execute("SELECT email, google_id FROM users WHERE id = %s", (user_id,))
+        target_cur.execute("UPDATE users SET email = %s, google_id = %s WHERE id = %s", source_cur.fetchone() + (user_id,))
+
+        # Change-log versions keep growing across the move, and the 'M' entry makes
+        # transaction caches reload the user in full rather than apply a delta
+        target_cur.execute("""
+            SELECT setval(pg_get_serial_sequence('transaction_changes', 'id'),
+                          GREATEST(%s, (SELECT COALESCE(max(id), 0) FROM transaction_changes)))
+        """, (latest,))
+        target_cur.execute(
+            "INSERT INTO transaction_changes (user_id, transaction_id, operation) VALUES (%s, 0, 'M')",
+            (user_id,)
+        )
+        target_cur.execute("DELETE FROM moved_users WHERE user_id = %s", (user_id,))
+        target_conn.commit()
+        # Replica reads on the target must not find the user missing
+        replicas = get_replicas(target)
+        if replicas is not None and not replicas.catch_up(target_conn):
+            logger.warning(f"Replicas of shard {target} have not replayed the move of user {user_id} yet")
+        router.place(user_id, target)
+        source_cur.execute("""
+            INSERT INTO moved_users (user_id, shard) VALUES (%s, %s)
+            ON CONFLICT (user_id) DO UPDATE SET shard = EXCLUDED.shard, moved_at = CURRENT_TIMESTAMP
+        """, (user_id, target))
+        source_conn.commit()
+        logger.info(f"User {user_id} now on shard {target}; requests blocked for {time.monotonic() - blocked:.3f}s")
+
+        _delete_user_rows(source_conn, user_id, include_user=True)
+
+    from database import invalidate_transactions
+    invalidate_transactions(user_id)
+    logger.info(f"Moved user {user_id} from {source} to {target} in {time.monotonic() - started:.1f}s")
+    return moved
+
+def register_users():
+    """Record the shard of every user found in a shard's users table; returns {shard: users recorded}"""
+    from database import get_router, shard_connection, for_each_shard
+
+    router = get_router()
+
+    def users_on(shard):
+        with shard_connection(shard) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT id FROM users WHERE id NOT IN (SELECT user_id FROM moved_users)")
+                return [row[0] for row in cur.fetchall()]
+
+    found = for_each_shard(users_on)
+    owners = {}
+    for shard, user_ids in found.items():
+        for user_id in user_ids:
+            owners.setdefault(user_id, []).append(shard)
+    recorded = {shard: 0 for shard in router.shards}
+    with shard_connection(router.directory) as conn:
+        with conn.cursor() as cur:
+            for user_id, shards in sorted(owners.items()):
+                if len(shards) > 1:
+                    logger.warning(f"User {user_id} has rows on shards {', '.join(shards)}; keeping the directory entry")
+                cur.execute("""
+                    INSERT INTO shard_directory (user_id, shard) VALUES (%s, %s)
+                    ON CONFLICT (user_id) DO NOTHING
+                """, (user_id, shards[0]))
+                recorded[shards[0]] += cur.rowcount
+    return recorded
+
+def shard_status():
+    """{shard: (users, transactions)} counted on each shard"""
+    from database import shard_connection, for_each_shard
+
+    def count(shard):
+        with shard_connection(shard) as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT count(*) FROM users")
+                users = cur.fetchone()[0]
+                cur.execute("SELECT count(*) FROM transactions")
+                return users, cur.fetchone()[0]
+
+    return for_each_shard(count)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and rebalance user shards")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help="users and transactions per shard")
+    subparsers.add_parser('register', help="record the shard of users not yet in the directory")
+    locate = subparsers.add_parser('locate', help="show a user's shard")
+    locate.add_argument('--user', type=int, required=True)
+    move = subparsers.add_parser('move', help="move a user's rows to another shard")
+    move.add_argument('--user', type=int, required=True)
+    move.add_argument('--to', required=True, help="target shard name")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    from database import get_router
+
+    if args.command == 'status':
+        for shard, (users, transactions) in shard_status().items():
+            print(f"{shard:<16} {users:8d} users  {transactions:12d} transactions")
+    elif args.command == 'register':
+        for shard, recorded in register_users().items():
+            print(f"{shard:<16} {recorded:8d} users recorded")
+    elif args.command == 'locate':
+        print(get_router().shard_for(args.user))
+    else:
+        moved = move_user(args.user, args.to)
+        print(f"Moved {moved} transactions of user {args.user} to {args.to}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
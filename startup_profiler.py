@@ -0,0 +1,85 @@
+"""Import and first-render timing for cold starts.
+
+Page modules are loaded through load() and rendered inside first_render(),
+which record into the metrics registry. With STARTUP_PROFILE=1 each first
+import and first render is also logged together with the heavy packages it
+pulled in, e.g.
+
+    Imported components.dashboard in 612.4 ms (pulled in numpy, pandas, plotly)
+
+For a per-module breakdown of everything imported, run
+`python -m benchmarks.cold_start`, which uses `python -X importtime`.
+"""
+import os
+import sys
+import time
+import threading
+import importlib
+import logging
+from contextlib import contextmanager
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('STARTUP_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+_lock = threading.Lock()
+_imports = {}  # module -> (seconds, new top-level packages)
+_renders = {}  # page -> seconds
+
+def _packages():
+    return {name.partition('.')[0] for name in list(sys.modules)}
+
+def load(module_name):
+    """importlib.import_module that records how long the first import took"""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+
+    before = _packages()
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    elapsed = time.perf_counter() - start
+    pulled_in = sorted(_packages() - before - {module_name.partition('.')[0]})
+
+    REGISTRY.histogram(
+        'module_import_seconds', "Time to import lazily loaded modules", module=module_name
+    ).observe(elapsed)
+    with _lock:
+        _imports.setdefault(module_name, (elapsed, pulled_in))
+    if ENABLED:
+        extra = f" (pulled in {', '.join(pulled_in)})" if pulled_in else ""
+        logger.info(f"Imported {module_name} in {elapsed * 1000:.1f} ms{extra}")
+    return module
+
+@contextmanager
+def first_render(page):
+    """Time the block if it is the page's first render in this process"""
+    with _lock:
+        first = page not in _renders
+        if first:
+            _renders[page] = None
+    if not first:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            _renders[page] = elapsed
+        REGISTRY.histogram(
+            'page_first_render_seconds', "First render of each page in this process", page=page
+        ).observe(elapsed)
+        if ENABLED:
+            logger.info(f"First render of {page} took {elapsed * 1000:.1f} ms")
+
+def report():
+    """{'imports': {module: (seconds, pulled in)}, 'first_renders': {page: seconds}}"""
+    with _lock:
+        return {
+            'imports': dict(_imports),
+            'first_renders': {page: seconds for page, seconds in _renders.items() if seconds is not None},
+        }
@@ -0,0 +1,82 @@
+"""Shared test fixtures.
+
+Tests that take `db` or `user_id` need PostgreSQL: by default a throwaway
+cluster from benchmarks.pg_fixture (initdb and pg_ctl on PATH or in PG_BIN;
+PostgreSQL refuses to run as root), or with --use-env the database in the
+PG* environment, whose public schema is dropped and recreated. They are
+skipped when neither is available. Everything else runs without a database.
+"""
+import itertools
+import os
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Users created by the user_id fixture; each test gets its own
+_user_ids = itertools.count(1000)
+
+def pytest_addoption(parser):
+    parser.addoption('--use-env', action='store_true',
+                     help="run database tests against the PG* environment (its schema is wiped)")
+
+def _migrate():
+    import database
+    import migrate
+
+    # One unsharded database without replicas, whatever the shell has configured
+    os.environ.pop('DB_SHARDS', None)
+    os.environ.pop('DB_REPLICAS', None)
+    conn = database.get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("DROP SCHEMA public CASCADE")
+            cur.execute("CREATE SCHEMA public")
+        conn.commit()
+        migrate.run_migrations(conn)
+    finally:
+        conn.close()
+
+@pytest.fixture(scope='session')
+def db(request):
+    """A freshly migrated database for the test session"""
+    from benchmarks.pg_fixture import local_postgres
+
+    if request.config.getoption('--use-env'):
+        _migrate()
+        yield
+        return
+
+    cluster = local_postgres('financetrack_test')
+    try:
+        env = cluster.__enter__()
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        pytest.skip(f"PostgreSQL is not available: {e}")
+    try:
+        os.environ.update(env)
+        _migrate()
+        yield
+    finally:
+        import database
+
+        database.get_pool().close_all()
+        cluster.__exit__(None, None, None)
+
+@pytest.fixture
+def make_user(db):
+    """make_user() creates a user with no transactions and returns their id"""
+    from database import cursor
+
+    def make():
+        user_id = next(_user_ids)
+        with cursor(user_id) as cur:
+            cur.execute("INSERT INTO users (id, email) VALUES (%s, %s)", (user_id, f"user{user_id}@example.com"))
+        return user_id
+    return make
+
+@pytest.fixture
+def user_id(make_user):
+    """A new user with no transactions"""
+    return make_user()
@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import bank_sync
+from bank_sync import BankClient, BankPayment, FakeBankClient, SyncEngine, SyncWorker, get_sync_status
+from database import cursor
+
+START = datetime(2026, 1, 5, 9, 0)
+
+def _payments(count, first=0):
+    return [
+        BankPayment(f"PM{i:04d}", 100 + i, f"Payment {i}", START + timedelta(minutes=i))
+        for i in range(first, first + count)
+    ]
+
+def _stored(user_id):
+    with cursor(user_id) as cur:
+        cur.execute("""
+            SELECT bank_reference, amount_cents FROM transactions
+            WHERE user_id = %s ORDER BY bank_reference
+        """, (user_id,))
+        return cur.fetchall()
+
+def test_bank_client_is_abstract():
+    with pytest.raises(TypeError):
+        BankClient()
+
+def test_fake_client_pages_oldest_first():
+    client = FakeBankClient(list(reversed(_payments(5))))
+
+    page, cursor = client.list_payments(limit=2)
+    assert [p.reference for p in page] == ['PM0000', 'PM0001']
+    page, cursor = client.list_payments(cursor=cursor, limit=2)
+    assert [p.reference for p in page] == ['PM0002', 'PM0003']
+    page, cursor = client.list_payments(cursor=cursor, limit=2)
+    assert [p.reference for p in page] == ['PM0004']
+    assert cursor is None
+
+    page, cursor = client.list_payments(created_after=START + timedelta(minutes=2), limit=10)
+    assert [p.reference for p in page] == ['PM0003', 'PM0004']
+
+def test_sync_walks_every_page(user_id):
+    client = FakeBankClient(_payments(7))
+
+    assert SyncEngine(client, page_size=3).sync_user(user_id) == 7
+    assert client.calls == 3
+    assert _stored(user_id) == [(f"PM{i:04d}", 100 + i) for i in range(7)]
+    status = get_sync_status(user_id)
+    assert status['status'] == 'ok'
+    assert status['high_water_mark'] == START + timedelta(minutes=6)
+
+def test_sync_skips_redelivered_payments(user_id):
+    payments = _payments(4)
+    # PM0001 comes twice within a page and PM0002 again on the next page
+    client = FakeBankClient(payments + [payments[1], payments[2]])
+
+    assert SyncEngine(client, page_size=3).sync_user(user_id) == 4
+    assert len(_stored(user_id)) == 4
+
+    # A later sync that re-sends a stored payment alongside a new one
+    redelivered = BankPayment('PM0003', 103, "Payment 3", START + timedelta(hours=1))
+    client = FakeBankClient([redelivered] + _payments(1, first=4))
+    assert SyncEngine(client).sync_user(user_id) == 1
+    assert _stored(user_id) == [(f"PM{i:04d}", 100 + i) for i in range(5)]
+
+def test_worker_retries_with_exponential_backoff(user_id, monkeypatch):
+    delays = []
+    monkeypatch.setattr(bank_sync.time, 'sleep', delays.append)
+    monkeypatch.setattr(bank_sync.random, 'uniform', lambda low, high: high)
+    client = FakeBankClient(_payments(3), fail_times=2)
+    worker = SyncWorker(lambda: client, max_attempts=3, backoff_base=2.0)
+
+    assert worker.enqueue(user_id)
+    worker._queue.join()
+
+    assert delays == [2.0, 4.0]
+    assert client.calls == 3
+    assert len(_stored(user_id)) == 3
+    assert get_sync_status(user_id)['status'] == 'ok'
+
+def test_worker_records_error_after_last_attempt(user_id, monkeypatch):
+    delays = []
+    monkeypatch.setattr(bank_sync.time, 'sleep', delays.append)
+    monkeypatch.setattr(bank_sync.random, 'uniform', lambda low, high: high)
+    client = FakeBankClient(_payments(3), fail_times=5)
+    worker = SyncWorker(lambda: client, max_attempts=2, backoff_base=2.0)
+
+    assert worker.enqueue(user_id)
+    worker._queue.join()
+
+    assert delays == [2.0]
+    assert _stored(user_id) == []
+    status = get_sync_status(user_id)
+    assert status['status'] == 'error'
+    assert status['last_error'] == "Fake bank API unavailable"
+    # The failed sync no longer counts as pending
+    assert worker.enqueue(user_id)
+    worker._queue.join()
+
+def test_enqueue_failure_does_not_block_later_syncs(monkeypatch):
+    def unavailable(user_id, status, **kwargs):
+        raise ConnectionError("database unavailable")
+
+    def no_bank():
+        raise ConnectionError("bank unavailable")
+
+    monkeypatch.setattr(bank_sync, 'set_sync_status', unavailable)
+    worker = SyncWorker(no_bank, max_attempts=1)
+    with pytest.raises(ConnectionError):
+        worker.enqueue(7)
+
+    statuses = []
+    monkeypatch.setattr(bank_sync, 'set_sync_status', lambda user_id, status, **kwargs: statuses.append(status))
+    assert worker.enqueue(7)
+    worker._queue.join()
+    assert statuses == ['queued', 'running', 'error']
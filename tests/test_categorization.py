@@ -0,0 +1,61 @@
+import pandas as pd
+
+from categorization import DEFAULT_CATEGORY, CategorizationEngine, Rule, builtin_rules, get_engine, save_rule
+
+def test_builtin_keywords():
+    engine = CategorizationEngine(builtin_rules())
+
+    assert engine.categorize("UBER *TRIP") == 'Transport'
+    assert engine.categorize("Corner Cafe") == 'Food'
+    assert engine.categorize("Rent") == DEFAULT_CATEGORY
+    assert engine.categorize(None) == DEFAULT_CATEGORY
+
+def test_higher_priority_wins_then_rule_order():
+    engine = CategorizationEngine([
+        Rule('amazon', 'Shopping', priority=0),
+        Rule('prime', 'Entertainment', priority=10),
+        Rule('video', 'Food', priority=10),
+    ])
+
+    assert engine.categorize("Amazon Prime Video") == 'Entertainment'
+    assert engine.categorize("Amazon order") == 'Shopping'
+
+def test_keyword_inside_a_longer_keyword():
+    # "gas" is inside "gas station"; the higher-priority shorter keyword still applies
+    engine = CategorizationEngine([
+        Rule('gas station', 'Transport', priority=0),
+        Rule('gas', 'Bills', priority=5),
+    ])
+
+    assert engine.categorize("Shell gas station") == 'Bills'
+
+def test_amount_ranges_are_inclusive_cents():
+    engine = CategorizationEngine([
+        Rule('amazon', 'Electronics', priority=20, min_amount_cents=10000),
+        Rule('amazon', 'Books', priority=20, max_amount_cents=2000),
+        Rule('amazon', 'Shopping', priority=10),
+    ])
+
+    assert engine.categorize("amazon", 10000) == 'Electronics'
+    assert engine.categorize("amazon", 9999) == 'Shopping'
+    assert engine.categorize("amazon", 2000) == 'Books'
+    # Rules with amount bounds do not apply without an amount
+    assert engine.categorize("amazon") == 'Shopping'
+
+def test_categorize_many_matches_categorize():
+    engine = CategorizationEngine([Rule('amazon', 'Electronics', priority=20, min_amount_cents=10000)] + builtin_rules())
+    descriptions = pd.Series(["Amazon", "uber", None, "amazon"], index=[10, 11, 12, 13])
+    amounts = [15000, 800, 100, 500]
+
+    result = engine.categorize_many(descriptions, amounts)
+
+    assert list(result.index) == [10, 11, 12, 13]
+    assert result.tolist() == ['Electronics', 'Transport', DEFAULT_CATEGORY, 'Shopping']
+    assert engine.categorize_many(["amazon", "water bill"]) == ['Shopping', 'Bills']
+
+def test_user_rules_rank_above_builtins(user_id):
+    assert get_engine(user_id).categorize("Amazon Fresh") == 'Shopping'
+
+    save_rule(user_id, "Fresh", 'Food')
+
+    assert get_engine(user_id).categorize("Amazon Fresh") == 'Food'
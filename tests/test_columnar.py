@@ -0,0 +1,73 @@
+from datetime import datetime
+
+import numpy as np
+
+from columnar import TransactionColumns, as_frame
+
+EPOCH = datetime(1970, 1, 1)
+
+def _row(id, amount_cents, category, description, date, tags=None):
+    micros = None if date is None else int((date - EPOCH).total_seconds() * 1000000)
+    return (id, 1, amount_cents, category, description, micros, None, tags)
+
+def _columns(*rows):
+    return TransactionColumns.from_rows(list(rows))
+
+def test_from_rows_encodes_categories_and_dates():
+    columns = _columns(
+        _row(1, 500, 'Food', 'lunch', datetime(2026, 1, 2, 12, 30), ['work']),
+        _row(2, 250, None, 'cash', None),
+        _row(3, 700, 'Food', 'dinner', datetime(2026, 1, 3), ['work']),
+    )
+
+    assert len(columns) == 3
+    assert columns.categories.tolist() == ['Food']
+    assert columns.category_codes.tolist() == [0, -1, 0]
+    assert columns.category.tolist() == ['Food', None, 'Food']
+    assert columns[0]['date'] == datetime(2026, 1, 2, 12, 30)
+    assert columns[1]['date'] is None
+    assert columns[-1]['tags'] is columns[0]['tags']
+    assert columns[2].as_dict()['amount_cents'] == 700
+
+def test_concat_merges_category_dictionaries():
+    first = _columns(_row(1, 100, 'Food', 'a', datetime(2026, 1, 1)), _row(2, 200, 'Bills', 'b', datetime(2026, 1, 2)))
+    second = _columns(_row(3, 300, 'Bills', 'c', datetime(2026, 1, 3)), _row(4, 400, None, 'd', datetime(2026, 1, 4)),
+                      _row(5, 500, 'Travel', 'e', datetime(2026, 1, 5)))
+
+    merged = TransactionColumns.concat([first, TransactionColumns.empty(), second])
+
+    assert merged.id.tolist() == [1, 2, 3, 4, 5]
+    assert merged.categories.tolist() == ['Food', 'Bills', 'Travel']
+    assert merged.category.tolist() == ['Food', 'Bills', 'Bills', None, 'Travel']
+    assert len(TransactionColumns.concat([])) == 0
+
+def test_category_totals_are_exact_cents():
+    big = 2 ** 53 + 1  # not representable as float64
+    columns = _columns(
+        _row(1, big, 'Bills', 'a', datetime(2026, 1, 1)),
+        _row(2, 1, 'Bills', 'b', datetime(2026, 1, 2)),
+        _row(3, 250, 'Food', 'c', datetime(2026, 1, 3)),
+        _row(4, 999, None, 'd', datetime(2026, 1, 4)),
+    )
+
+    assert columns.category_totals() == {'Bills': big + 1, 'Food': 250}
+
+def test_newest_first_and_without_ids():
+    columns = _columns(
+        _row(1, 100, 'Food', 'a', datetime(2026, 1, 2)),
+        _row(2, 200, 'Food', 'b', None),
+        _row(3, 300, 'Food', 'c', datetime(2026, 1, 2)),
+        _row(4, 400, 'Food', 'd', datetime(2026, 1, 5)),
+    )
+
+    assert columns.newest_first().id.tolist() == [4, 3, 1, 2]
+    assert columns.without_ids([1, 4]).id.tolist() == [2, 3]
+
+def test_to_frame_shares_the_arrays():
+    columns = _columns(_row(1, 100, 'Food', 'a', datetime(2026, 1, 1)), _row(2, 200, None, 'b', datetime(2026, 1, 2)))
+
+    frame = as_frame(columns)
+
+    assert frame['amount_cents'].sum() == 300
+    assert frame['category'].tolist()[0] == 'Food' and frame['category'].isna().tolist() == [False, True]
+    assert np.shares_memory(frame['amount_cents'].to_numpy(), columns.amount_cents)
@@ -0,0 +1,46 @@
+import io
+
+import pandas as pd
+
+from categorization import get_builtin_engine
+from csv_import import MAX_CATEGORY_LENGTH, _validate_chunk, import_csv
+from database import cursor
+
+LONG_CATEGORY = 'x' * (MAX_CATEGORY_LENGTH + 1)
+
+def _upload(text):
+    upload = io.BytesIO(text.encode())
+    upload.size = len(upload.getvalue())
+    return upload
+
+def test_validate_chunk_rejects_bad_rows():
+    chunk = pd.DataFrame({
+        'amount': ['12.34', 'abc', '5', '7', '1'],
+        'category': ['Food', 'Food', 'Food', LONG_CATEGORY, ''],
+        'description': ['lunch', 'bad amount', 'bad date', 'long category', 'uber ride'],
+        'date': ['2026-01-02', '2026-01-02', '02/01/2026', '2026-01-02', '2026-01-03'],
+    }, dtype=str)
+
+    staging, errors = _validate_chunk(chunk, 2, get_builtin_engine())
+
+    assert [line for line, _ in errors] == [3, 4, 5]
+    assert errors[0][1] == "invalid amount 'abc'"
+    assert errors[1][1].startswith("invalid date '02/01/2026'")
+    assert errors[2][1] == f"category longer than {MAX_CATEGORY_LENGTH} characters"
+    assert staging['amount_cents'].tolist() == [1234, 100]
+    # Rows without a category are categorized from their description
+    assert staging['category'].tolist() == ['Food', 'Transport']
+
+def test_import_skips_over_length_categories(user_id):
+    result = import_csv(user_id, _upload(
+        "amount,category,description,date\n"
+        "10.00,Food,lunch,2026-01-02\n"
+        f"20.00,{LONG_CATEGORY},long,2026-01-02\n"
+        "30.00,,uber,2026-01-03\n"
+    ))
+
+    assert (result.imported, result.skipped) == (2, 1)
+    assert result.errors == [(3, f"category longer than {MAX_CATEGORY_LENGTH} characters")]
+    with cursor(user_id) as cur:
+        cur.execute("SELECT amount_cents, category FROM transactions WHERE user_id = %s ORDER BY date", (user_id,))
+        assert cur.fetchall() == [(1000, 'Food'), (3000, 'Transport')]
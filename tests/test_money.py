@@ -0,0 +1,44 @@
+from decimal import Decimal
+
+import pytest
+
+from money import MAX_CENTS, cents_array, cents_from_arrow, format_money, to_arrow_decimal, to_cents, to_units
+
+@pytest.mark.parametrize('value, cents', [
+    (12, 1200),
+    (0.29, 29),  # 0.29 * 100 is 28.999999999999996 in float
+    (1.005, 101),
+    (-1.005, -101),  # half away from zero
+    ('19.995', 2000),
+    (' 7.5 ', 750),
+    (Decimal('0.004'), 0),
+    (None, None),
+])
+def test_to_cents_rounds_half_up(value, cents):
+    assert to_cents(value) == cents
+
+@pytest.mark.parametrize('value', ['abc', '', 'nan', float('inf'), MAX_CENTS])
+def test_to_cents_rejects_invalid_amounts(value):
+    with pytest.raises(ValueError):
+        to_cents(value)
+
+def test_format_money():
+    assert format_money(123456) == '$1,234.56'
+    assert format_money(-5) == '-$0.05'
+    assert format_money(0) == '$0.00'
+    assert format_money(MAX_CENTS) == '$92,233,720,368,547,758.07'
+
+def test_to_units():
+    assert to_units(1999) == 19.99
+    assert to_units(None) is None
+
+def test_cents_array_rounds_to_the_nearest_cent():
+    assert cents_array([0.29, 1.1, -2.5, 3]).tolist() == [29, 110, -250, 300]
+
+def test_arrow_decimal_round_trip():
+    cents = [0, 1, -1, 123456, MAX_CENTS]
+
+    amounts = to_arrow_decimal(cents)
+
+    assert amounts.to_pylist()[:4] == [Decimal('0.00'), Decimal('0.01'), Decimal('-0.01'), Decimal('1234.56')]
+    assert cents_from_arrow(amounts).to_pylist() == cents
@@ -0,0 +1,100 @@
+import smtplib
+from datetime import datetime
+
+import pytest
+
+import report_dispatch
+from database import cursor
+from email_service import SMTPConnectionPool
+from report_dispatch import dispatch_reports, report_period, save_subscription
+
+SETTINGS = {
+    'host': 'localhost', 'port': 25, 'starttls': False, 'username': None, 'password': None,
+    'from_addr': 'reports@example.com', 'timeout': 5,
+}
+
+class FakeSMTP:
+    """Records messages; fail_next makes the next send raise"""
+    sessions = []
+    fail_next = []
+
+    def __init__(self, host, port, timeout=None):
+        self.sent = []
+        self.closed = False
+        FakeSMTP.sessions.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def send_message(self, msg):
+        if FakeSMTP.fail_next:
+            raise FakeSMTP.fail_next.pop(0)
+        self.sent.append(msg)
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def smtp(monkeypatch):
+    FakeSMTP.sessions = []
+    FakeSMTP.fail_next = []
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
+    return FakeSMTP
+
+def _message(to):
+    return {'To': to}
+
+def test_report_period():
+    assert report_period('Monthly', datetime(2026, 3, 15, 8, 30)) == (datetime(2026, 2, 1), datetime(2026, 3, 1))
+    assert report_period('Monthly', datetime(2026, 1, 1)) == (datetime(2025, 12, 1), datetime(2026, 1, 1))
+    # 2026-03-18 is a Wednesday; the last closed week ran Monday 9th to Monday 16th
+    assert report_period('Weekly', datetime(2026, 3, 18)) == (datetime(2026, 3, 9), datetime(2026, 3, 16))
+
+def test_pool_reuses_sessions_and_reconnects(smtp):
+    pool = SMTPConnectionPool(SETTINGS, size=1, max_messages=2)
+    for i in range(3):
+        pool.send(_message(f"user{i}@example.com"))
+    assert [len(session.sent) for session in smtp.sessions] == [2, 1]
+    assert smtp.sessions[0].closed
+
+    # A failed send drops the session; the next message opens a new one
+    smtp.fail_next.append(smtplib.SMTPServerDisconnected("gone"))
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        pool.send(_message("user3@example.com"))
+    pool.send(_message("user4@example.com"))
+    assert len(smtp.sessions) == 3
+    pool.close_all()
+    assert all(session.closed for session in smtp.sessions)
+
+def test_dispatch_sends_each_due_report_once(make_user, smtp, monkeypatch):
+    monkeypatch.setattr(report_dispatch.time, 'sleep', lambda seconds: None)
+    first, second = make_user(), make_user()
+    with cursor(first) as cur:
+        cur.execute("""
+            INSERT INTO transactions (user_id, amount_cents, category, description, date) VALUES
+                (%(user)s, 1250, 'Food', 'lunch', '2026-01-10'),
+                (%(user)s, 4000, NULL, 'cash', '2026-01-20'),
+                (%(user)s, 9999, 'Food', 'next month', '2026-02-02')
+        """, {'user': first})
+    save_subscription(first, 'first@example.com', 'Monthly')
+    save_subscription(second, 'second@example.com', 'Monthly')
+    # One transient failure is retried on the same pool
+    smtp.fail_next.append(smtplib.SMTPResponseException(421, b"try again"))
+
+    now = datetime(2026, 2, 10)
+    result = dispatch_reports('Monthly', now=now, smtp_connections=1, rate=0, settings=SETTINGS)
+
+    assert result == {'sent': 2, 'failed': 0}
+    messages = {msg['To']: msg.get_payload()[0].get_payload() for session in smtp.sessions for msg in session.sent}
+    assert set(messages) == {'first@example.com', 'second@example.com'}
+    assert 'Total Spent: $52.50' in messages['first@example.com']
+    assert 'Uncategorized' in messages['first@example.com']
+    assert 'No spending recorded' in messages['second@example.com']
+
+    assert dispatch_reports('Monthly', now=now, rate=0, settings=SETTINGS) == {'sent': 0, 'failed': 0}
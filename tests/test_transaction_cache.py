@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import database
+from database import connection, cursor
+from transaction_cache import TransactionCache
+
+def _insert(cur, user_id, amount_cents, description, date, category='Food'):
+    cur.execute("""
+        INSERT INTO transactions (user_id, amount_cents, category, description, date)
+        VALUES (%s, %s, %s, %s, %s) RETURNING id
+    """, (user_id, amount_cents, category, description, date))
+    return cur.fetchone()[0]
+
+def _add(user_id, amount_cents, description, date, category='Food'):
+    with cursor(user_id) as cur:
+        return _insert(cur, user_id, amount_cents, description, date, category)
+
+def _descriptions(columns):
+    return [row['description'] for row in columns]
+
+def test_delta_refresh_applies_inserts_updates_and_deletes(user_id):
+    first = _add(user_id, 100, 'first', datetime(2026, 1, 1))
+    second = _add(user_id, 200, 'second', datetime(2026, 1, 2))
+    cache = TransactionCache(connection, check_interval=0)
+    assert _descriptions(cache.get(user_id)) == ['second', 'first']
+
+    _add(user_id, 300, 'third', datetime(2026, 1, 3))
+    with cursor(user_id) as cur:
+        cur.execute("UPDATE transactions SET amount_cents = 150 WHERE id = %s", (first,))
+        cur.execute("DELETE FROM transactions WHERE id = %s", (second,))
+
+    columns = cache.get(user_id)
+    assert _descriptions(columns) == ['third', 'first']
+    assert columns.amount_cents.tolist() == [300, 150]
+    stats = cache.stats()
+    assert (stats['full_loads'], stats['delta_refreshes']) == (1, 1)
+
+def test_version_changes_only_with_the_data(user_id):
+    _add(user_id, 100, 'first', datetime(2026, 1, 1))
+    cache = TransactionCache(connection, check_interval=0)
+    version = cache.version(user_id)
+    cache.get(user_id)
+    assert cache.version(user_id) == version
+
+    _add(user_id, 200, 'second', datetime(2026, 1, 2))
+    assert cache.version(user_id) != version
+
+def test_late_commit_of_a_lower_id_is_picked_up(user_id):
+    cache = TransactionCache(connection, check_interval=0)
+    assert len(cache.get(user_id)) == 0
+
+    slow = database.get_db_connection()
+    try:
+        with slow.cursor() as cur:
+            # Takes the lower change-log id but commits after the higher one has been read
+            _insert(cur, user_id, 100, 'slow', datetime(2026, 1, 1))
+        # Another category, so it does not wait on the slow writer's budget counter row
+        _add(user_id, 200, 'fast', datetime(2026, 1, 2), 'Bills')
+        assert _descriptions(cache.get(user_id)) == ['fast']
+        slow.commit()
+    finally:
+        slow.close()
+
+    assert _descriptions(cache.get(user_id)) == ['fast', 'slow']
+
+def test_histories_over_the_row_budget_are_served_uncached(user_id):
+    for day in range(1, 4):
+        _add(user_id, day, f"day {day}", datetime(2026, 1, day))
+    cache = TransactionCache(connection, max_rows=2, check_interval=0)
+
+    assert len(cache.get(user_id)) == 3
+    version = cache.version(user_id)
+    assert cache.stats()['rows'] == 0
+    assert len(cache.get(user_id)) == 3
+    assert cache.version(user_id) == version
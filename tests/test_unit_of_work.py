@@ -0,0 +1,90 @@
+import psycopg2
+import pytest
+
+from database import cursor
+from unit_of_work import UnitOfWork, unit_of_work
+
+COLUMNS = ('user_id', 'amount_cents', 'category', 'description')
+
+def _transactions(user_id):
+    with cursor(user_id) as cur:
+        cur.execute("""
+            SELECT amount_cents, category, description FROM transactions
+            WHERE user_id = %s ORDER BY id
+        """, (user_id,))
+        return cur.fetchall()
+
+def test_consecutive_writes_share_a_statement(user_id):
+    uow = UnitOfWork(user_id)
+    uow.insert('transactions', COLUMNS, [(user_id, 100, 'Food', 'a')])
+    uow.insert('transactions', COLUMNS, [(user_id, 200, 'Food', 'b'), (user_id, 300, 'Food', 'c')])
+    uow.execute("UPDATE transactions SET category = %s WHERE user_id = %s AND amount_cents = %s", ('Bills', user_id, 200))
+    uow.execute("UPDATE transactions SET category = %s WHERE user_id = %s AND amount_cents = %s", ('Bills', user_id, 300))
+    uow.insert('transactions', COLUMNS, [(user_id, 400, 'Food', 'd')])
+
+    # Nothing is sent before the commit
+    assert _transactions(user_id) == []
+    assert uow.commit() == 3
+    assert uow.statements == 3
+    assert _transactions(user_id) == [
+        (100, 'Food', 'a'), (200, 'Bills', 'b'), (300, 'Bills', 'c'), (400, 'Food', 'd'),
+    ]
+
+def test_statements_are_paged(user_id):
+    with UnitOfWork(user_id, page_size=2) as uow:
+        uow.insert('transactions', COLUMNS, [(user_id, amount, 'Food', 'x') for amount in range(5)])
+    assert uow.statements == 3
+    assert len(_transactions(user_id)) == 5
+
+def test_returning_rows_arrive_after_commit(user_id):
+    with UnitOfWork(user_id) as uow:
+        first = uow.insert('transactions', COLUMNS, [(user_id, 100, 'Food', 'a')], returning='id')
+        rest = uow.insert('transactions', COLUMNS, [(user_id, 200, 'Food', 'b'), (user_id, 300, 'Food', 'c')],
+                          returning='id, amount_cents')
+        with pytest.raises(RuntimeError):
+            first.id
+
+    assert [amount for _, amount in rest.rows] == [200, 300]
+    assert first.id < rest.ids[0] < rest.ids[1]
+
+def test_upserts_keep_the_last_queued_row(user_id):
+    columns = ('user_id', 'category', 'amount_cents', 'period')
+    with UnitOfWork(user_id) as uow:
+        uow.insert('budgets', columns, [(user_id, 'Food', 100, 'Monthly')],
+                   conflict=('user_id', 'category', 'period'), update=['amount_cents'])
+        uow.insert('budgets', columns, [(user_id, 'Food', 250, 'Monthly')],
+                   conflict=('user_id', 'category', 'period'), update=['amount_cents'])
+    assert uow.statements == 1
+    with cursor(user_id) as cur:
+        cur.execute("SELECT amount_cents FROM budgets WHERE user_id = %s", (user_id,))
+        assert cur.fetchall() == [(250,)]
+
+def test_failed_statement_writes_nothing(user_id):
+    called = []
+    with pytest.raises(psycopg2.Error):
+        with UnitOfWork(user_id) as uow:
+            uow.insert('transactions', COLUMNS, [(user_id, 100, 'Food', 'a')])
+            uow.execute("UPDATE transactions SET amount_cents = 1 / 0 WHERE user_id = %s", (user_id,))
+            uow.after_commit(called.append, user_id)
+    assert _transactions(user_id) == []
+    assert called == []
+
+def test_exception_in_the_block_discards_the_writes(user_id):
+    with pytest.raises(KeyError):
+        with UnitOfWork(user_id) as uow:
+            uow.insert('transactions', COLUMNS, [(user_id, 100, 'Food', 'a')])
+            raise KeyError('abandoned')
+    assert _transactions(user_id) == []
+
+def test_after_commit_callbacks_run_once(user_id):
+    called = []
+    with unit_of_work(user_id) as outer:
+        with unit_of_work(user_id, outer) as inner:
+            assert inner is outer
+            inner.insert('transactions', COLUMNS, [(user_id, 100, 'Food', 'a')])
+            inner.after_commit(called.append, user_id)
+        outer.after_commit(called.append, user_id)
+        # The caller's unit of work commits only when its own block exits
+        assert _transactions(user_id) == []
+    assert called == [user_id]
+    assert _transactions(user_id) == [(100, 'Food', 'a')]
@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from visualization import MAX_TREND_BUCKETS, choose_trend_grain, create_trend_figure, lttb
+
+def test_choose_trend_grain():
+    start = datetime(2026, 1, 1)
+    assert choose_trend_grain(start, start) == 'day'
+    assert choose_trend_grain(start, start + timedelta(days=MAX_TREND_BUCKETS)) == 'day'
+    assert choose_trend_grain(start, start + timedelta(days=MAX_TREND_BUCKETS + 1)) == 'week'
+    assert choose_trend_grain(start, start + timedelta(days=7 * MAX_TREND_BUCKETS + 7)) == 'month'
+
+def test_lttb_keeps_everything_under_the_threshold():
+    assert lttb([0, 1, 2], [5, 6, 7], 3).tolist() == [0, 1, 2]
+    assert lttb(range(10), range(10), 2).tolist() == list(range(10))
+
+def test_lttb_keeps_endpoints_and_extremes():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[137], y[612] = 50.0, -80.0
+
+    keep = lttb(x, y, 20)
+
+    assert len(keep) == 20
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert 137 in keep and 612 in keep
+
+def test_trend_figure_is_downsampled_to_the_point_budget():
+    buckets = [datetime(2020, 1, 1) + timedelta(days=i) for i in range(1500)]
+    totals = [i % 97 * 100 for i in range(1500)]
+
+    fig = create_trend_figure(buckets, totals, 'day', point_budget=400)
+
+    assert len(fig.data[0].x) == 400
+    assert max(fig.data[0].y) == 96.0
+    assert fig.layout.title.text == 'Daily Spending Trend'
+    assert len(create_trend_figure([], [], 'day').data) == 0
@@ -0,0 +1,209 @@
+import time
+import itertools
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# How long the change log is kept; cache entries not synced within this window reload in full
+CHANGE_LOG_RETENTION = timedelta(days=7)
+
+# One statement, so the counts and max(id) are read in the snapshot whose xmin is returned.
+# Every change-log entry that snapshot cannot see has an xid at or above that xmin, so it is
+# the watermark a later check starts from (migration 0014); ids follow insert order, not commit
+# order, and cannot serve as one.
+CHECK_CHANGES = """
+    SELECT w.xmin::text,
+           (SELECT count(*) FROM transaction_changes WHERE user_id = %(user_id)s AND xid >= w.xmin),
+           (SELECT count(*) FROM transaction_changes WHERE user_id = %(user_id)s AND xid >= %(horizon)s::text::xid8),
+           (SELECT COALESCE(max(id), 0) FROM transaction_changes WHERE user_id = %(user_id)s),
+           EXISTS (SELECT 1 FROM transaction_changes
+                   WHERE user_id = %(user_id)s AND operation = 'M' AND id > %(max_id)s)
+    FROM (SELECT pg_snapshot_xmin(pg_current_snapshot()) AS xmin) w
+"""
+
+class _UserEntry:
+    def __init__(self, version, horizon, seen, max_id, columns):
+        self.version = version
+        # Watermark (snapshot xmin) of the read the entry reflects, the change-log entries at or
+        # above it that read saw, and its newest change-log id
+        self.horizon = horizon
+        self.seen = seen
+        self.max_id = max_id
+        self.columns = columns  # columnar.TransactionColumns, newest first; None for histories served uncached
+        # When the entry was last checked against the log; changes after it are still there
+        self.synced_at = datetime.now()
+        self.checked_at = time.monotonic()
+        self.dirty = False
+
+class TransactionCache:
+    """Per-user transaction cache kept current from the transaction change log.
+
+    A read past check_interval (or after invalidate()) looks for change-log
+    entries committed since the cached read, by transaction id watermark,
+    and applies only the rows they name. Writes made through this process
+    call invalidate() so the next read refreshes immediately; writes from
+    other processes are picked up within check_interval seconds. Entries are
+    evicted least recently used first once max_users or max_rows is
+    exceeded.
+
+    version() identifies the cached data: a number from this process that
+    changes whenever a user's rows do, for keying derived results.
+
+    Each entry is a columnar.TransactionColumns; NumPy is imported on first
+    use so processes that never read transactions (the landing page) do not
+    pay for it.
+    """
+
+    def __init__(self, connection, max_users=256, max_rows=500000, check_interval=5.0):
+        self._connection = connection
+        self.max_users = max_users
+        self.max_rows = max_rows
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_rows = 0
+        self._listeners = []
+        self._versions = itertools.count(1)
+        self._stats = {'hits': 0, 'delta_refreshes': 0, 'full_loads': 0, 'evictions': 0}
+
+    def add_listener(self, callback):
+        """Register callback(user_id), called whenever a user's transactions are invalidated"""
+        self._listeners.append(callback)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry.dirty = True
+        for callback in self._listeners:
+            try:
+                callback(user_id)
+            except Exception as e:
+                logger.error(f"Transaction cache listener failed: {str(e)}")
+
+    def get(self, user_id):
+        """All of the user's transactions as TransactionColumns, newest first; the arrays must not be mutated"""
+        return self._refresh(user_id, load=True).columns
+
+    def version(self, user_id):
+        """Identifies the user's data as get() returns it; checked against the log like get()"""
+        return self._refresh(user_id, load=False).version
+
+    def _refresh(self, user_id, load):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                if (not entry.dirty and time.monotonic() - entry.checked_at < self.check_interval
+                        and (entry.columns is not None or not load)):
+                    self._stats['hits'] += 1
+                    return entry
+
+        with self._connection(user_id) as conn:
+            with conn.cursor() as cur:
+                cur.execute(CHECK_CHANGES, {
+                    'user_id': user_id,
+                    'horizon': entry.horizon if entry is not None else '0',
+                    'max_id': entry.max_id if entry is not None else 0,
+                })
+                horizon, seen, unseen, max_id, moved = cur.fetchone()
+                # Nothing committed since the entry was read; its watermark can move up
+                unchanged = entry is not None and not moved and unseen == entry.seen
+
+                if unchanged and (entry.columns is not None or not load):
+                    entry.horizon, entry.seen, entry.max_id = horizon, seen, max_id
+                    entry.checked_at = time.monotonic()
+                    entry.synced_at = datetime.now()
+                    entry.dirty = False
+                    with self._lock:
+                        self._stats['hits'] += 1
+                    return entry
+
+                # A full load when the user moved shards (sharding.move_user): the target's log does not continue ours
+                if (entry is not None and entry.columns is not None and not moved
+                        and datetime.now() - entry.synced_at < CHANGE_LOG_RETENTION - timedelta(days=1)):
+                    refreshed = self._apply_delta(cur, user_id, entry)
+                else:
+                    refreshed = self._load(cur, user_id)
+                # Rows read after the check reflect at least what it saw
+                refreshed.horizon, refreshed.seen, refreshed.max_id = horizon, seen, max_id
+                refreshed.version = entry.version if unchanged else next(self._versions)
+
+        self._store(user_id, refreshed)
+        return refreshed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['users'] = len(self._entries)
+            stats['rows'] = self._total_rows
+            stats['bytes'] = sum(entry.columns.nbytes for entry in self._entries.values() if entry.columns is not None)
+        return stats
+
+    def _load(self, cur, user_id):
+        from columnar import SELECT_COLUMNS, TransactionColumns
+
+        cur.execute(f"SELECT {SELECT_COLUMNS} FROM transactions WHERE user_id = %s", (user_id,))
+        columns = TransactionColumns.from_cursor(cur).newest_first()
+        with self._lock:
+            self._stats['full_loads'] += 1
+        return _UserEntry(None, None, None, None, columns)
+
+    def _apply_delta(self, cur, user_id, entry):
+        # Entries the cached read may have missed, plus some it saw; re-reading those is harmless
+        cur.execute("""
+            SELECT DISTINCT transaction_id FROM transaction_changes
+            WHERE user_id = %s AND xid >= %s::text::xid8
+        """, (user_id, entry.horizon))
+        changed_ids = [row[0] for row in cur.fetchall()]
+
+        columns = entry.columns
+        if changed_ids:
+            from columnar import SELECT_COLUMNS, TransactionColumns
+
+            cur.execute(
+                f"SELECT {SELECT_COLUMNS} FROM transactions WHERE user_id = %s AND id = ANY(%s)",
+                (user_id, changed_ids)
+            )
+            # Changed rows are dropped and the current version of those still present appended
+            found = TransactionColumns.from_rows(cur.fetchall())
+            columns = TransactionColumns.concat([columns.without_ids(changed_ids), found]).newest_first()
+
+        refreshed = _UserEntry(None, None, None, None, columns)
+        with self._lock:
+            self._stats['delta_refreshes'] += 1
+        return refreshed
+
+    def _store(self, user_id, entry):
+        with self._lock:
+            previous = self._entries.pop(user_id, None)
+            if previous is not None and previous.columns is not None:
+                self._total_rows -= len(previous.columns)
+            if len(entry.columns) > self.max_rows:
+                # A single history larger than the whole budget is served uncached; its version is kept
+                entry = _UserEntry(entry.version, entry.horizon, entry.seen, entry.max_id, None)
+            else:
+                self._total_rows += len(entry.columns)
+            self._entries[user_id] = entry
+            while len(self._entries) > self.max_users or self._total_rows > self.max_rows:
+                _, evicted = self._entries.popitem(last=False)
+                if evicted.columns is not None:
+                    self._total_rows -= len(evicted.columns)
+                self._stats['evictions'] += 1
+
+def prune_change_log(conn, retention=CHANGE_LOG_RETENTION):
+    """Delete change-log entries older than retention"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "DELETE FROM transaction_changes WHERE changed_at < %s",
+            (datetime.now() - retention,)
+        )
+        deleted = cur.rowcount
+    conn.commit()
+    if deleted:
+        logger.info(f"Pruned {deleted} transaction change log entries")
+    return deleted
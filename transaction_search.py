@@ -0,0 +1,71 @@
+"""Search over transaction descriptions.
+
+Full-text matching uses the generated description_search tsvector and its
+GIN index (migration 0010); every word of the search text is matched as a
+prefix, so "amaz ord" finds "Amazon order". Where pg_trgm is installed,
+descriptions containing a word similar to the search text ("amzon") match
+too, through the trigram GIN index.
+
+Results are ranked in tiers rather than by a per-row score: word matches
+(rank 2) come before similar spellings (rank 1), newest first within a
+tier. Merchant descriptions are short and repetitive, so a per-row score
+ties for almost every row yet would force reading every match (tens of
+thousands for a common merchant) before the first page could be returned;
+a tier is a plain condition, so a page is read newest first and stops at
+the page size (see components.transactions._search_tier).
+"""
+import re
+import threading
+import logging
+from database import cursor
+
+logger = logging.getLogger(__name__)
+
+MAX_SEARCH_TERMS = 8
+WORD_PATTERN = re.compile(r'\w+')
+WORD_MATCH_RANK = 2
+SIMILAR_RANK = 1
+WORD_MATCH = "description_search @@ to_tsquery('simple', %s)"
+# A word of the description is similar to the search text (pg_trgm.word_similarity_threshold)
+SIMILAR = "%s <%% description"
+
+_trigram_available = None
+_trigram_lock = threading.Lock()
+
+def prefix_query(text):
+    """A to_tsquery('simple', ...) string matching every word of text as a prefix, or None"""
+    words = WORD_PATTERN.findall((text or '').lower())[:MAX_SEARCH_TERMS]
+    if not words:
+        return None
+    return ' & '.join(f"'{word}':*" for word in words)
+
+def trigram_available():
+    """Whether pg_trgm is installed; checked once per process"""
+    global _trigram_available
+    with _trigram_lock:
+        if _trigram_available is None:
+            with cursor() as cur:
+                cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+                _trigram_available = cur.fetchone()[0]
+            if not _trigram_available:
+                logger.info("pg_trgm is not installed; transaction search matches words only")
+        return _trigram_available
+
+def search_tiers(text):
+    """[(rank, condition, params)] best tier first; the conditions are disjoint. Empty for no search."""
+    query = prefix_query(text)
+    if query is None:
+        return []
+    tiers = [(WORD_MATCH_RANK, WORD_MATCH, [query])]
+    if trigram_available():
+        tiers.append((SIMILAR_RANK, f"{SIMILAR} AND NOT {WORD_MATCH}", [text.strip(), query]))
+    return tiers
+
+def search_condition(text):
+    """(condition, params) matching any tier, or None for no search"""
+    query = prefix_query(text)
+    if query is None:
+        return None
+    if not trigram_available():
+        return WORD_MATCH, [query]
+    return f"({WORD_MATCH} OR {SIMILAR})", [query, text.strip()]
@@ -0,0 +1,195 @@
+"""Unit of work: a user's writes collected and sent as a few batched statements in one transaction.
+
+    with UnitOfWork(user_id, "onboarding") as uow:
+        uow.insert('users', ('id', 'email'), [(user_id, email)], conflict=('id',))
+        created = uow.insert('transactions', ('user_id', 'amount_cents', 'category'), rows, returning='id')
+        uow.execute("DELETE FROM budgets WHERE user_id = %s AND category = %s", (user_id, category))
+        uow.after_commit(invalidate_transactions, user_id)
+    created.ids  # once the block has exited
+
+Nothing is sent until the block exits. Consecutive inserts into a table with
+the same columns become one multi-row INSERT (execute_values), and a run of
+the same statement is sent with execute_batch, so round trips grow with the
+number of distinct statements rather than with rows. Everything commits in
+one transaction on the user's shard; when a statement fails nothing is
+written and the after_commit callbacks do not run.
+
+Data access functions that write take uow=None and use unit_of_work(): they
+queue onto the caller's unit of work, or commit their own when called alone.
+"""
+import time
+from contextlib import contextmanager
+from psycopg2.extras import execute_batch, execute_values
+from database import connection
+from metrics import REGISTRY, LATENCY_BUCKETS, STATEMENT_BUCKETS
+
+# Rows per INSERT statement and statements per execute_batch round trip
+PAGE_SIZE = 1000
+
+class Pending:
+    """Rows returned by a queued insert, available once the unit of work has committed"""
+    __slots__ = ('_rows',)
+
+    def __init__(self):
+        self._rows = None
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            raise RuntimeError("The unit of work has not been committed")
+        return self._rows
+
+    @property
+    def ids(self):
+        return [row[0] for row in self.rows]
+
+    @property
+    def id(self):
+        return self.rows[0][0]
+
+class _Insert:
+    __slots__ = ('sql', 'template', 'key', 'rows', 'results')
+
+    def __init__(self, sql, template, key):
+        self.sql = sql
+        self.template = template
+        self.key = key  # positions of the conflict columns for upserts, else None
+        self.rows = []
+        self.results = []  # [(Pending, row count)] in queue order
+
+    def send(self, cur, page_size):
+        rows = self.rows
+        if self.key is not None:
+            # One statement cannot upsert a row twice; the row queued last wins
+            latest = {tuple(row[i] for i in self.key): row for row in rows}
+            rows = list(latest.values())
+        if not rows:
+            return 0
+        returned = execute_values(cur, self.sql, rows, template=self.template, page_size=page_size,
+                                  fetch=bool(self.results))
+        offset = 0
+        for pending, count in self.results:
+            pending._rows = returned[offset:offset + count]
+            offset += count
+        return -(-len(rows) // page_size)
+
+class _Statement:
+    __slots__ = ('sql', 'params')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.params = []
+
+    def send(self, cur, page_size):
+        if len(self.params) == 1:
+            cur.execute(self.sql, self.params[0])
+            return 1
+        execute_batch(cur, self.sql, self.params, page_size=page_size)
+        return -(-len(self.params) // page_size)
+
+class UnitOfWork:
+    """Collects one user's writes; they are sent and committed when the with block exits cleanly"""
+
+    def __init__(self, user_id, name="unit_of_work", page_size=PAGE_SIZE):
+        self.user_id = user_id
+        self.name = name
+        self.page_size = page_size
+        # Round trips the last commit took, for logs and benchmarks
+        self.statements = 0
+        self._operations = []
+        self._callbacks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.discard()
+        return False
+
+    def insert(self, table, columns, rows, conflict=None, update=None, returning=None, template=None):
+        """Queue rows for a multi-row INSERT.
+
+        conflict names the unique columns for ON CONFLICT: DO NOTHING, or
+        DO UPDATE with update, a list of columns taken from EXCLUDED or a
+        {column: SQL expression} dict. returning (plain inserts only) makes
+        this return a Pending holding the returned rows in queue order.
+        """
+        if returning and conflict:
+            raise ValueError("returning is only supported for plain inserts")
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s"
+        key = None
+        if conflict:
+            sql += f" ON CONFLICT ({', '.join(conflict)})"
+            if update:
+                assignments = update.items() if isinstance(update, dict) else ((c, f"EXCLUDED.{c}") for c in update)
+                sql += " DO UPDATE SET " + ', '.join(f"{column} = {value}" for column, value in assignments)
+                key = tuple(columns.index(column) for column in conflict)
+            else:
+                sql += " DO NOTHING"
+        if returning:
+            sql += f" RETURNING {returning}"
+
+        last = self._operations[-1] if self._operations else None
+        if isinstance(last, _Insert) and last.sql == sql and last.template == template:
+            operation = last
+        else:
+            operation = _Insert(sql, template, key)
+            self._operations.append(operation)
+        rows = [tuple(row) for row in rows]
+        operation.rows.extend(rows)
+        if returning:
+            pending = Pending()
+            operation.results.append((pending, len(rows)))
+            return pending
+        return None
+
+    def execute(self, sql, params=None):
+        """Queue a statement; a run of the same statement is sent with execute_batch"""
+        last = self._operations[-1] if self._operations else None
+        if isinstance(last, _Statement) and last.sql == sql:
+            operation = last
+        else:
+            operation = _Statement(sql)
+            self._operations.append(operation)
+        operation.params.append(params)
+
+    def after_commit(self, callback, *args):
+        """Call callback(*args) once after the commit, e.g. a cache invalidation; repeats are dropped"""
+        if (callback, args) not in self._callbacks:
+            self._callbacks.append((callback, args))
+
+    def commit(self):
+        """Send the queued writes in one transaction and run the after_commit callbacks; returns round trips"""
+        operations, self._operations = self._operations, []
+        callbacks, self._callbacks = self._callbacks, []
+        statements = 0
+        if operations:
+            start = time.perf_counter()
+            with connection(self.user_id) as conn:
+                with conn.cursor() as cur:
+                    for operation in operations:
+                        statements += operation.send(cur, self.page_size)
+            REGISTRY.histogram('db_query_duration_seconds', "Data access function latency",
+                               LATENCY_BUCKETS, query=self.name).observe(time.perf_counter() - start)
+            REGISTRY.histogram('db_unit_of_work_statements', "Statements sent per unit of work commit",
+                               STATEMENT_BUCKETS, query=self.name).observe(statements)
+        self.statements = statements
+        for callback, args in callbacks:
+            callback(*args)
+        return statements
+
+    def discard(self):
+        self._operations.clear()
+        self._callbacks.clear()
+
+@contextmanager
+def unit_of_work(user_id, uow=None, name="unit_of_work"):
+    """The caller's uow (committed by them), or a new UnitOfWork committed when the block exits"""
+    if uow is not None:
+        yield uow
+        return
+    with UnitOfWork(user_id, name) as own:
+        yield own
@@ -1,36 +1,101 @@
+import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
+from columnar import as_frame
+from money import CENTS_PER_UNIT
 
-def create_spending_trend(transactions_data):
+# Points sent to the browser for the trend chart, whatever the visible range
+TREND_POINT_BUDGET = 400
+# Finest bucket whose count stays under this is used before downsampling
+MAX_TREND_BUCKETS = 3 * TREND_POINT_BUDGET
+TREND_GRAINS = (('day', 1), ('week', 7), ('month', 30))
+TREND_TITLES = {'day': 'Daily Spending Trend', 'week': 'Weekly Spending Trend', 'month': 'Monthly Spending Trend'}
+
+def choose_trend_grain(start, end, max_buckets=MAX_TREND_BUCKETS):
+    """Finest of day/week/month that keeps the visible range under max_buckets buckets"""
+    days = max((end - start).days, 1)
+    for grain, days_per_bucket in TREND_GRAINS:
+        if days / days_per_bucket <= max_buckets:
+            return grain
+    return TREND_GRAINS[-1][0]
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets downsampling; returns the indices of the points kept.
+
+    The first and last points are always kept. The points between them are
+    split into threshold - 2 buckets, and from each bucket the point forming
+    the largest triangle with the previously kept point and the average of the
+    next bucket is kept, which preserves peaks and troughs.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(areas.argmax())
+        selected[i + 1] = a
+    return selected
+
+def create_trend_figure(buckets, totals_cents, grain, point_budget=TREND_POINT_BUDGET):
+    """Line chart of per-bucket totals (int cents), downsampled with LTTB to at most point_budget points"""
+    if len(buckets) == 0:
+        return go.Figure()
+    buckets = pd.to_datetime(pd.Series(buckets)).to_numpy()
+    amounts = np.asarray(totals_cents, dtype=float) / CENTS_PER_UNIT
+    keep = lttb(buckets.astype('datetime64[s]').astype(np.int64), amounts, point_budget)
+
+    fig = go.Figure(go.Scatter(x=buckets[keep], y=amounts[keep], mode='lines', name='Spending'))
+    fig.update_layout(title=TREND_TITLES[grain], xaxis_title='date', yaxis_title='amount')
+    return fig
+
+def create_spending_trend(transactions_data, point_budget=TREND_POINT_BUDGET):
     if not transactions_data:
         # Return empty figure if no data
         return go.Figure()
     
-    df = pd.DataFrame(transactions_data)
+    df = as_frame(transactions_data)
     # Ensure date column exists and is datetime
     if 'date' in df.columns:
         df['date'] = pd.to_datetime(df['date'])
     else:
         return go.Figure()
-    
-    fig = px.line(
-        df.groupby(df['date'].dt.date)['amount'].sum().reset_index(),
-        x='date',
-        y='amount',
-        title='Daily Spending Trend'
-    )
-    return fig
+    df = df.dropna(subset=['date'])
+    if df.empty:
+        return go.Figure()
+
+    grain = choose_trend_grain(df['date'].min(), df['date'].max())
+    if grain == 'day':
+        buckets = df['date'].dt.floor('D')
+    else:
+        buckets = df['date'].dt.to_period('W' if grain == 'week' else 'M').dt.start_time
+    totals = df['amount_cents'].groupby(buckets).sum()
+    return create_trend_figure(totals.index, totals.to_numpy(), grain, point_budget)
 
 def create_category_breakdown(transactions_data):
     if not transactions_data:
         return go.Figure()
     
-    df = pd.DataFrame(transactions_data)
-    if 'category' not in df.columns or 'amount' not in df.columns:
+    df = as_frame(transactions_data)
+    if 'category' not in df.columns or 'amount_cents' not in df.columns:
         return go.Figure()
     
-    category_sums = df.groupby('category')['amount'].sum().reset_index()
+    category_sums = df.groupby('category', observed=True)['amount_cents'].sum().reset_index()
+    category_sums['amount'] = category_sums['amount_cents'] / CENTS_PER_UNIT
     
     fig = px.pie(
         category_sums,
@@ -40,25 +105,34 @@ def create_category_breakdown(transactions_data):
     )
     return fig
 
-def create_budget_progress(budget_data, actual_spending):
-    if budget_data.empty or actual_spending.empty:
+def create_budget_progress(statuses):
+    """Budget, spend so far and projected spend for each budget's current period (budget_engine.BudgetStatus)"""
+    if not statuses:
         return go.Figure()
-        
+
+    labels = [f"{status.category} ({status.period})" for status in statuses]
     fig = go.Figure(data=[
         go.Bar(
             name='Budget',
-            x=budget_data['category'],
-            y=budget_data['amount']
+            x=labels,
+            y=[status.budget_cents / CENTS_PER_UNIT for status in statuses]
+        ),
+        go.Bar(
+            name='Spent',
+            x=labels,
+            y=[status.spent_cents / CENTS_PER_UNIT for status in statuses]
         ),
         go.Bar(
-            name='Actual',
-            x=actual_spending['category'],
-            y=actual_spending['amount']
+            name='Projected',
+            x=labels,
+            y=[status.projected_cents / CENTS_PER_UNIT for status in statuses],
+            marker_pattern_shape='/',
+            opacity=0.6
         )
     ])
     
     fig.update_layout(
-        title='Budget vs. Actual Spending',
+        title='Budget vs. Actual Spending This Period',
         barmode='group'
     )
     return fig